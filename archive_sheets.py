@@ -0,0 +1,199 @@
+# archive_sheets.py
+# Archival and compaction for the Chats and GoalHistory sheets.
+#
+# Rows older than a cutoff (and, past that, the oldest rows over a per-sheet row budget) are
+# moved out of the live sheets into gzipped JSON-lines files under archive/<shard>/. Each chat
+# session's full-log row and its sparse feedback row share StudentID + Timestamp, so they are
+# merged into one compact record with empty fields dropped. archive/index.json maps each
+# StudentID to the files holding their records, so old records can still be fetched.
+#
+#   python archive_sheets.py --cutoff-days 60 --row-budget 5000 --dry-run
+#   python archive_sheets.py --fetch 300
+
+import argparse
+import gzip
+import json
+import os
+from datetime import date, datetime, timedelta
+
+from background_summary import shift_high_water_mark
+from google_sheets import delete_rows_batch, get_sheet, shard_names
+from records import CHAT_LOG_COLUMNS, id_forms, normalize_id
+
+ARCHIVE_DIR = "archive"
+INDEX_PATH = os.path.join(ARCHIVE_DIR, "index.json")
+
+# Sheet -> column holding the date used for the cutoff
+DATE_COLUMNS = {
+    "Chats": "Timestamp",
+    "GoalHistory": "GoalSetDate",
+}
+
+
+# --- Reading a live sheet ---
+# Returns (headers, [(row_number, record), ...]) in sheet order.
+def read_rows(sheet):
+    values = sheet.get_all_values()
+    if not values:
+        return [], []
+    headers = values[0] if sheet.title != "Chats" else CHAT_LOG_COLUMNS
+    rows = []
+    for offset, row in enumerate(values[1:], start=2):
+        rows.append((offset, {h: (row[i] if i < len(row) else "") for i, h in enumerate(headers)}))
+    return headers, rows
+
+
+def _row_date(record, sheet_name):
+    raw = str(record.get(DATE_COLUMNS[sheet_name], "")).strip()
+    try:
+        return datetime.fromisoformat(raw[:19]).date() if "T" in raw else date.fromisoformat(raw[:10])
+    except ValueError:
+        return None  # undated rows are only archived through the row budget
+
+
+def _session_key(record):
+    return (normalize_id(record.get("StudentID", "")), str(record.get("Timestamp", "")).strip())
+
+
+# --- Which rows leave the live sheet ---
+def plan_archive(rows, sheet_name, cutoff, row_budget):
+    archived = {row_num for row_num, record in rows
+                if (d := _row_date(record, sheet_name)) is not None and d < cutoff}
+
+    kept = [row_num for row_num, _ in rows if row_num not in archived]
+    overflow = len(kept) - row_budget
+    if overflow > 0:
+        archived.update(kept[:overflow])  # sheets are append-only, so the top rows are oldest
+
+    if sheet_name == "Chats":
+        # A session's log row and feedback row always move together
+        keys = {_session_key(record) for row_num, record in rows if row_num in archived}
+        archived.update(row_num for row_num, record in rows if _session_key(record) in keys)
+    return sorted(archived)
+
+
+def compact_records(records, sheet_name):
+    if sheet_name != "Chats":
+        return [{k: v for k, v in record.items() if v not in ("", None)} for record in records]
+
+    merged = {}
+    for record in records:
+        target = merged.setdefault(_session_key(record), {})
+        for k, v in record.items():
+            if v not in ("", None) and not target.get(k):
+                target[k] = v
+    return list(merged.values())
+
+
+# --- Archive files and index ---
+def load_index():
+    if os.path.exists(INDEX_PATH):
+        with open(INDEX_PATH, "r") as f:
+            return json.load(f)
+    return {}
+
+
+def save_index(index):
+    tmp_path = INDEX_PATH + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(index, f, separators=(",", ":"))
+    os.replace(tmp_path, INDEX_PATH)
+
+
+def write_archive_file(shard, sheet_name, records):
+    folder = os.path.join(ARCHIVE_DIR, shard)
+    os.makedirs(folder, exist_ok=True)
+    path = os.path.join(folder, f"{sheet_name}-{datetime.now().strftime('%Y%m%d-%H%M%S')}.jsonl.gz")
+    lines = "".join(json.dumps(record, separators=(",", ":"), ensure_ascii=False) + "\n" for record in records)
+    with open(path, "wb") as raw:
+        with gzip.GzipFile(fileobj=raw, mode="wb") as f:
+            f.write(lines.encode("utf-8"))
+        raw.flush()
+        os.fsync(raw.fileno())
+    return path
+
+
+def archive_sheet(shard, sheet_name, cutoff, row_budget, index, dry_run=False):
+    sheet = get_sheet(sheet_name, shard)
+    _, rows = read_rows(sheet)
+    row_numbers = plan_archive(rows, sheet_name, cutoff, row_budget)
+    if not row_numbers:
+        return 0, 0
+
+    selected = set(row_numbers)
+    records = compact_records([record for row_num, record in rows if row_num in selected], sheet_name)
+    if dry_run:
+        return len(row_numbers), len(records)
+
+    # The archive file and index are durable before anything is deleted from the sheet
+    path = write_archive_file(shard, sheet_name, records)
+    for student_id in {normalize_id(r.get("StudentID", "")) for r in records}:
+        files = index.setdefault(student_id, [])
+        if path not in files:
+            files.append(path)
+    save_index(index)
+
+    delete_rows_batch(sheet, row_numbers)
+    if sheet_name == "GoalHistory":
+        shift_high_water_mark(shard, row_numbers)
+    return len(row_numbers), len(records)
+
+
+def run_archive(cutoff_days=60, row_budget=5000, dry_run=False):
+    os.makedirs(ARCHIVE_DIR, exist_ok=True)
+    cutoff = date.today() - timedelta(days=cutoff_days)
+    index = load_index()
+    for shard in shard_names():
+        for sheet_name in DATE_COLUMNS:
+            moved, written = archive_sheet(shard, sheet_name, cutoff, row_budget, index, dry_run)
+            verb = "would move" if dry_run else "moved"
+            print(f"[ARCHIVE] {shard}/{sheet_name}: {verb} {moved} rows into {written} records")
+
+
+# --- Old records for one student ---
+def fetch_archived(student_id, sheet_name=None):
+    forms = id_forms(student_id)  # index entries written before ids were normalized may use "1002.0"
+    index = load_index()
+    paths = sorted({path for form in forms for path in index.get(form, [])})
+    records = []
+    for path in paths:
+        if sheet_name and not os.path.basename(path).startswith(f"{sheet_name}-"):
+            continue
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            for line in f:
+                record = json.loads(line)
+                if str(record.get("StudentID", "")).strip() in forms:
+                    records.append(record)
+    return records
+
+
+# Archived records for many students (None: everyone), {student_id: [records]}. Each archive
+# file is opened once, instead of once per student as fetch_archived would.
+def fetch_all_archived(student_ids=None):
+    wanted = {normalize_id(sid) for sid in student_ids} if student_ids is not None else None
+    paths = sorted({path for student_id, files in load_index().items()
+                    if wanted is None or normalize_id(student_id) in wanted for path in files})
+    by_student = {}
+    for path in paths:
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            for line in f:
+                record = json.loads(line)
+                student_id = normalize_id(record.get("StudentID", ""))
+                if wanted is None or student_id in wanted:
+                    by_student.setdefault(student_id, []).append(record)
+    return by_student
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Move old Chats/GoalHistory rows into compressed archives.")
+    parser.add_argument("--cutoff-days", type=int, default=60, help="archive rows older than this many days")
+    parser.add_argument("--row-budget", type=int, default=5000, help="max data rows left in each live sheet")
+    parser.add_argument("--dry-run", action="store_true")
+    parser.add_argument("--fetch", metavar="STUDENT_ID", help="print archived records for one student and exit")
+    args = parser.parse_args()
+
+    if args.fetch:
+        for record in fetch_archived(args.fetch):
+            print(json.dumps(record, ensure_ascii=False))
+    else:
+        run_archive(args.cutoff_days, args.row_budget, args.dry_run)
@@ -0,0 +1,176 @@
+# background_summary.py
+# Rolls each student's BackgroundInfo forward off the request path.
+#
+# Instead of re-summarizing BackgroundInfo plus every past reflection inside a button handler,
+# this job reads only the GoalHistory rows appended since its last run (a row high-water mark),
+# asks GPT to fold just those new reflections into the student's existing summary, and writes
+# every updated summary back to the Students sheet in one batched update.
+#
+# Run on a schedule:   python background_summary.py
+# Or from the app:     enqueue_background_refresh(student_id)
+
+import json
+import os
+import queue
+import threading
+from collections import defaultdict
+
+from google_sheets import (
+    get_rows_after,
+    get_sheet,
+    batch_update_student_fields,
+    query_all_shards,
+    shard_for_student
+)
+from llm import chat_completion
+from records import normalize_id
+
+STATE_PATH = os.environ.get("BACKGROUND_SUMMARY_STATE", ".background_summary_state.json")
+MIN_REFLECTION_LENGTH = 5
+
+_run_lock = threading.Lock()
+
+
+# --- High-water marks: last GoalHistory row already folded in, per shard ---
+def load_state(path=STATE_PATH):
+    if os.path.exists(path):
+        with open(path, "r") as f:
+            return json.load(f)
+    return {"last_row": {}, "pending": {}}
+
+
+def save_state(state, path=STATE_PATH):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(state, f)
+    os.replace(tmp_path, path)
+
+
+# --- Keep high-water marks valid when rows are deleted (see archive_sheets.py) ---
+def shift_high_water_mark(shard, deleted_rows, state_path=STATE_PATH):
+    with _run_lock:
+        state = load_state(state_path)
+        last_row = state["last_row"].get(shard)
+        if last_row is None:
+            return
+        state["last_row"][shard] = last_row - sum(1 for row_num in deleted_rows if row_num <= last_row)
+        save_state(state, state_path)
+
+
+# --- Roll one student's summary forward with only their new reflections ---
+def roll_summary_forward(existing_summary, new_reflections):
+    bullet_list = "\n".join(f"- {text}" for text in new_reflections)
+    prompt = (
+        "Here is what we already know about a student:\n"
+        f"{existing_summary.strip() or '[nothing yet]'}\n\n"
+        "Here are their newest reflections:\n"
+        f"{bullet_list}\n\n"
+        "Update the summary in 2-3 sentences. Keep what still matters, add what's new, "
+        "and focus on what the student enjoys, cares about, or finds meaningful.\n\nSummary:"
+    )
+    response = chat_completion(
+        [{"role": "user", "content": prompt}],
+        temperature=0.5,
+        max_tokens=200,
+        cache_ttl=86400  # a retried or concurrent roll-forward of the same rows reuses the reply
+    )
+    return response.choices[0].message.content.strip()
+
+
+def _new_reflections_by_student(rows):
+    by_student = defaultdict(list)
+    for row in rows:
+        student_id = normalize_id(row.get("StudentID", ""))
+        if not student_id:
+            continue
+        for field in ["OutcomeReflection", "BackgroundInfo"]:
+            text = str(row.get(field, "")).strip()
+            if len(text) > MIN_REFLECTION_LENGTH:
+                by_student[student_id].append(text)
+    return by_student
+
+
+# --- One incremental pass over GoalHistory ---
+# Returns the number of students whose BackgroundInfo was updated.
+def run_incremental_update(state_path=STATE_PATH):
+    with _run_lock:
+        state = load_state(state_path)
+        pending = state.get("pending", {})
+        last_rows = state.get("last_row", {})
+
+        # Every shard's GoalHistory is read in parallel, from its own high-water mark (row 1 is the header)
+        new_by_shard = query_all_shards(
+            lambda shard: get_rows_after("GoalHistory", last_rows.get(shard, 1), shard)
+        )
+        new_row_count = sum(len(rows) for rows, _ in new_by_shard.values())
+        if not new_row_count and not pending:
+            return 0
+
+        # Reflections from students whose roll-forward failed last time go first
+        new_by_student = defaultdict(list, {sid: list(texts) for sid, texts in pending.items()})
+        for rows, _ in new_by_shard.values():
+            for student_id, reflections in _new_reflections_by_student(rows).items():
+                new_by_student[student_id].extend(reflections)
+
+        shards_touched = {shard_for_student(sid) for sid in new_by_student}
+        existing = {}
+        for shard in shards_touched:
+            for row in get_sheet("Students", shard).get_all_records():
+                existing[normalize_id(row["StudentID"])] = str(row.get("BackgroundInfo", ""))
+
+        updates = {}
+        still_pending = {}
+        missing = sorted(sid for sid in new_by_student if sid not in existing)
+        if missing:
+            # No Students row to write to (deleted, or a typo in GoalHistory); their reflections are dropped
+            print(f"[BACKGROUND SUMMARY] Dropped {len(missing)} students not in Students: {', '.join(missing)}")
+        for student_id, reflections in new_by_student.items():
+            if student_id not in existing:
+                continue
+            try:
+                updates[student_id] = {
+                    "BackgroundInfo": roll_summary_forward(existing[student_id], reflections)
+                }
+            except Exception as e:
+                # Keep their reflections so the next pass retries them without re-reading rows
+                print(f"[BACKGROUND SUMMARY] Deferred {student_id}: {e}")
+                still_pending[student_id] = reflections
+
+        batch_update_student_fields(updates)
+        state["last_row"] = {shard: last_row for shard, (_, last_row) in new_by_shard.items()}
+        state["pending"] = still_pending
+        save_state(state, state_path)
+        print(f"[BACKGROUND SUMMARY] {new_row_count} new rows, {len(updates)} summaries updated.")
+        return len(updates)
+
+
+# --- Background worker fed from the app ---
+# The request path only does a queue.put. The worker coalesces everything queued since its
+# last pass into a single incremental update, since one pass covers every student anyway.
+_refresh_queue = queue.Queue()
+_worker = None
+_worker_lock = threading.Lock()
+
+
+def _worker_loop():
+    while True:
+        _refresh_queue.get()
+        while not _refresh_queue.empty():
+            _refresh_queue.get_nowait()
+        try:
+            run_incremental_update()
+        except Exception as e:
+            print(f"[BACKGROUND SUMMARY] Pass failed: {e}")
+
+
+def enqueue_background_refresh(student_id):
+    global _worker
+    with _worker_lock:
+        if _worker is None:
+            _worker = threading.Thread(target=_worker_loop, name="background-summary", daemon=True)
+            _worker.start()
+    _refresh_queue.put(normalize_id(student_id))
+
+
+if __name__ == "__main__":
+    run_incremental_update()
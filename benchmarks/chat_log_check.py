@@ -0,0 +1,77 @@
+# benchmarks/chat_log_check.py
+# Checks that the Chats rows the app writes for one session merge into a single archive record.
+#
+# Drives streamlit_app.py to the chat wrap-up through AppTest (backends faked as in rerun_bench.py),
+# keeps the full-log row it writes, submits the feedback form and keeps the feedback row. Both
+# rows go through the same shape the sheet gives back (CHAT_LOG_COLUMNS, string cells) and then
+# archive_sheets.compact_records. The session's rows must merge into one record holding both the
+# chat history and the feedback answers; exits 1 otherwise.
+#
+#   python benchmarks/chat_log_check.py
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # the repo root
+
+import logging
+
+from streamlit.logger import set_log_level
+from streamlit.testing.v1 import AppTest
+
+from benchmarks.rerun_bench import APP_PATH, at_step, install_backends
+from records import CHAT_LOG_COLUMNS
+
+
+# A row as it comes back from the sheet: CHAT_LOG_COLUMNS order, every cell a string
+def as_sheet_row(entry):
+    return {column: "" if entry.get(column) is None else str(entry.get(column, "")) for column in CHAT_LOG_COLUMNS}
+
+
+def session_rows():
+    import offline
+
+    written = []
+    install_backends()
+    offline.add_chat_log_entry = written.append
+
+    app = AppTest.from_file(APP_PATH, default_timeout=60)
+    app.run()
+    at_step(app, 3, 4)
+    del app.session_state["chat_log_saved"]  # let the wrap-up write its log row
+    del app.session_state["log_timestamp"]
+    app.run()
+    if len(written) != 1:
+        raise RuntimeError(f"the wrap-up wrote {len(written)} Chats rows, expected the one log row")
+
+    submit = [b for b in app.button if b.label.startswith("Submit feedback and try again")]
+    if not submit:
+        raise RuntimeError("feedback form not shown at the wrap-up")
+    submit[0].click()
+    app.run()
+    if app.exception:
+        raise RuntimeError(f"app failed: {app.exception[0].value}")
+    return written
+
+
+if __name__ == "__main__":
+    set_log_level("error")
+    logging.getLogger("streamlit.runtime.scriptrunner_utils.script_run_context").addFilter(lambda record: False)
+
+    from archive_sheets import compact_records
+
+    rows = [as_sheet_row(entry) for entry in session_rows()]
+    print(f"[CHECK] App wrote {len(rows)} Chats rows: "
+          + ", ".join(f"{row['StudentID']} @ {row['Timestamp']}" for row in rows))
+    merged = compact_records(rows, "Chats")
+
+    failures = []
+    if len(merged) != 1:
+        failures.append(f"{len(rows)} rows compacted into {len(merged)} records, expected 1")
+    elif not merged[0].get("ChatHistory.json") or not merged[0].get("Try"):
+        failures.append(f"merged record is missing the chat history or the feedback: {sorted(merged[0])}")
+    for line in failures:
+        print(f"[CHECK] FAILED: {line}")
+    if not failures:
+        print(f"[CHECK] Merged into 1 record with {len(merged[0])} fields")
+    sys.exit(1 if failures else 0)
@@ -0,0 +1,194 @@
+# benchmarks/parse_bench.py
+# Micro-benchmark and fuzz run for response_parser against the original regex helpers.
+#
+# Parity is checked on the whole fuzz corpus (stored outputs plus their mutations), not just the
+# well-formed ones. Where the two disagree, the difference has to be one the new parser makes on
+# purpose (KNOWN_DIFFERENCES); anything else fails the run.
+#
+#   python benchmarks/parse_bench.py
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # the repo root
+
+import random
+import re
+import statistics
+import timeit
+from collections import Counter
+
+import yaml
+
+from response_parser import (
+    ResponseParser,
+    parse_response,
+    extract_response_options,
+    extract_final_response,
+    _REVERSED_MARKER
+)
+
+CORPUS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "parser_fuzz_corpus.yaml")
+
+
+# --- The regex helpers streamlit_app.py used before response_parser ---
+def legacy_extract_response_options(raw_text):
+    pattern = r"Option (\d+):\s*Statement:(.*?)\s*Question:(.*?)(?=(Option \d+:|Best option:|Final response:|$))"
+    matches = re.findall(pattern, raw_text, re.DOTALL | re.IGNORECASE)
+    return [
+        {"option": int(m[0]), "statement": m[1].strip(), "question": m[2].strip()}
+        for m in matches
+    ]
+
+
+def legacy_extract_final_response(raw_text):
+    match = re.search(r"(?i)final response\s*:\s*(.*)", raw_text, re.DOTALL)
+    return match.group(1).strip() if match else raw_text
+
+
+# --- Fuzzing ---
+MUTATIONS = [
+    lambda t, r: t[:r.randint(0, len(t))],                                      # truncate
+    lambda t, r: t.replace(":", "", 1),                                         # drop a colon
+    lambda t, r: t.upper(),
+    lambda t, r: t.replace("Statement", "**Statement**"),
+    lambda t, r: t + "\nOption 4: Statement: extra" * r.randint(1, 3),
+    lambda t, r: "".join(ch for ch in t if r.random() > 0.05),                 # drop chars
+    lambda t, r: t.replace("\n", "\n\n"),
+]
+
+
+def stream_parse(text, rng):
+    parser = ResponseParser()
+    i = 0
+    while i < len(text):
+        step = rng.randint(1, 8)
+        parser.feed(text[i:i + step])
+        i += step
+    return parser.close()
+
+
+def fuzz_corpus(corpus, rounds=3000, seed=0):
+    rng = random.Random(seed)
+    seeds = corpus["well_formed"] + corpus["malformed"]
+    texts = list(seeds)
+    for _ in range(rounds):
+        text = rng.choice(seeds)
+        for _ in range(rng.randint(1, 3)):
+            text = rng.choice(MUTATIONS)(text, rng)
+        texts.append(text)
+    return texts
+
+
+def fuzz(texts, seed=0):
+    rng = random.Random(seed)
+    for text in texts:
+        whole = parse_response(text)
+        streamed = stream_parse(text, rng)
+        assert whole == streamed, f"streamed parse differs for {text!r}"
+    return len(texts)
+
+
+# --- Parity with the legacy helpers ---
+# Differences the new parser makes on purpose, checked in this order:
+#   decorated or spaced markers: "**Statement:**", "Question :" are markers to the new parser;
+#       the legacy regexes skip them. With the decoration and spaces removed, legacy agrees.
+#   question stops at a paragraph break: prose after the question's paragraph is evaluation,
+#       where the legacy question ran on to the next option marker.
+#   legacy span runs across a marker: the legacy lazy match carries a statement or question
+#       past a marker (e.g. the next "Option 3:") when its own next marker is garbled.
+MARKER_WORDS = r"(?:option[ \t]+\d+|statement|question|evaluation|best option|final response)"
+DECORATED = re.compile(
+    rf"(?i)[*_#]+[ \t]*{MARKER_WORDS}|{MARKER_WORDS}(?:[ \t]+|[*_#]+[ \t]*):|{MARKER_WORDS}[ \t]*:[*_#]"
+)
+PARAGRAPH_BREAK = re.compile(r"\n[ \t]*\n")
+KNOWN_DIFFERENCES = (
+    "decorated or spaced markers",
+    "question stops at a paragraph break",
+    "legacy span runs across a marker",
+)
+
+
+def undecorate(text):
+    text = re.sub(r"[*_#]", "", text)
+    return re.sub(rf"(?i)({MARKER_WORDS})[ \t]+:", r"\1:", text)
+
+
+def legacy_parse(text):
+    return legacy_extract_response_options(text), legacy_extract_final_response(text)
+
+
+def new_parse(text):
+    return extract_response_options(text), extract_final_response(text)
+
+
+def parity(text):
+    legacy, new = legacy_parse(text), new_parse(text)
+    if legacy == new:
+        return "identical"
+    if DECORATED.search(text):
+        plain = lambda parsed: (
+            [{k: undecorate(v) if isinstance(v, str) else v for k, v in o.items()} for o in parsed[0]],
+            undecorate(parsed[1]),
+        )
+        legacy = legacy_parse(undecorate(text))
+        if plain(legacy) == plain(new):
+            return "decorated or spaced markers"
+    if any(PARAGRAPH_BREAK.search(o["question"]) for o in legacy[0]):
+        return "question stops at a paragraph break"
+    spans = [o[part] for o in legacy[0] for part in ("statement", "question")]
+    if any(_REVERSED_MARKER.search(span[::-1]) for span in spans):
+        return "legacy span runs across a marker"
+    return None
+
+
+def check_parity(texts):
+    outcomes = Counter()
+    for text in texts:
+        outcome = parity(text)
+        assert outcome is not None, f"unexplained difference from the legacy helpers for {text!r}"
+        outcomes[outcome] += 1
+    return outcomes
+
+
+# Legacy and single-pass runs alternate, so a change in machine speed hits both; the median of
+# the per-pair ratios is reported
+def bench(outputs, repeat=15):
+
+    def legacy():
+        for text in outputs:
+            legacy_extract_response_options(text)
+            legacy_extract_final_response(text)
+
+    def single_pass():
+        for text in outputs:
+            parse_response(text)
+
+    pairs = [(timeit.timeit(legacy, number=1), timeit.timeit(single_pass, number=1)) for _ in range(repeat)]
+    legacy_time = min(legacy for legacy, _ in pairs)
+    new_time = min(new for _, new in pairs)
+    return legacy_time, new_time, statistics.median(legacy / new for legacy, new in pairs)
+
+
+if __name__ == "__main__":
+    with open(CORPUS_PATH, "r") as f:
+        corpus = yaml.safe_load(f)
+
+    texts = fuzz_corpus(corpus)
+    for text in corpus["well_formed"]:
+        assert parity(text) == "identical", text
+    outcomes = check_parity(texts)
+    print(f"Parity with legacy helpers on {len(texts)} corpus + mutated outputs: "
+          + ", ".join(f"{outcomes[name]} {name}" for name in ("identical",) + KNOWN_DIFFERENCES))
+    print(f"Fuzz: {fuzz(texts)} outputs parsed, streamed == whole")
+
+    well_formed = corpus["well_formed"]
+    runs = {
+        "short": [well_formed[i % len(well_formed)] for i in range(2000)],
+        # Long evaluations between options are where the lazy lookahead regex degrades
+        "long": [("Some evaluation prose that goes on. " * 200).join(well_formed)] * 200,
+    }
+    for name, outputs in runs.items():
+        legacy_time, new_time, speedup = bench(outputs)
+        print(f"[{name}] legacy regex pair: {legacy_time * 1000:.1f} ms / {len(outputs)} outputs, "
+              f"single-pass: {new_time * 1000:.1f} ms ({speedup:.1f}x, median of paired runs)")
@@ -0,0 +1,115 @@
+# benchmarks/records_bench.py
+# Memory per cached row and lookup cost: get_all_records() dicts vs records.py.
+#
+#   python benchmarks/records_bench.py
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # the repo root
+
+import random
+import timeit
+import tracemalloc
+from datetime import date, timedelta
+
+from records import GoalHistoryColumns, GoalHistoryEntry
+
+GOALS = [f"Goal {i}: a goal from the goal bank, about this long give or take." for i in range(1, 10)]
+REFLECTIONS = [
+    "I said one thing to my partner but then got quiet.",
+    "I forgot about it and didn't really try.",
+    "I spoke up every time and even got my partner talking.",
+    "[first goal]",
+]
+
+
+def make_rows(n_students=2000, per_student=6, seed=0):
+    rng = random.Random(seed)
+    start = date(2025, 1, 6)
+    rows = []
+    for i in range(per_student):
+        for s in range(n_students):
+            rows.append({
+                "StudentID": 1000 + s if rng.random() < 0.5 else f" {1000 + s} ",  # what the sheet hands back
+                "GoalSetDate": (start + timedelta(days=2 * i)).isoformat(),
+                "Goal": rng.choice(GOALS),
+                "SuccessMeasures": "",
+                "OutcomeReflection": rng.choice(REFLECTIONS),
+                "GoalAchievement": rng.choice(["0", "1", "2", "3", "4", 3, "[first goal]"]),
+                "BackgroundInfo": "",
+            })
+    return rows
+
+
+def measure(build):
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    built = build()
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    size = sum(stat.size_diff for stat in after.compare_to(before, "filename"))
+    return built, size
+
+
+# --- Lookups: one student's history and per-student low-score counts ---
+def dict_history(rows, student_id):
+    return [row for row in rows if str(row["StudentID"]).strip() == str(student_id).strip()]
+
+
+def dict_low_counts(rows):
+    counts = {}
+    for row in rows:
+        if str(row["GoalAchievement"]) in ["0", "1"]:
+            key = str(row["StudentID"]).strip()
+            counts[key] = counts.get(key, 0) + 1
+    return counts
+
+
+def record_history(entries, student_id):
+    return [e for e in entries if e.student_id == student_id]
+
+
+def record_low_counts(entries):
+    counts = {}
+    for e in entries:
+        if e.score is not None and e.score <= 1:
+            counts[e.student_id] = counts.get(e.student_id, 0) + 1
+    return counts
+
+
+if __name__ == "__main__":
+    source = make_rows()
+    n = len(source)
+
+    # Each representation is rebuilt from sheet-like input so only its own objects are counted
+    dicts, dict_bytes = measure(lambda: [dict(row) for row in source])
+    entries, entry_bytes = measure(lambda: [GoalHistoryEntry.from_row(row) for row in source])
+    columns, column_bytes = measure(lambda: GoalHistoryColumns(entries))
+
+    print(f"{n} GoalHistory rows")
+    print(f"  dict rows:          {dict_bytes / n:7.1f} bytes/row")
+    print(f"  GoalHistoryEntry:   {entry_bytes / n:7.1f} bytes/row (strings shared with the source rows)")
+    print(f"  GoalHistoryColumns: {column_bytes / n:7.1f} bytes/row ({columns.nbytes() / n:.1f} in arrays)")
+
+    assert len(record_history(entries, "1500")) == len(dict_history(dicts, "1500")) == 6
+    assert record_low_counts(entries) == dict_low_counts(dicts)
+    column_counts = columns.count_scores_by_student(0, 1)
+    assert {sid: int(c) for sid, c in zip(columns.student_ids, column_counts) if c} == dict_low_counts(dicts)
+
+    timings = {
+        "history for one student": [
+            ("dicts", lambda: dict_history(dicts, "1500")),
+            ("records", lambda: record_history(entries, "1500")),
+            ("columns", lambda: columns.rows_for_student("1500")),
+        ],
+        "low-score count per student": [
+            ("dicts", lambda: dict_low_counts(dicts)),
+            ("records", lambda: record_low_counts(entries)),
+            ("columns", lambda: columns.count_scores_by_student(0, 1)),
+        ],
+    }
+    for name, runs in timings.items():
+        results = [(label, min(timeit.repeat(fn, number=20, repeat=5)) / 20) for label, fn in runs]
+        baseline = results[0][1]
+        print(f"[{name}] " + ", ".join(f"{label}: {t * 1000:.2f} ms ({baseline / t:.1f}x)" for label, t in results))
@@ -0,0 +1,118 @@
+# benchmarks/replay_check.py
+# Checks that a recorded session replays without reaching Sheets, including the history timeline.
+#
+# Records one session through AppTest with RECORD_SESSIONS on: pick a student, reach the reflect
+# step (which shows the timeline summary) and click "Show older goals". The Sheets reads answer
+# from in-process stand-ins, as in rerun_bench.py. The recording is then replayed with
+# session_recorder.replay while the stand-ins refuse every call, so anything the recording missed
+# fails the replay instead of quietly going to the live sheet or the snapshot. Exits 1 on failure.
+#
+#   python benchmarks/replay_check.py
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # the repo root
+os.environ["SHARED_CACHE_URL"] = "off"  # before anything opens the shared cache
+
+import glob
+import logging
+import tempfile
+
+from streamlit.logger import set_log_level
+from streamlit.testing.v1 import AppTest
+
+from benchmarks.rerun_bench import APP_PATH, STUDENT
+
+HISTORY_CALLS = ["get_history_summary", "get_history_page"]
+SUMMARY = {
+    "count": 7, "streak": 2, "pages": 1,
+    "recent": [{"date": "2025-03-03", "goal": "Ask my partner one question", "score": 3}],
+}
+OLDER = [{"date": "2025-02-03", "goal": "Raise my hand once", "score": 1}]
+
+
+# --- Stand-ins for the live reads; after recording, any call is a leak past the replay ---
+live = {"allowed": True, "calls": []}
+
+
+def stand_in(name, result):
+    def call(*args, **kwargs):
+        live["calls"].append(name)
+        if not live["allowed"]:
+            raise AssertionError(f"replay reached the live {name}")
+        return result
+    return call
+
+
+def install_stand_ins():
+    import offline
+    import session_recorder
+
+    session_recorder.ReplayBackend([]).install()  # OpenAI stub, no snapshot thread, no index writes
+    offline.get_all_records_all_shards = stand_in("get_all_records_all_shards", [
+        dict(STUDENT, StudentID=str(1000 + i)) for i in range(40)
+    ])
+    offline.get_student_context = stand_in("get_student_context", {"student": dict(STUDENT), "goal_history": [], "headers": {}})
+    offline.get_student_info = stand_in("get_student_info", dict(STUDENT))
+    offline.get_history_summary = stand_in("get_history_summary", SUMMARY)
+    offline.get_history_page = stand_in("get_history_page", OLDER)
+    session_recorder.install()  # wraps the stand-ins; the app's own install() is then a no-op
+
+
+def record(directory):
+    app = AppTest.from_file(APP_PATH, default_timeout=60)
+    app.run()
+    app.text_input[0].set_value(STUDENT["StudentID"])
+    next(b for b in app.button if b.label == "Chat as this student").click()
+    app.run()
+    older = [b for b in app.button if b.label == "Show older goals"]
+    if not older:
+        raise RuntimeError(f"history timeline not shown; app is at step {app.session_state['step']}")
+    older[0].click()
+    app.run()
+    if app.exception:
+        raise RuntimeError(f"app failed while recording: {app.exception[0].value}")
+    return glob.glob(os.path.join(directory, "**", "*.jsonl.gz"), recursive=True)
+
+
+if __name__ == "__main__":
+    set_log_level("error")
+    logging.getLogger("streamlit.runtime.scriptrunner_utils.script_run_context").addFilter(lambda record: False)
+
+    import session_recorder
+
+    failures = []
+    with tempfile.TemporaryDirectory() as directory:
+        os.environ[session_recorder.RECORD_DIR_ENV] = directory
+        install_stand_ins()
+        paths = record(directory)
+        os.environ.pop(session_recorder.RECORD_DIR_ENV)
+        if len(paths) != 1:
+            raise RuntimeError(f"expected one recording, found {len(paths)}")
+
+        recorded = [e["fn"] for e in session_recorder.load_events(paths[0]) if e["k"] == "call"]
+        print(f"[CHECK] Recorded {len(recorded)} backend calls: {', '.join(recorded)}")
+        for name in HISTORY_CALLS:
+            if name not in recorded:
+                failures.append(f"{name} was not recorded")
+
+        live["allowed"], live["calls"] = False, []
+        result = session_recorder.replay(paths[0], APP_PATH)
+
+    errors = [error for run in result["runs"] for error in run["errors"]]
+    print(f"[CHECK] Replayed {len(result['runs'])} runs, {result['served']} calls served from the recording")
+    if live["calls"]:
+        failures.append(f"replay reached the live backends: {', '.join(live['calls'])}")
+    for name in HISTORY_CALLS:
+        if name in result["unused"]:
+            failures.append(f"replay never asked for the recorded {name}")
+    if result["missed"]:
+        failures.append(f"replay had no recorded answer for {result['missed']}")
+    if errors:
+        failures.append(f"replay failed: {errors[0]}")
+    for line in failures:
+        print(f"[CHECK] FAILED: {line}")
+    if not failures:
+        print("[CHECK] Replay was hermetic, history timeline included")
+    sys.exit(1 if failures else 0)
@@ -0,0 +1,132 @@
+# benchmarks/rerun_bench.py
+# What one edit in the chat reply box or the feedback form costs, before and after those
+# widgets moved into st.fragment functions.
+#
+# Before, every edit reran the whole script at the current step. Now it reruns only the fragment
+# body. Streamlit's AppTest always runs the full script, so both are measured in the same full
+# runs: "full run" is the script's wall time at that step (the old cost of an edit), and
+# "fragment" is the wall time spent inside the fragment body in those runs (the new cost, less
+# Streamlit's own per-rerun overhead, which also shrinks with a smaller delta but isn't
+# measured here). Sheets and OpenAI are faked, as in session_recorder.py replays.
+#
+#   python benchmarks/rerun_bench.py
+#   python benchmarks/rerun_bench.py --runs 50 --history-turns 10
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # the repo root
+os.environ["SHARED_CACHE_URL"] = "off"  # before anything opens the shared cache
+os.environ.pop("RECORD_SESSIONS", None)
+
+import argparse
+import functools
+import logging
+import statistics
+import time
+
+import streamlit as st
+from streamlit.logger import set_log_level
+from streamlit.testing.v1 import AppTest
+
+APP_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "streamlit_app.py")
+
+STUDENT = {
+    "StudentID": "1001", "Nickname": "Sam", "PronounCode": "they", "ChosenTone": "real_one",
+    "CurrentGoal": "Ask my partner one question", "CurrentSuccessMeasures": "I asked at least once",
+    "CurrentGoalSetDate": "2025-03-03", "GoalRange": "easy-moderate: partner", "BackgroundInfo": "Likes drawing.",
+}
+
+
+# --- Timing fragment bodies ---
+# Installed before the app defines its fragments; each call's wall time is kept by function name
+fragment_ms = {}
+_fragment = st.fragment
+
+
+def timed_fragment(fn=None, **kwargs):
+    if fn is None:
+        return lambda f: timed_fragment(f, **kwargs)
+
+    @functools.wraps(fn)
+    def body(*args, **inner):
+        start = time.perf_counter()
+        try:
+            return fn(*args, **inner)
+        finally:
+            fragment_ms.setdefault(fn.__name__, []).append((time.perf_counter() - start) * 1000)
+    return _fragment(body, **kwargs)
+
+
+# --- Fake backends ---
+def install_backends(students=40):
+    import offline
+    import session_recorder
+
+    session_recorder.ReplayBackend([]).install()  # OpenAI stub, no snapshot thread, no index writes
+    offline.get_all_records_all_shards = lambda *args, **kwargs: [
+        dict(STUDENT, StudentID=str(1000 + i)) for i in range(students)
+    ]
+    offline.add_chat_log_entry = lambda *args, **kwargs: True
+
+
+def chat_history(turns):
+    history = [{"ai": "Sounds like you actually tried this time. What made it easier to speak up?"}]
+    for i in range(turns - 1):
+        history.append({"user": f"My partner smiled when I asked, so I asked again ({i}).",
+                        "ai": "That's real progress. What would make it feel like a stretch next class?"})
+    return history
+
+
+# App state at the step; chat_turn_count picks the reply box (1) or the wrap-up feedback form (3)
+def at_step(app, turn_count, turns):
+    state = app.session_state
+    state["student_id"] = STUDENT["StudentID"]
+    state["student"] = dict(STUDENT)
+    state["goal_to_reflect"] = {"text": STUDENT["CurrentGoal"], "set_date": STUDENT["CurrentGoalSetDate"], "source": "demo"}
+    state["latest_reflection"] = "I asked once, then got quiet."
+    state["latest_score_value"] = 3
+    state["tone_pref"] = "real_one"
+    state["chat_history"] = chat_history(turns)
+    state["chat_turn_count"] = turn_count
+    state["chat_log_saved"] = True  # the wrap-up step logs once; don't time that write
+    state["log_timestamp"] = "2026-01-01T00:00:00"
+    state["step"] = "chatbot_motivation"
+
+
+def measure(app, fragment, runs):
+    app.run()  # warm up at this step
+    fragment_ms.pop(fragment, None)
+    full = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        app.run()
+        full.append((time.perf_counter() - start) * 1000)
+    if app.exception:
+        raise RuntimeError(f"app failed at this step: {app.exception[0].value}")
+    inside = fragment_ms.get(fragment)
+    if not inside:
+        raise RuntimeError(f"fragment {fragment} didn't run at this step")
+    return statistics.median(full), statistics.median(inside)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Full-run vs fragment rerun cost at the chat steps.")
+    parser.add_argument("--runs", type=int, default=30)
+    parser.add_argument("--history-turns", type=int, default=6, help="chat turns already on screen")
+    args = parser.parse_args()
+
+    set_log_level("error")
+    # Setting session state between runs happens outside a script run; Streamlit warns on each key
+    logging.getLogger("streamlit.runtime.scriptrunner_utils.script_run_context").addFilter(lambda record: False)
+    st.fragment = timed_fragment
+    install_backends()
+    app = AppTest.from_file(APP_PATH, default_timeout=60)
+    app.run()  # the landing page, which sets up the session
+
+    cases = [("chat reply box", 1, "chat_input"), ("feedback form", 3, "feedback_form")]
+    for name, turn_count, fragment in cases:
+        at_step(app, turn_count, args.history_turns)
+        full_ms, fragment_run_ms = measure(app, fragment, args.runs)
+        print(f"[BENCH] {name}: full run {full_ms:.1f} ms, fragment {fragment_run_ms:.2f} ms "
+              f"({full_ms / fragment_run_ms:.0f}x less script per edit; median of {args.runs})")
@@ -0,0 +1,229 @@
+# benchmarks/sheets_bench.py
+# Offline benchmark suite for google_sheets.py reads and writes and the prompt/parse path,
+# checked against a stored JSON baseline.
+#
+# Sheets calls run against FakeWorksheet, an in-memory stand-in registered as the worksheet
+# handle google_sheets.get_sheet() hands out. The shared cache is off, so every call reaches it.
+# Each case records its time per call and the Sheets API calls one call made. Times are also
+# kept as a multiple of a fixed pure-Python calibration loop timed right alongside each sample
+# ("relative"), which cancels out how fast or busy the machine is at that moment. Checked against
+# the baseline:
+#   - API call counts must match exactly; one extra read or write per call is a regression
+#   - relative times may grow by at most --tolerance
+#   - get_student_info's cost per row must stay flat from 10k to 100k rows, so a lookup that
+#     turns superlinear fails even on a faster machine
+#
+# It is a plain script rather than pytest-benchmark tests: the repo has no pytest suite, and the
+# calibration pairing and call-count checks above are not something pytest-benchmark's saved runs
+# compare. Run it from any directory (python -m benchmarks.sheets_bench from the repo root also works):
+#
+#   python benchmarks/sheets_bench.py             # exits 1 on a regression
+#   python benchmarks/sheets_bench.py --update    # record a new baseline (same machine as checks)
+
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)  # google_sheets.py reads sheet_shards.yaml from the working directory
+os.environ["SHARED_CACHE_URL"] = "off"  # before anything opens the shared cache
+
+import argparse
+import gc
+import json
+import statistics
+import timeit
+from collections import Counter
+
+import yaml
+
+import google_sheets
+from chat_prompts import SCORE_INTERPRETATIONS, TONES, build_first_turn_input, get_template_registry, render_system_message
+from response_parser import extract_final_response, extract_response_options
+
+BASELINE_PATH = os.path.join(ROOT, "benchmarks", "sheets_baseline.json")
+CORPUS_PATH = os.path.join(ROOT, "benchmarks", "parser_fuzz_corpus.yaml")
+REGRESSION_TOLERANCE = 0.5   # single-process micro timings are noisier than whole replays
+SCALING_LIMIT = 2.0          # per-row cost at 100k rows vs 10k; a linear scan stays near 1
+
+STUDENT_HEADERS = ["StudentID", "Nickname", "PronounCode", "ChosenTone", "CurrentGoal",
+                   "CurrentSuccessMeasures", "CurrentGoalSetDate", "GoalRange", "BackgroundInfo"]
+HISTORY_HEADERS = ["StudentID", "GoalSetDate", "Goal", "SuccessMeasures", "OutcomeReflection",
+                   "GoalAchievement", "InterpretationSummary", "BackgroundInfo"]
+
+
+# --- Fake backend ---
+class FakeWorksheet:
+    def __init__(self, title, headers, records):
+        self.title = title
+        self.headers = headers
+        self.records = records  # what get_all_records() returns: numericised dicts, sheet order
+        self.calls = Counter()
+
+    def get_all_records(self):
+        self.calls["get_all_records"] += 1
+        return self.records
+
+    def row_values(self, row):
+        self.calls["row_values"] += 1
+        return list(self.headers) if row == 1 else list(self.records[row - 2].values())
+
+    def update_cell(self, row, col, value):
+        self.calls["update_cell"] += 1
+        self.records[row - 2][self.headers[col - 1]] = value
+
+
+def install(sheet):
+    for shard in google_sheets.shard_names():
+        google_sheets._handles[(shard, sheet.title)] = sheet
+    return sheet
+
+
+def make_students(n):
+    return [
+        {"StudentID": 100000 + i, "Nickname": f"Student {i}", "PronounCode": "they", "ChosenTone": "Reflective",
+         "CurrentGoal": "Ask my partner one question", "CurrentSuccessMeasures": "I asked at least once",
+         "CurrentGoalSetDate": "2025-03-03", "GoalRange": "easy-moderate: partner", "BackgroundInfo": "Likes drawing."}
+        for i in range(n)
+    ]
+
+
+# share of the rows that belong to the target student, spread evenly through the sheet
+def make_history(n, share, target):
+    every = max(int(round(1 / share)), 1)
+    return [
+        {"StudentID": target if i % every == 0 else 200000 + i % 997, "GoalSetDate": "2025-03-03",
+         "Goal": "Ask my partner one question", "SuccessMeasures": "", "OutcomeReflection": "I asked twice.",
+         "GoalAchievement": i % 5, "InterpretationSummary": "", "BackgroundInfo": ""}
+        for i in range(n)
+    ]
+
+
+# --- Measuring ---
+def calibration_loop():
+    rows = [{"StudentID": i} for i in range(2000)]
+    return sum(1 for row in rows if str(row["StudentID"]).strip() == "1999")
+
+
+# Each sample of fn is paired with a calibration sample taken just before it. "ms" is the best
+# sample; "relative" is the median ratio, so one lucky or unlucky pair doesn't move it
+def measure(fn, sheets=(), number=5, repeat=15):
+    fn()  # warm up (tokenizer, template registry, first-call imports)
+    for sheet in sheets:
+        sheet.calls.clear()
+    fn()
+    calls = {}
+    for sheet in sheets:
+        for method, count in sorted(sheet.calls.items()):
+            calls[f"{sheet.title}.{method}"] = count
+    gc.collect()  # the previous case's sheet is freed here, not during this case's samples
+    samples = []
+    for _ in range(repeat):
+        calibration = timeit.timeit(calibration_loop, number=5) / 5
+        samples.append((timeit.timeit(fn, number=number) / number, calibration))
+    seconds = min(sample for sample, _ in samples)
+    relative = statistics.median(sample / calibration for sample, calibration in samples)
+    return {"ms": round(seconds * 1000, 4), "relative": round(relative, 6), "calls": calls}
+
+
+def bench_student_info(results):
+    for n in (100, 10_000, 100_000):
+        sheet = install(FakeWorksheet("Students", STUDENT_HEADERS, make_students(n)))
+        target = str(100000 + n - 1)  # last row: the full scan
+        assert google_sheets.get_student_info(target)["StudentID"] == int(target)
+        case = measure(lambda: google_sheets.get_student_info(target), [sheet])
+        case["us_per_row"] = round(case["ms"] * 1000 / n, 4)
+        results[f"get_student_info/{n}_rows"] = case
+
+
+def bench_goal_history(results, n=10_000):
+    for share in (0.001, 0.01, 0.1, 0.5):
+        sheet = install(FakeWorksheet("GoalHistory", HISTORY_HEADERS, make_history(n, share, 300)))
+        matched = len(google_sheets.get_goal_history_for_student("300"))
+        case = measure(lambda: google_sheets.get_goal_history_for_student("300"), [sheet])
+        case["rows_returned"] = matched
+        results[f"get_goal_history_for_student/{share:.1%}_of_{n}_rows"] = case
+
+
+def bench_update_goal(results, n=10_000):
+    sheet = install(FakeWorksheet("Students", STUDENT_HEADERS, make_students(n)))
+    target = str(100000 + n // 2)
+    variants = {
+        "goal_only": {},
+        "goal_range_and_background": {"goal_range": "easy-moderate: partner", "background_info": "Likes drawing."},
+    }
+    for name, extra in variants.items():
+        def update():
+            assert google_sheets.update_student_current_goal(target, "Speak up once", "I spoke once", "2025-03-10", **extra)
+        results[f"update_student_current_goal/{name}"] = measure(update, [sheet])
+
+
+def bench_prompts(results):
+    get_template_registry()
+    reflection = "I said one thing to my partner but then got quiet because I wasn't sure my idea was right. " * 3
+    background = "Likes drawing and soccer. Gets nervous speaking in front of the whole class. " * 4
+    for tone in TONES:
+        def build():
+            render_system_message(tone, "Ask my partner one question", 2, SCORE_INTERPRETATIONS[2],
+                                  reflection, background, "short")
+            build_first_turn_input("Ask my partner one question", 2, SCORE_INTERPRETATIONS[2], reflection)
+        results[f"build_prompt/{tone}"] = measure(build, number=200)
+
+
+def bench_parse(results):
+    with open(CORPUS_PATH, "r") as f:
+        well_formed = yaml.safe_load(f)["well_formed"]
+    long_output = ("Some evaluation prose that goes on. " * 200).join(well_formed)
+    results["extract_response_options/long_output"] = measure(lambda: extract_response_options(long_output), number=20)
+    results["extract_final_response/long_output"] = measure(lambda: extract_final_response(long_output), number=20)
+
+
+# --- Baseline checks ---
+def regressions(results, baseline, tolerance):
+    found = []
+    for name, case in results.items():
+        expected = baseline.get(name)
+        if expected is None:
+            continue
+        if case["calls"] != expected["calls"]:
+            found.append(f"{name}: Sheets calls {case['calls']} != baseline {expected['calls']}")
+        if case["relative"] > expected["relative"] * (1 + tolerance):
+            found.append(f"{name}: {case['relative']:.3f}x calibration vs baseline {expected['relative']:.3f}x "
+                         f"(+{case['relative'] / expected['relative'] - 1:.0%}; {case['ms']:.3f} ms)")
+        if "rows_returned" in expected and case["rows_returned"] != expected["rows_returned"]:
+            found.append(f"{name}: returned {case['rows_returned']} rows, baseline {expected['rows_returned']}")
+
+    small, large = results.get("get_student_info/10000_rows"), results.get("get_student_info/100000_rows")
+    if small and large and large["us_per_row"] > small["us_per_row"] * SCALING_LIMIT:
+        found.append(f"get_student_info: {large['us_per_row']:.3f} us/row at 100k rows vs "
+                     f"{small['us_per_row']:.3f} at 10k; lookup cost is growing faster than the sheet")
+    return found
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline Sheets / prompt / parse benchmarks.")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--update", action="store_true", help="write the baseline instead of checking it")
+    parser.add_argument("--tolerance", type=float, default=REGRESSION_TOLERANCE)
+    args = parser.parse_args()
+
+    results = {}
+    for bench in (bench_student_info, bench_goal_history, bench_update_goal, bench_prompts, bench_parse):
+        bench(results)
+    for name, case in results.items():
+        extra = "".join(f", {key} {case[key]}" for key in ("us_per_row", "rows_returned") if key in case)
+        print(f"[BENCH] {name}: {case['ms']:.3f} ms ({case['relative']:.3f}x){extra}" + (f", calls {case['calls']}" if case["calls"] else ""))
+
+    if args.update:
+        with open(args.baseline, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"\n[BENCH] Baseline written to {args.baseline}")
+    else:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        found = regressions(results, baseline, args.tolerance)
+        for line in found:
+            print(f"[REGRESSION] {line}")
+        print(f"\n[BENCH] {len(found)} regressions against {args.baseline} (tolerance {args.tolerance:.0%})")
+        sys.exit(1 if found else 0)
@@ -0,0 +1,104 @@
+# benchmarks/transport_bench.py
+# Connection reuse against a local HTTPS stand-in server: a new session per call (the old
+# pattern) vs the shared pools from transport.py, for requests (gspread) and httpx (OpenAI).
+#
+#   python benchmarks/transport_bench.py            # needs the openssl CLI
+#   python benchmarks/transport_bench.py --threads 32 --calls 100
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # the repo root
+
+import argparse
+import json
+import ssl
+import subprocess
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import transport
+
+BODY = json.dumps({"range": "Students!A1:Z", "values": [["StudentID", "Nickname"], ["300", "Ann"]]}).encode()
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, like the real APIs
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(BODY)))
+        self.end_headers()
+        self.wfile.write(BODY)
+
+    def log_message(self, *args):
+        pass
+
+
+def self_signed_cert(directory):
+    cert, key = os.path.join(directory, "cert.pem"), os.path.join(directory, "key.pem")
+    subprocess.run(
+        ["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "1", "-keyout", key, "-out", cert,
+         "-subj", "/CN=localhost", "-addext", "subjectAltName=DNS:localhost,IP:127.0.0.1"],
+        check=True, capture_output=True,
+    )
+    return cert, key
+
+
+def start_server(cert, key):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StandInHandler)
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    context.load_cert_chain(cert, key)
+    server.socket = context.wrap_socket(server.socket, server_side=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"https://localhost:{server.server_address[1]}/v4/spreadsheets/demo/values/Students"
+
+
+def run(label, call, threads, calls):
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        list(pool.map(lambda _: call(), range(threads * calls)))
+    return label, (time.perf_counter() - start) * 1000
+
+
+if __name__ == "__main__":
+    import httpx
+    import requests
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--threads", type=int, default=16, help="concurrent sessions")
+    parser.add_argument("--calls", type=int, default=50, help="requests per session")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        cert, key = self_signed_cert(tmp)
+        server, url = start_server(cert, key)
+        transport.reset_stats()
+        timings = {}
+
+        # Old pattern: a fresh session, pool and TLS handshake per call
+        def per_call():
+            with requests.Session() as session:
+                transport.mount_tuned_adapter(session, "requests_per_call")
+                session.get(url, verify=cert).raise_for_status()
+        timings.update([run("requests_per_call", per_call, args.threads, args.calls)])
+
+        shared = transport.mount_tuned_adapter(requests.Session(), "requests_shared")
+        timings.update([run("requests_shared", lambda: shared.get(url, verify=cert).raise_for_status(),
+                            args.threads, args.calls)])
+
+        client = transport.httpx_client("httpx_shared", verify=cert)
+        timings.update([run("httpx_shared", lambda: client.get(url).raise_for_status(), args.threads, args.calls)])
+        client.close()
+        server.shutdown()
+
+    print(f"{args.threads} threads x {args.calls} calls, pool size {transport.pool_size('sheets')}, "
+          f"HTTP/2 {'available' if transport.http2_available() else 'not installed'} (stand-in speaks HTTP/1.1)\n")
+    print(f"{'client':<20} {'requests':>9} {'connections':>12} {'TLS':>6} {'reuse':>7} {'time':>10}")
+    for service, counts in transport.stats().items():
+        print(f"{service:<20} {counts['requests']:>9} {counts['connections']:>12} {counts['tls_handshakes']:>6} "
+              f"{counts['reuse_ratio']:>7.1%} {timings[service]:>7.0f} ms")
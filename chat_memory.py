@@ -0,0 +1,127 @@
+# chat_memory.py
+# Token-budgeted conversation memory for the chatbot step.
+#
+# The last few turns are sent verbatim. Turns that fall out of that window are folded, once,
+# into a rolling summary that is sent as a second system message. A hard per-request token
+# budget is enforced locally before the request goes out, so prompt size (and cost) stays flat
+# no matter how long the conversation runs.
+
+try:
+    import tiktoken
+    _encoding = tiktoken.encoding_for_model("gpt-4")
+except Exception:  # tiktoken missing or its BPE file can't be fetched
+    _encoding = None
+
+# Per-message framing tokens in the chat format (role, separators)
+MESSAGE_OVERHEAD_TOKENS = 4
+REPLY_PRIMING_TOKENS = 3
+
+
+# --- Local token counting ---
+def count_tokens(text):
+    if not text:
+        return 0
+    if _encoding is not None:
+        return len(_encoding.encode(text))
+    return (len(text) + 3) // 4  # ~4 characters per token for English
+
+
+def truncate_to_tokens(text, max_tokens):
+    if max_tokens <= 0:
+        return ""
+    if _encoding is not None:
+        tokens = _encoding.encode(text)
+        return text if len(tokens) <= max_tokens else _encoding.decode(tokens[-max_tokens:])
+    return text[-max_tokens * 4:]
+
+
+def count_message_tokens(messages):
+    return sum(count_tokens(m["content"]) + MESSAGE_OVERHEAD_TOKENS for m in messages) + REPLY_PRIMING_TOKENS
+
+
+# --- chat_history turn -> chat messages ---
+def turn_to_messages(turn):
+    messages = [{"role": "assistant", "content": turn["ai"]}]
+    if "user" in turn:
+        messages.append({"role": "user", "content": turn["user"]})
+    return messages
+
+
+def turn_to_text(turn):
+    lines = []
+    if "user" in turn:
+        lines.append(f"Student: {turn['user']}")
+    lines.append(f"AI: {turn['ai']}")
+    return "\n".join(lines)
+
+
+# Fallback summarizer: keep the tail of what was said, bounded in size
+def truncating_summarizer(previous_summary, turns_text, max_tokens):
+    combined = f"{previous_summary}\n{turns_text}".strip()
+    return truncate_to_tokens(combined, max_tokens)
+
+
+class ConversationMemory:
+    # summary_state is a plain dict kept in st.session_state so the rolling summary survives
+    # reruns: {"text": <summary so far>, "upto": <number of turns already folded in>}
+    def __init__(self, recent_turns=4, token_budget=3000, summary_max_tokens=300, summarizer=None):
+        self.recent_turns = recent_turns
+        self.token_budget = token_budget
+        self.summary_max_tokens = summary_max_tokens
+        self.summarizer = summarizer or truncating_summarizer
+
+    def _roll_summary(self, chat_history, summary_state):
+        fold_until = max(0, len(chat_history) - self.recent_turns)
+        if fold_until <= summary_state["upto"]:
+            return
+        turns_text = "\n".join(turn_to_text(t) for t in chat_history[summary_state["upto"]:fold_until])
+        try:
+            summary = self.summarizer(summary_state["text"], turns_text, self.summary_max_tokens)
+        except Exception as e:
+            print(f"[CHAT MEMORY] Summarizer failed, truncating instead: {e}")
+            summary = truncating_summarizer(summary_state["text"], turns_text, self.summary_max_tokens)
+        summary_state["text"] = truncate_to_tokens(summary, self.summary_max_tokens)
+        summary_state["upto"] = fold_until
+
+    # --- Assemble the thread for one request ---
+    # Returns (messages, prompt_tokens). system_tokens, when the caller already knows it
+    # (chat_prompts.render_system_message), saves re-tokenizing the system prompt.
+    def build_messages(self, system_message, chat_history, user_input, summary_state, system_tokens=None):
+        self._roll_summary(chat_history, summary_state)
+        head_tokens = (count_tokens(system_message) if system_tokens is None else system_tokens) + MESSAGE_OVERHEAD_TOKENS
+
+        def measure(messages):
+            return head_tokens + count_message_tokens(messages[1:])
+
+        head = [{"role": "system", "content": system_message}]
+        summary = summary_state["text"]
+        recent = chat_history[summary_state["upto"]:]
+        tail = [{"role": "user", "content": user_input}]
+
+        def assemble():
+            summary_messages = (
+                [{"role": "system", "content": f"Summary of the earlier conversation:\n{summary}"}]
+                if summary else []
+            )
+            turn_messages = [m for turn in recent for m in turn_to_messages(turn)]
+            return head + summary_messages + turn_messages + tail
+
+        messages = assemble()
+        prompt_tokens = measure(messages)
+
+        # Over budget: shed the oldest verbatim turns first, then shrink the summary
+        while prompt_tokens > self.token_budget and recent:
+            recent = recent[1:]
+            messages = assemble()
+            prompt_tokens = measure(messages)
+        if prompt_tokens > self.token_budget and summary:
+            summary = truncate_to_tokens(summary, count_tokens(summary) - (prompt_tokens - self.token_budget))
+            messages = assemble()
+            prompt_tokens = measure(messages)
+        if prompt_tokens > self.token_budget:
+            overflow = prompt_tokens - self.token_budget
+            tail[0]["content"] = truncate_to_tokens(user_input, count_tokens(user_input) - overflow)
+            messages = assemble()
+            prompt_tokens = measure(messages)
+
+        return messages, prompt_tokens
@@ -0,0 +1,119 @@
+# chat_prompts.py
+# System prompts and first-turn input for the reflection chat, shared by the Streamlit app
+# and the offline prompt-evaluation runner.
+#
+# The prompts come from `chat_templates` in goal_bank.yaml. Each tone x score band is compiled
+# once per process into static text pieces with named slots between them, and the tokens of the
+# static pieces are counted then. A request joins the pieces with the student's values, and its
+# prompt size is that precomputed count plus the tokens of those values.
+
+import string
+import threading
+from dataclasses import dataclass
+
+from chat_memory import count_tokens
+from goal_bank_loader import load_goal_bank
+
+SCORE_INTERPRETATIONS = {
+    4: "Met and exceeded",
+    3: "Met goal",
+    2: "Almost met",
+    1: "Tried but didn’t succeed",
+    0: "Didn’t attempt"
+}
+
+TONES = ["real_one", "drill_sergeant"]
+
+STATIC_BLOCKS = ("persona", "details", "score_behavior")
+
+
+class _KeepMissing(dict):
+    def __missing__(self, key):
+        return "{" + key + "}"
+
+
+@dataclass(frozen=True, slots=True)
+class PromptTemplate:
+    pieces: tuple        # ((literal, slot or None), ...)
+    static_tokens: int
+
+    def render(self, **values):
+        return "".join(literal + (values[slot] if slot else "") for literal, slot in self.pieces)
+
+    # Approximate: tokens can merge across a slot boundary, so this may be off by one per slot
+    def token_count(self, **values):
+        return self.static_tokens + sum(count_tokens(values[slot]) for _, slot in self.pieces if slot)
+
+
+def compile_template(text):
+    pieces = tuple((literal, field) for literal, field, _, _ in string.Formatter().parse(text))
+    return PromptTemplate(pieces, count_tokens("".join(literal for literal, _ in pieces)))
+
+
+class TemplateRegistry:
+    def __init__(self, cfg):
+        spec = cfg["chat_templates"]
+        self.bands = sorted(spec["score_bands"], key=lambda band: band["max_score"])
+        self.length_prefs = spec.get("length_prefs", {})
+        self.templates = {}  # (tone, band name) -> PromptTemplate
+        for tone, blocks in spec["tones"].items():
+            persona = blocks.get("persona") or cfg.get("gpt_prompts", {}).get(blocks.get("persona_prompt"), "")
+            for band in self.bands:
+                static = {"persona": persona.strip(), "details": blocks["details"].strip(),
+                          "score_behavior": band["instruction"].strip()}
+                # Blocks may themselves contain slots, so they go in before the band text
+                text = spec["layout"].format_map(_KeepMissing(persona=static["persona"], details=static["details"]))
+                text = text.format_map(_KeepMissing(score_behavior=static["score_behavior"]))
+                self.templates[(tone, band["name"])] = compile_template(text.strip())
+
+    def band_for(self, score_value):
+        for band in self.bands:
+            if score_value <= band["max_score"]:
+                return band["name"]
+        return self.bands[-1]["name"]
+
+    def template(self, tone, score_value):
+        band = self.band_for(score_value)
+        return self.templates.get((tone, band)) or self.templates[("real_one", band)]
+
+    def slot_values(self, goal, score_value, interpretation, reflection, background, length_pref=""):
+        # length_pref is a length_prefs key ("short"/"long") or already-written text
+        length_text = self.length_prefs.get(length_pref, length_pref)
+        return {
+            "goal": str(goal), "score_value": str(score_value), "interpretation": str(interpretation),
+            "reflection": str(reflection), "background": str(background),
+            "length_pref": f"\n{length_text}" if length_text else "",
+        }
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_template_registry():
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = TemplateRegistry(load_goal_bank())
+        return _registry
+
+
+# Returns (system message, its token count); the count needs no tokenizer pass over the static text
+def render_system_message(tone, goal, score_value, interpretation, reflection, background, length_pref=""):
+    registry = get_template_registry()
+    template = registry.template(tone, score_value)
+    values = registry.slot_values(goal, score_value, interpretation, reflection, background, length_pref)
+    return template.render(**values), template.token_count(**values)
+
+
+def build_system_message(tone, goal, score_value, interpretation, reflection, background, length_pref=""):
+    return render_system_message(tone, goal, score_value, interpretation, reflection, background, length_pref)[0]
+
+
+# First turn: the student's reflection stands in for their first message
+def build_first_turn_input(goal, score_value, interpretation, reflection):
+    return (
+        f"I was working on the goal: '{goal}'. "
+        f"I gave myself a score of {score_value} — {interpretation}. "
+        f"What helped or got in the way: {reflection}"
+    )
@@ -2,6 +2,9 @@
 
 import yaml
 
+# The goal bank's difficulty labels, easiest first
+DIFFICULTY_ORDER = ["easy", "moderate", "stretch"]
+
 def load_goal_bank(filepath="goal_bank.yaml"):
     with open(filepath, "r") as f:
         return yaml.safe_load(f)
@@ -0,0 +1,118 @@
+# goal_range_job.py
+# Nightly batch recompute of Students.GoalRange for every student.
+#
+# GoalRange is the span of goal difficulty a student is comfortable with, plus the goal
+# categories they do best in, e.g. "easy-moderate: partner, group". Nothing on the login path
+# infers it any more; the app just reads the column. This job computes it in bulk:
+#
+#   1. Students and GoalHistory for each shard come back in one values_batch_get.
+#   2. GoalHistory is joined with the goal bank's difficulty and category in pandas.
+#   3. Only each student's last RECENT_GOALS goals count. Of those, the goals they met
+#      (GoalAchievement 3 or 4) give the min and max difficulty, and the categories they met
+#      most often. All of this is groupby aggregates, with no per-student loop.
+#   4. The whole GoalRange column of each shard's Students sheet is rewritten in one ranged
+#      update. Students with nothing to infer keep what they had.
+#
+#   python goal_range_job.py --dry-run
+#   python goal_range_job.py          # e.g. from cron: 15 2 * * *
+
+import argparse
+
+import numpy as np
+import pandas as pd
+from gspread.utils import rowcol_to_a1
+
+from goal_bank_loader import DIFFICULTY_ORDER, load_goal_bank
+from google_sheets import get_sheet, query_all_shards, read_shard
+from records import normalize_id
+from shared_cache import bump_sheet
+
+RECENT_GOALS = 10    # a student's comfort zone moves; older goals stop counting
+TOP_CATEGORIES = 2
+MET_SCORE = 3
+
+
+def goal_bank_frame(cfg):
+    bank = pd.DataFrame(cfg["goals"], columns=["text", "difficulty", "category"])
+    bank["text"] = bank["text"].astype(str).str.strip()
+    bank["level"] = bank["difficulty"].map({d: i for i, d in enumerate(DIFFICULTY_ORDER)})
+    return bank.dropna(subset=["level"]).drop_duplicates("text")
+
+
+# history: GoalHistory records (dicts, sheet order). Returns a Series of GoalRange by StudentID.
+def compute_goal_ranges(history, bank):
+    frame = pd.DataFrame(history, columns=["StudentID", "Goal", "GoalAchievement"])
+    if frame.empty:
+        return pd.Series(dtype=object)
+    frame["StudentID"] = frame["StudentID"].map(normalize_id)
+    frame["Goal"] = frame["Goal"].astype(str).str.strip()
+    frame["score"] = pd.to_numeric(frame["GoalAchievement"], errors="coerce")
+    frame = frame[frame["StudentID"] != ""]
+
+    recent = frame[frame.groupby("StudentID").cumcount(ascending=False) < RECENT_GOALS]
+    met = recent[recent["score"] >= MET_SCORE].merge(bank, left_on="Goal", right_on="text", how="inner")
+    if met.empty:
+        return pd.Series(dtype=object)
+
+    levels = met.groupby("StudentID")["level"].agg(["min", "max"]).astype(int)
+    names = np.array(DIFFICULTY_ORDER, dtype=object)
+    low, high = names[levels["min"].to_numpy()], names[levels["max"].to_numpy()]
+    span = np.where(levels["min"].to_numpy() == levels["max"].to_numpy(), low, low + "-" + high)
+
+    # Most-met categories first; ties go to the category met most recently
+    met["order"] = np.arange(len(met))
+    categories = (
+        met.groupby(["StudentID", "category"])["order"].agg(["size", "max"])
+        .reset_index()
+        .sort_values(["StudentID", "size", "max"], ascending=[True, False, False])
+        .groupby("StudentID").head(TOP_CATEGORIES)
+        .groupby("StudentID")["category"].agg(", ".join)
+    )
+    ranges = pd.Series(span, index=levels.index, dtype=object)
+    return ranges.str.cat(categories.reindex(ranges.index).fillna(""), sep=": ").str.rstrip(": ")
+
+
+# One ranged update per shard: the whole GoalRange column, top to bottom
+def write_goal_ranges(shard, students, ranges, dry_run=False):
+    if not students:
+        return 0
+    headers = list(students[0][1].keys())
+    if "GoalRange" not in headers:
+        print(f"[GOAL RANGE] {shard}: Students has no GoalRange column, skipped")
+        return 0
+
+    current = [str(record.get("GoalRange", "")) for _, record in students]
+    ids = [normalize_id(record.get("StudentID", "")) for _, record in students]
+    column = ranges.reindex(ids).to_numpy(dtype=object)
+    values = [new if isinstance(new, str) and new else old for new, old in zip(column, current)]
+    changed = sum(new != old for new, old in zip(values, current))
+
+    print(f"[GOAL RANGE] {shard}: {changed} of {len(values)} students {'would change' if dry_run else 'updated'}")
+    if changed and not dry_run:
+        col = headers.index("GoalRange") + 1
+        first_row, last_row = students[0][0], students[-1][0]
+        sheet = get_sheet("Students", shard)
+        sheet.update(
+            values=[[v] for v in values],
+            range_name=f"{rowcol_to_a1(first_row, col)}:{rowcol_to_a1(last_row, col)}",
+        )
+        bump_sheet(shard, "Students")  # every cached student row in this shard is now stale
+    return changed
+
+
+def run(dry_run=False):
+    bank = goal_bank_frame(load_goal_bank())
+    shards = query_all_shards(lambda shard: read_shard(shard, ("Students", "GoalHistory")))
+
+    changed = 0
+    for shard, sheets in shards.items():
+        ranges = compute_goal_ranges([record for _, record in sheets["GoalHistory"]], bank)
+        changed += write_goal_ranges(shard, sheets["Students"], ranges, dry_run)
+    return changed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Recompute Students.GoalRange from GoalHistory.")
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+    run(args.dry_run)
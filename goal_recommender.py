@@ -0,0 +1,255 @@
+# goal_recommender.py
+# Local goal recommendations from the goal bank and GoalHistory.
+#
+# Every goal text and every past OutcomeReflection is embedded once. If sentence-transformers
+# is installed the embeddings come from a small CPU model; otherwise they are TF-IDF vectors.
+# Embedding runs in a process pool. The vectors are L2-normalised rows of a NumPy matrix and are
+# cached in .goal_index.npz, keyed by a hash of the input texts.
+#
+# A "transition" is a student's reflection on one goal, followed by the next goal they set and
+# then met (GoalAchievement 3 or 4). Recommending for a new reflection is one matrix-vector
+# product over all transitions plus an argpartition for the top k. Each neighbour votes for the
+# goal it moved to, weighted by similarity. Goals whose text itself matches the reflection get a
+# smaller boost, so goals nobody has moved to yet can still rank.
+#
+#   python goal_recommender.py --history goal_history.csv --reflection "I froze when the group talked"
+#   python goal_recommender.py --history sheets --goal "Goal 3: ..." --k 25
+
+import argparse
+import csv
+import hashlib
+import math
+import os
+import re
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date
+
+import numpy as np
+
+from goal_bank_loader import get_goal_text_list, load_goal_bank
+from records import GoalHistoryEntry
+
+CACHE_PATH = ".goal_index.npz"
+EMBEDDING_MODEL = "all-MiniLM-L6-v2"
+SUCCESS_SCORES = {3, 4}
+MAX_FEATURES = 4096     # TF-IDF vocabulary cap, keeps the dense matrix small
+GOAL_TEXT_WEIGHT = 0.3  # how much direct reflection-to-goal similarity counts next to neighbour votes
+
+_TOKEN = re.compile(r"[a-z0-9']+")
+
+
+def _tokens(text):
+    words = _TOKEN.findall(str(text).lower())
+    return words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+
+
+# --- Encoders ---
+# Both expose encode(texts) -> float32 matrix with unit-length rows, and are picklable
+# so the process pool can rebuild them in each worker.
+class TfidfEncoder:
+    name = "tfidf"
+
+    def __init__(self, corpus=None, vocabulary=None, idf=None):
+        if corpus is not None:
+            doc_freq = Counter(tok for text in corpus for tok in set(_tokens(text)))
+            kept = sorted(tok for tok, _ in doc_freq.most_common(MAX_FEATURES))
+            vocabulary = {tok: i for i, tok in enumerate(kept)}
+            n = len(corpus)
+            idf = np.array([math.log((1 + n) / (1 + doc_freq[tok])) + 1 for tok in kept], dtype=np.float32)
+        self.vocabulary = vocabulary or {}
+        self.idf = idf if idf is not None else np.zeros(0, dtype=np.float32)
+
+    def encode(self, texts):
+        matrix = np.zeros((len(texts), len(self.vocabulary)), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for tok, count in Counter(_tokens(text)).items():
+                col = self.vocabulary.get(tok)
+                if col is not None:
+                    matrix[row, col] = count
+        matrix *= self.idf
+        return _normalize(matrix)
+
+
+class SentenceEncoder:
+    name = EMBEDDING_MODEL
+
+    def __init__(self):
+        self._model = None
+
+    def __getstate__(self):
+        return {"_model": None}
+
+    def encode(self, texts):
+        if self._model is None:
+            from sentence_transformers import SentenceTransformer
+            self._model = SentenceTransformer(EMBEDDING_MODEL, device="cpu")
+        return self._model.encode(list(texts), normalize_embeddings=True).astype(np.float32)
+
+
+def _normalize(matrix):
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def make_encoder(corpus, backend="auto"):
+    if backend in ("auto", "model"):
+        try:
+            import sentence_transformers  # noqa: F401
+            return SentenceEncoder()
+        except ImportError:
+            if backend == "model":
+                raise
+            print("[RECOMMENDER] sentence-transformers not installed; using TF-IDF.")
+    return TfidfEncoder(corpus)
+
+
+# --- Process-pool embedding ---
+_worker_encoder = None
+
+
+def _init_worker(encoder):
+    global _worker_encoder
+    _worker_encoder = encoder
+
+
+def _encode_chunk(texts):
+    return _worker_encoder.encode(texts)
+
+
+def embed_texts(encoder, texts, workers=None, chunk_size=256):
+    if not texts:
+        return np.zeros((0, 0), dtype=np.float32)
+    chunks = [texts[i:i + chunk_size] for i in range(0, len(texts), chunk_size)]
+    if len(chunks) == 1 or workers == 1:
+        return np.vstack([encoder.encode(chunk) for chunk in chunks])
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(encoder,)) as pool:
+        return np.vstack(list(pool.map(_encode_chunk, chunks)))
+
+
+# --- Transitions out of GoalHistory ---
+def build_transitions(history):
+    by_student = {}
+    for row in history:
+        goal = GoalHistoryEntry.from_row(row)
+        if goal.student_id:
+            by_student.setdefault(goal.student_id, []).append(goal)
+
+    transitions = []
+    for student_id, goals in by_student.items():
+        goals.sort(key=lambda g: g.goal_set_date or date.min)
+        for prev, nxt in zip(goals, goals[1:]):
+            reflection = prev.outcome_reflection.strip()
+            if not reflection or reflection.startswith("["):
+                continue  # "[first goal]" placeholders carry nothing to match on
+            if nxt.score not in SUCCESS_SCORES:
+                continue
+            transitions.append({
+                "student_id": student_id,
+                "reflection": reflection,
+                "from_goal": prev.goal.strip(),
+                "to_goal": nxt.goal.strip(),
+            })
+    return transitions
+
+
+def _fingerprint(backend, goal_texts, transitions):
+    digest = hashlib.sha256(backend.encode())
+    for text in goal_texts:
+        digest.update(b"\x00g" + text.encode())
+    for t in transitions:
+        digest.update(b"\x00t" + "\x1f".join([t["reflection"], t["from_goal"], t["to_goal"]]).encode())
+    return digest.hexdigest()
+
+
+class GoalRecommender:
+    def __init__(self, goal_texts, encoder, goal_matrix, reflection_matrix, from_goal, to_goal):
+        self.goal_texts = list(goal_texts)
+        self.encoder = encoder
+        self.goal_matrix = goal_matrix              # goals × dim
+        self.reflection_matrix = reflection_matrix  # transitions × dim
+        self.from_goal = from_goal                  # goal index per transition, -1 if off the bank
+        self.to_goal = to_goal                      # goal index per transition
+
+    @classmethod
+    def build(cls, goal_texts, history, backend="auto", cache_path=CACHE_PATH, workers=None):
+        goal_texts = list(goal_texts)
+        goal_index = {text: i for i, text in enumerate(goal_texts)}
+        transitions = [t for t in build_transitions(history) if t["to_goal"] in goal_index]
+        reflections = [t["reflection"] for t in transitions]
+
+        encoder = make_encoder(goal_texts + reflections, backend)
+        fingerprint = _fingerprint(encoder.name, goal_texts, transitions)
+        from_goal = np.array([goal_index.get(t["from_goal"], -1) for t in transitions], dtype=np.int32)
+        to_goal = np.array([goal_index[t["to_goal"]] for t in transitions], dtype=np.int32)
+
+        if cache_path and os.path.exists(cache_path):
+            cached = np.load(cache_path, allow_pickle=False)
+            if str(cached["fingerprint"]) == fingerprint:
+                print(f"[RECOMMENDER] Loaded {len(transitions)} transitions from {cache_path}")
+                return cls(goal_texts, encoder, cached["goals"], cached["reflections"], from_goal, to_goal)
+
+        goal_matrix = embed_texts(encoder, goal_texts, workers)
+        reflection_matrix = embed_texts(encoder, reflections, workers) if reflections else \
+            np.zeros((0, goal_matrix.shape[1]), dtype=np.float32)
+        if cache_path:
+            tmp_path = cache_path + ".tmp.npz"
+            np.savez(tmp_path, fingerprint=np.array(fingerprint), goals=goal_matrix, reflections=reflection_matrix)
+            os.replace(tmp_path, cache_path)
+        print(f"[RECOMMENDER] Embedded {len(goal_texts)} goals and {len(transitions)} transitions")
+        return cls(goal_texts, encoder, goal_matrix, reflection_matrix, from_goal, to_goal)
+
+    # Returns [(goal_text, score, supporting_neighbours), ...], best first
+    def recommend(self, reflection, current_goal=None, k=25, top_n=3, exclude_current=True):
+        query = self.encoder.encode([reflection])[0]
+        scores = GOAL_TEXT_WEIGHT * (self.goal_matrix @ query)
+        support = np.zeros(len(self.goal_texts), dtype=np.int32)
+
+        current = self.goal_texts.index(current_goal) if current_goal in self.goal_texts else -1
+        if len(self.to_goal):
+            sims = self.reflection_matrix @ query
+            if current >= 0:
+                sims = sims + 0.1 * (self.from_goal == current)  # neighbours coming off the same goal count more
+            k = min(k, len(sims))
+            top = np.argpartition(-sims, k - 1)[:k]
+            weights = np.clip(sims[top], 0, None)
+            scores += np.bincount(self.to_goal[top], weights=weights, minlength=len(self.goal_texts))
+            support += np.bincount(self.to_goal[top], minlength=len(self.goal_texts)).astype(np.int32)
+
+        if exclude_current and current >= 0:
+            scores[current] = -np.inf
+        order = np.argsort(-scores)[:top_n]
+        return [(self.goal_texts[i], float(scores[i]), int(support[i])) for i in order]
+
+
+def load_history(source):
+    if source == "sheets":
+        from google_sheets import get_all_records_all_shards  # needs Streamlit secrets; only for live history
+        return get_all_records_all_shards("GoalHistory")
+    with open(source, "r", newline="") as f:
+        return list(csv.DictReader(f))
+
+
+def build_recommender(history_source="sheets", backend="auto", workers=None):
+    return GoalRecommender.build(get_goal_text_list(load_goal_bank()), load_history(history_source),
+                                 backend=backend, workers=workers)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Recommend next goals from similar students' successes.")
+    parser.add_argument("--history", default="sheets", help="'sheets' for the live GoalHistory, or a .csv export")
+    parser.add_argument("--backend", choices=["auto", "model", "tfidf"], default="auto")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--reflection", required=True)
+    parser.add_argument("--goal", default=None, help="the student's current goal text")
+    parser.add_argument("--k", type=int, default=25)
+    args = parser.parse_args()
+
+    recommender = build_recommender(args.history, args.backend, args.workers)
+    start = time.perf_counter()
+    results = recommender.recommend(args.reflection, current_goal=args.goal, k=args.k)
+    print(f"[RECOMMENDER] Query took {(time.perf_counter() - start) * 1000:.2f} ms")
+    for goal, score, support in results:
+        print(f"{score:6.3f}  ({support} similar students)  {goal}")
@@ -1,21 +1,85 @@
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
 import gspread
+import yaml
+from gspread.utils import rowcol_to_a1
 from oauth2client.service_account import ServiceAccountCredentials
 import streamlit as st
 
+from records import CHAT_LOG_COLUMNS, id_forms, normalize_id
+from shared_cache import bump_sheet, bump_student, cached, versioned_key
+from transport import tune_gspread_client
+
+SHARD_CONFIG_PATH = "sheet_shards.yaml"
+SHEETS_TIMEOUT = 10  # seconds per HTTP request
+
 # --- Connect to Google Sheets ---
-def connect_to_sheets():
+# One authorized client per process; opening it per call meant a fresh auth and HTTP
+# session for every read.
+_client = None
+_handles = {}  # (shard, sheet_name) -> Worksheet
+_handles_lock = threading.Lock()
+
+def service_account_credentials():
     scope = ['https://spreadsheets.google.com/feeds', 'https://www.googleapis.com/auth/drive']
-    creds = ServiceAccountCredentials.from_json_keyfile_dict(
-        st.secrets["google_service_account"], scope)
-    client = gspread.authorize(creds)
-    return client
+    return ServiceAccountCredentials.from_json_keyfile_dict(st.secrets["google_service_account"], scope)
+
+def connect_to_sheets():
+    global _client
+    with _handles_lock:
+        if _client is None:
+            _client = tune_gspread_client(gspread.authorize(service_account_credentials()))  # pooled keep-alive (transport.py)
+            _client.set_timeout(SHEETS_TIMEOUT)  # fail instead of hanging when the school network drops
+        return _client
+
+
+# --- Shard routing ---
+# sheet_shards.yaml maps StudentID prefixes and class sections to spreadsheets.
+_shard_config = None
+
+def load_shard_config(filepath=SHARD_CONFIG_PATH):
+    global _shard_config
+    if _shard_config is None:
+        with open(filepath, "r") as f:
+            _shard_config = yaml.safe_load(f)
+    return _shard_config
+
+def shard_names():
+    return list(load_shard_config()["shards"].keys())
+
+def default_shard():
+    return load_shard_config()["default_shard"]
+
+def shard_for_student(student_id):
+    config = load_shard_config()
+    clean_id = normalize_id(student_id)
+    best = None
+    for prefix, shard in (config.get("id_prefixes") or {}).items():
+        if clean_id.startswith(str(prefix)) and (best is None or len(str(prefix)) > len(best[0])):
+            best = (str(prefix), shard)
+    return best[1] if best else config["default_shard"]
+
+def shard_for_section(section):
+    config = load_shard_config()
+    return (config.get("sections") or {}).get(section, config["default_shard"])
+
+
+def get_sheet(sheet_name, shard=None):
+    shard = shard or default_shard()
+    key = (shard, sheet_name)
+    if key in _handles:
+        return _handles[key]
 
-def get_sheet(sheet_name):
     client = connect_to_sheets()
 
     # --- RECOMMENDED: Open by spreadsheet ID for stability ---
-    spreadsheet = client.open_by_key("1UCV4mKpdJPUy8ywZlkicI-5YZAoRWV6REsF3dz7EgAI")
-    return spreadsheet.worksheet(sheet_name)
+    spreadsheet = client.open_by_key(load_shard_config()["shards"][shard])
+    worksheet = spreadsheet.worksheet(sheet_name)
+    with _handles_lock:
+        _handles[key] = worksheet
+    return worksheet
 
     # --- ALTERNATIVE (not recommended): Open by spreadsheet name ---
     # This method uses the Google Drive API to search by title.
@@ -25,15 +89,75 @@ def get_sheet(sheet_name):
     # spreadsheet = client.open("GoalReflectionApp_StudentData")
     # return spreadsheet.worksheet(sheet_name)
 
+def get_student_sheet(sheet_name, student_id):
+    return get_sheet(sheet_name, shard_for_student(student_id))
+
+
+# --- Reads through the shared cache (shared_cache.py) ---
+# Header rows rarely change, so they're cached for a day; a sheet version bump still
+# invalidates them.
+def get_headers(sheet_name, shard=None):
+    shard = shard or default_shard()
+    return cached(
+        versioned_key("headers", shard, sheet_name),
+        lambda: get_sheet(sheet_name, shard).row_values(1),
+        ttl=86400
+    )
+
+
+# --- Whole-sheet reads ---
+# From the in-memory replica (sheet_sync.py) when SHEET_SYNC_INTERVAL is set, else from the API
+def _all_records(sheet_name, shard):
+    from sheet_sync import replica_records
+    records = replica_records(sheet_name, shard)
+    return records if records is not None else get_sheet(sheet_name, shard).get_all_records()
+
+# This process's own writes, so the replica's next read includes them
+def _note_write(shard, sheet_name, append=False):
+    from sheet_sync import note_write
+    note_write(shard, sheet_name, append)
+
+
+# --- Cross-shard queries (district-wide reports) ---
+# Runs fn(shard) for every shard in parallel; returns {shard: result}.
+def query_all_shards(fn, max_workers=8):
+    shards = shard_names()
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(shards))) as pool:
+        return dict(zip(shards, pool.map(fn, shards)))
+
+def get_all_records_all_shards(sheet_name):
+    results = query_all_shards(lambda shard: _all_records(sheet_name, shard))
+    records = []
+    for shard, rows in results.items():
+        for row in rows:
+            row["_shard"] = shard
+            records.append(row)
+    return records
+
+
+# --- Batched reads ---
+# Returns {sheet_name: [(row_number, record), ...]} for one shard, from a single request.
+def read_shard(shard, sheet_names=("Students", "GoalHistory", "Chats")):
+    spreadsheet = get_sheet("Students", shard).spreadsheet
+    response = spreadsheet.values_batch_get([f"'{name}'!A1:Z" for name in sheet_names])
+    sheets = {}
+    for name, value_range in zip(sheet_names, response.get("valueRanges", [])):
+        values = value_range.get("values", [])
+        headers = CHAT_LOG_COLUMNS if name == "Chats" else (values[0] if values else [])
+        sheets[name] = [
+            (row_num, {h: (row[i] if i < len(row) else "") for i, h in enumerate(headers)})
+            for row_num, row in enumerate(values[1:], start=2)
+        ]
+    return sheets
 
 # --- Add new student if they don't exist ---
 def create_student_if_missing(student_id, nickname="", pronoun_code="", tone="Reflective"):
-    sheet = get_sheet("Students")
+    sheet = get_student_sheet("Students", student_id)
     existing = get_student_info(student_id)
     if existing:
         return False  # already exists
 
-    headers = sheet.row_values(1)
+    headers = get_headers("Students", shard_for_student(student_id))
     row_data = {
         "StudentID": student_id,
         "Nickname": nickname,
@@ -42,37 +166,45 @@ def create_student_if_missing(student_id, nickname="", pronoun_code="", tone="Re
         "CurrentGoal": "",
         "CurrentSuccessMeasures": "",
         "CurrentGoalSetDate": "",
-        "GoalRange": "",  # will be inferred later
-        "BackgroundInfo": ""  # will be inferred later
+        "GoalRange": "",  # filled by the nightly goal_range_job.py
+        "BackgroundInfo": ""  # filled in the background from reflections (background_summary.py)
     }
     row = [row_data.get(col, "") for col in headers]
     sheet.append_row(row)
+    _note_write(shard_for_student(student_id), "Students", append=True)
+    bump_student(shard_for_student(student_id), "Students", student_id)
     return True
 
 
 
 # --- Fetch student info from "Students" sheet by StudentID ---
 def get_student_info(student_id):
-    sheet = get_sheet("Students")
-    records = sheet.get_all_records()
-    for row in records:
-        if str(row["StudentID"]).strip() == str(student_id).strip():
-            return row
-    return None
+    def load():
+        records = _all_records("Students", shard_for_student(student_id))
+        forms = id_forms(student_id)
+        for row in records:
+            if str(row["StudentID"]).strip() in forms:
+                return row
+        return None
+    return cached(versioned_key("student", shard_for_student(student_id), "Students", student_id), load)
 
 # --- Append a new row to GoalHistory ---
 def add_goal_history_entry(entry_dict):
-    sheet = get_sheet("GoalHistory")
-    headers = sheet.row_values(1)
+    student_id = entry_dict.get("StudentID", "")
+    sheet = get_student_sheet("GoalHistory", student_id)
+    headers = get_headers("GoalHistory", shard_for_student(student_id))
     row = [entry_dict.get(header, "") for header in headers]
     sheet.append_row(row)
+    _note_write(shard_for_student(student_id), "GoalHistory", append=True)
+    bump_student(shard_for_student(student_id), "GoalHistory", student_id)
 
 # --- Update the student’s current goal and related info ---
 def update_student_current_goal(student_id, new_goal, new_success_measures, set_date, goal_range=None, background_info=None):
-    sheet = get_sheet("Students")
+    sheet = get_student_sheet("Students", student_id)
     records = sheet.get_all_records()
+    forms = id_forms(student_id)
     for i, row in enumerate(records):
-        if str(row["StudentID"]).strip() == str(student_id).strip():
+        if str(row["StudentID"]).strip() in forms:
             row_num = i + 2  # account for header row
             sheet.update_cell(row_num, 5, new_goal)               # CurrentGoal
             sheet.update_cell(row_num, 6, new_success_measures)   # CurrentSuccessMeasures
@@ -81,31 +213,122 @@ def update_student_current_goal(student_id, new_goal, new_success_measures, set_
                 sheet.update_cell(row_num, 8, goal_range)         # GoalRange
             if background_info is not None:
                 sheet.update_cell(row_num, 9, background_info)    # BackgroundInfo
+            _note_write(shard_for_student(student_id), "Students")
+            bump_student(shard_for_student(student_id), "Students", student_id)
             return True
     return False
 
 # -- goal history --
 def get_goal_history_for_student(student_id):
-    sheet = get_sheet("GoalHistory")
-    records = sheet.get_all_records()
-    return [row for row in records if str(row["StudentID"]).strip() == str(student_id).strip()]
+    def load():
+        records = _all_records("GoalHistory", shard_for_student(student_id))
+        forms = id_forms(student_id)
+        return [row for row in records if str(row["StudentID"]).strip() in forms]
+    return cached(versioned_key("history", shard_for_student(student_id), "GoalHistory", student_id), load)
 
+
+# Chats has no header lookup on write; columns are positional (records.CHAT_LOG_COLUMNS)
 def add_chat_log_entry(entry: dict):
-    sheet = get_sheet("Chats")
-    sheet.append_row([
-        entry.get("StudentID", ""),
-        entry.get("Timestamp", ""),
-        entry.get("CurrentGoal", ""),
-        entry.get("SuccessMeasures", ""),
-        entry.get("OutcomeReflection", ""),
-        entry.get("GoalAchievement", ""),
-        entry.get("Reflection", ""),
-        entry.get("Tone", ""),
-        entry.get("ChatHistory.json", ""),
-        entry.get("UserType", ""),
-        entry.get("Try", ""),
-        entry.get("Engage", ""),
-        entry.get("ToneQ", ""),              # student's response about tone
-        entry.get("ChangeQ", "")             # student's suggestion for improvement
-    ])
+    sheet = get_student_sheet("Chats", entry.get("StudentID", ""))
+    sheet.append_row([entry.get(column, "") for column in CHAT_LOG_COLUMNS])
+    _note_write(shard_for_student(entry.get("StudentID", "")), "Chats", append=True)
+
+
+# --- A reflection: GoalHistory append + Students cells in one batchUpdate (reflection_commit.py) ---
+# retry=True when an earlier attempt may have landed (offline.py's queue replays pass it)
+def commit_reflection(student_id, history_entry=None, student_fields=None, retry=False):
+    from reflection_commit import ReflectionCommit
+    commit = ReflectionCommit(student_id).update_student(**(student_fields or {}))
+    if history_entry is not None:
+        commit.append_history(history_entry)
+    return commit.commit(retry=retry)
+
+
+# --- Read only the rows appended after a known row number ---
+# Returns (rows, last_row). Each row is a dict keyed by header, plus its sheet row number
+# under "_row". Header and new rows come back in one batched read.
+def get_rows_after(sheet_name, last_row, shard=None):
+    sheet = get_sheet(sheet_name, shard)
+    last_col = rowcol_to_a1(1, sheet.col_count).rstrip("0123456789")
+    start_row = max(last_row, 1) + 1
+    try:
+        header_range, new_range = sheet.batch_get([f"A1:{last_col}1", f"A{start_row}:{last_col}"])
+    except gspread.exceptions.APIError as e:
+        if "exceeds grid limits" in str(e):
+            return [], last_row  # nothing has been appended past the sheet's current grid
+        raise
+    headers = header_range[0] if header_range else []
+
+    rows = []
+    for offset, values in enumerate(new_range):
+        row = {header: (values[i] if i < len(values) else "") for i, header in enumerate(headers)}
+        row["_row"] = start_row + offset
+        rows.append(row)
+    return rows, start_row + len(new_range) - 1
+
+# --- Write several Students fields for many students in one request ---
+# updates: {student_id: {"ColumnName": value, ...}}. One request per shard touched.
+# Returns how many students were found and updated; ids with no Students row are skipped.
+def batch_update_student_fields(updates):
+    by_shard = defaultdict(dict)
+    for student_id, fields in updates.items():
+        by_shard[shard_for_student(student_id)][student_id] = fields
+    return sum(batch_update_shard_students(shard, shard_updates) for shard, shard_updates in by_shard.items())
+
+# Same, for students already known to be in one shard (e.g. read from it by section)
+def batch_update_shard_students(shard, updates):
+    sheet = get_sheet("Students", shard)
+    headers = get_headers("Students", shard)
+    ids = sheet.col_values(headers.index("StudentID") + 1)
+    row_by_id = {normalize_id(v): i + 1 for i, v in enumerate(ids) if i > 0}
+
+    data = []
+    applied = []
+    for student_id, fields in updates.items():
+        row_num = row_by_id.get(normalize_id(student_id))
+        if row_num is None:
+            continue
+        applied.append(student_id)
+        for column, value in fields.items():
+            data.append({
+                "range": rowcol_to_a1(row_num, headers.index(column) + 1),
+                "values": [[value]]
+            })
+    if data:
+        sheet.batch_update(data)
+        _note_write(shard, "Students")
+        for student_id in applied:
+            bump_student(shard, "Students", student_id)
+    return len(applied)
+
+# --- Delete many rows in one request ---
+# Rows are removed bottom-up so earlier deletions don't shift later ones.
+def delete_rows_batch(sheet, row_numbers):
+    ranges = []
+    for row_num in sorted(set(row_numbers)):
+        if ranges and ranges[-1][1] == row_num - 1:
+            ranges[-1][1] = row_num
+        else:
+            ranges.append([row_num, row_num])
+    requests = [
+        {"deleteDimension": {"range": {
+            "sheetId": sheet.id,
+            "dimension": "ROWS",
+            "startIndex": start - 1,
+            "endIndex": end
+        }}}
+        for start, end in reversed(ranges)
+    ]
+    if requests:
+        sheet.spreadsheet.batch_update({"requests": requests})
+        _note_write(_shard_of(sheet), sheet.title)
+        bump_sheet(_shard_of(sheet), sheet.title)  # cached rows/slices from this sheet may be gone
+    return len(ranges)
+
 
+def _shard_of(sheet):
+    with _handles_lock:
+        for (shard, sheet_name), handle in _handles.items():
+            if handle is sheet:
+                return shard
+    return default_shard()
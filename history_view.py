@@ -0,0 +1,222 @@
+# history_view.py
+# A student's past goals and scores, for the history timeline in the app.
+#
+# Rendering get_goal_history_for_student() would scan the whole GoalHistory sheet, and the page
+# would grow with the student's history. Instead the timeline loads in two stages:
+#
+#   - Summary: goal count, current streak and the last SUMMARY_SIZE goals. These come from a
+#     per-shard index in the shared cache. The index is kept current from the rows appended
+#     since it was last updated (google_sheets.get_rows_after), so no read rescans the sheet.
+#     The index also keeps the sheet row number of each of the student's goals.
+#   - Older pages: read on request, PAGE_SIZE goals at a time, with one batched range read
+#     of exactly those rows. The app keeps loaded pages in session state.
+#
+# The index key embeds the GoalHistory sheet version. Deleting rows (dedupe, archiving) bumps
+# that version, so row numbers from before the delete are never used. The next read rebuilds
+# the index with one full read of the sheet.
+#
+#   python history_view.py      # rebuild every shard's index, e.g. after archive_sheets.py
+
+import threading
+import time
+
+from gspread.utils import rowcol_to_a1
+
+from google_sheets import get_headers, get_rows_after, get_sheet, shard_for_student, shard_names
+from records import GoalHistoryEntry, normalize_id
+from shared_cache import get_shared_cache, versioned_key
+
+SUMMARY_SIZE = 5
+PAGE_SIZE = 5
+MET_SCORE = 3                # same bar as goal_range_job.py: 3 or 4 keeps a streak going
+INDEX_REFRESH_SECONDS = 60   # how long one process trusts its copy before checking for new rows
+INDEX_TTL = 86400            # bounds staleness from edits made directly in the spreadsheet
+
+
+# --- Index entries: one per student ---
+def new_entry():
+    return {"rows": [], "recent": [], "streak": 0, "last_row": 0}
+
+
+# Index entries live in the shared cache as JSON, so they keep plain dicts
+def _display(goal):
+    return {
+        "date": goal.goal_set_date.isoformat() if goal.goal_set_date else "",
+        "goal": goal.goal.strip(),
+        "score": goal.score,
+    }
+
+
+# rows: [(sheet row number, GoalHistoryEntry)]. Rows already in the entry are skipped, so
+# applying the same new rows twice (two replicas racing) changes nothing.
+def apply_rows(entry, rows):
+    for row_num, goal in sorted(rows, key=lambda r: r[0]):
+        if row_num <= entry["last_row"]:
+            continue
+        entry["rows"].append(row_num)
+        entry["recent"].append(_display(goal))
+        del entry["recent"][:-SUMMARY_SIZE]
+        if goal.score is not None:  # "[first goal]" rows neither extend nor break a streak
+            entry["streak"] = entry["streak"] + 1 if goal.score >= MET_SCORE else 0
+        entry["last_row"] = row_num
+    return entry
+
+
+def summarize(entry):
+    older = max(len(entry["rows"]) - len(entry["recent"]), 0)
+    return {
+        "count": len(entry["rows"]),
+        "streak": entry["streak"],
+        "recent": list(reversed(entry["recent"])),  # newest first
+        "pages": -(-older // PAGE_SIZE),
+    }
+
+
+# Row numbers of one page of older goals, newest first
+def page_rows(entry, page):
+    older = entry["rows"][:max(len(entry["rows"]) - len(entry["recent"]), 0)]
+    newest_first = older[::-1]
+    return newest_first[page * PAGE_SIZE:(page + 1) * PAGE_SIZE]
+
+
+# --- The per-shard index ---
+# Shared cache value: {"upto": last GoalHistory row read, "students": {student_id: entry}}.
+# Each process also keeps its own copy for INDEX_REFRESH_SECONDS, so a rerun costs no cache read.
+_local = {}  # shard -> {"key", "index", "checked", "versions"}
+_local_lock = threading.Lock()
+
+
+def _index_key(shard):
+    return versioned_key("history_index", shard, "GoalHistory")
+
+
+# recheck: look for new rows now, even if this process checked recently
+# rebuild: ignore the cached index and read the whole sheet again
+def refresh_index(shard, recheck=False, rebuild=False):
+    key = _index_key(shard)
+    with _local_lock:
+        memo = _local.get(shard)
+        if (not recheck and not rebuild and memo and memo["key"] == key
+                and time.time() - memo["checked"] < INDEX_REFRESH_SECONDS):
+            return memo["index"]
+
+    cache = get_shared_cache()
+    index = None
+    if not rebuild:
+        # With the shared cache off, this process's own copy is still good to extend
+        index = _cache_get(cache, key) or (memo["index"] if memo and memo["key"] == key else None)
+    index = index or {"upto": 1, "students": {}}  # row 1 is the header
+
+    rows, last_row = get_rows_after("GoalHistory", index["upto"], shard)
+    by_student = {}
+    for row in rows:
+        goal = GoalHistoryEntry.from_row(row)
+        if goal.student_id:
+            by_student.setdefault(goal.student_id, []).append((row["_row"], goal))
+    for student_id, student_rows in by_student.items():
+        apply_rows(index["students"].setdefault(student_id, new_entry()), student_rows)
+    if rows or rebuild:
+        print(f"[HISTORY] {shard}: indexed {len(rows)} new GoalHistory rows (through row {last_row})")
+        index["upto"] = last_row
+        _cache_set(cache, key, index)
+
+    with _local_lock:
+        versions = memo["versions"] if memo and memo["key"] == key else {}
+        _local[shard] = {"key": key, "index": index, "checked": time.time(), "versions": versions}
+    return index
+
+
+def _cache_get(cache, key):
+    try:
+        return cache.get(key)
+    except Exception as e:
+        print(f"[HISTORY] Shared cache read failed: {e}")
+        return None
+
+
+def _cache_set(cache, key, index):
+    try:
+        cache.set(key, index, INDEX_TTL)
+    except Exception as e:
+        print(f"[HISTORY] Shared cache write failed: {e}")
+
+
+def forget_index(shard):
+    with _local_lock:
+        _local.pop(shard, None)
+    _cache_set(get_shared_cache(), _index_key(shard), None)  # the next read rebuilds it
+
+
+# A student's own GoalHistory writes bump their version (google_sheets.bump_student). When it
+# moved since this process last looked, their new row is picked up without waiting out the refresh.
+def _entry_for(student_id):
+    clean_id = normalize_id(student_id)
+    shard = shard_for_student(clean_id)
+    version = versioned_key("history", shard, "GoalHistory", clean_id)
+    with _local_lock:
+        memo = _local.get(shard)
+        moved = memo is not None and memo["versions"].get(clean_id, version) != version
+    index = refresh_index(shard, recheck=moved)
+    with _local_lock:
+        _local[shard]["versions"][clean_id] = version
+    return shard, index["students"].get(clean_id, new_entry())
+
+
+# --- Reads the app uses ---
+def history_summary(student_id):
+    _, entry = _entry_for(student_id)
+    return summarize(entry)
+
+
+def history_page(student_id, page):
+    shard, entry = _entry_for(student_id)
+    row_numbers = page_rows(entry, page)
+    if not row_numbers:
+        return []
+
+    headers = get_headers("GoalHistory", shard)
+    last_col = rowcol_to_a1(1, len(headers)).rstrip("0123456789")
+    runs = []  # consecutive rows go in one range
+    for row_num in sorted(row_numbers):
+        if runs and runs[-1][1] == row_num - 1:
+            runs[-1][1] = row_num
+        else:
+            runs.append([row_num, row_num])
+    ranges = get_sheet("GoalHistory", shard).batch_get([f"A{start}:{last_col}{end}" for start, end in runs])
+
+    by_row = {}
+    for (start, _), values in zip(runs, ranges):
+        for offset, cells in enumerate(values):
+            by_row[start + offset] = dict(zip(headers, cells + [""] * (len(headers) - len(cells))))
+
+    clean_id = normalize_id(student_id)
+    page_entries = []
+    for row_num in row_numbers:
+        goal = GoalHistoryEntry.from_row(by_row[row_num]) if row_num in by_row else None
+        if goal is None or goal.student_id != clean_id:
+            # The sheet moved under the index (a row was inserted or deleted by hand)
+            print(f"[HISTORY] {shard}: row {row_num} no longer belongs to {clean_id}; index dropped")
+            forget_index(shard)
+            continue
+        page_entries.append(_display(goal))
+    return page_entries
+
+
+# --- Same answers from plain records (the offline snapshot) ---
+def _numbered(records):
+    return [(i + 2, GoalHistoryEntry.from_row(row)) for i, row in enumerate(records)]
+
+
+def summary_from_records(records):
+    return summarize(apply_rows(new_entry(), _numbered(records)))
+
+
+def page_from_records(records, page):
+    rows = _numbered(records)
+    entry = apply_rows(new_entry(), rows)
+    return [_display(rows[row_num - 2][1]) for row_num in page_rows(entry, page)]
+
+
+if __name__ == "__main__":
+    for shard in shard_names():
+        refresh_index(shard, rebuild=True)
@@ -0,0 +1,85 @@
+# llm.py
+# Shared OpenAI client for the Streamlit app and the offline jobs.
+# Inside Streamlit the key comes from st.secrets; command-line jobs fall back to $OPENAI_API_KEY.
+
+import os
+import time
+from types import SimpleNamespace
+
+from chat_memory import count_message_tokens, count_tokens
+from shared_cache import cached, completion_key
+from transport import httpx_options
+
+_client = None
+
+
+def _load_api_key():
+    try:
+        import streamlit as st
+        return st.secrets["OPENAI_API_KEY"]
+    except Exception:
+        return os.environ["OPENAI_API_KEY"]
+
+
+def get_openai_client():
+    global _client
+    if _client is None:
+        from openai import OpenAI  # imported here so offline runs with StubClient don't need it
+        try:
+            from openai import DefaultHttpxClient  # keeps the SDK's own timeouts and redirects
+        except ImportError:
+            from httpx import Client as DefaultHttpxClient
+        # One pooled, keep-alive connection set for every session (transport.py)
+        _client = OpenAI(api_key=_load_api_key(), http_client=DefaultHttpxClient(**httpx_options("openai")))
+    return _client
+
+
+# cache_ttl: reuse an identical request's reply from the shared cache (shared_cache.py) for
+# this many seconds. Only for calls where the same prompt should get the same answer.
+def chat_completion(messages, model="gpt-4", temperature=0.7, max_tokens=500, client=None, cache_ttl=None):
+    request = dict(model=model, messages=messages, temperature=temperature, max_tokens=max_tokens)
+    if not cache_ttl:
+        return (client or get_openai_client()).chat.completions.create(**request)
+
+    def load():
+        response = (client or get_openai_client()).chat.completions.create(**request)
+        usage = response.usage
+        return {
+            "content": response.choices[0].message.content,
+            "usage": [usage.prompt_tokens, usage.completion_tokens, usage.total_tokens],
+        }
+    reply = cached(completion_key(**request), load, ttl=cache_ttl)
+    return _response(model, reply["content"], *reply["usage"])
+
+
+def _response(model, content, prompt_tokens, completion_tokens, total_tokens):
+    return SimpleNamespace(
+        model=model,
+        choices=[SimpleNamespace(message=SimpleNamespace(role="assistant", content=content))],
+        usage=SimpleNamespace(
+            prompt_tokens=prompt_tokens,
+            completion_tokens=completion_tokens,
+            total_tokens=total_tokens
+        )
+    )
+
+
+# --- Offline stand-in for the OpenAI client ---
+# Same .chat.completions.create surface and response shape, with a canned reply in the
+# Option / Final response format and locally counted token usage.
+class StubClient:
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    def _create(self, model, messages, temperature=0.7, max_tokens=500, **kwargs):
+        if self.latency:
+            time.sleep(self.latency)
+        last_user = next((m["content"] for m in reversed(messages) if m["role"] == "user"), "")
+        content = "\n\n".join(
+            f"Option {i}: Statement: I hear you ({len(last_user)} chars). Question: What is step {i}?"
+            for i in range(1, 4)
+        ) + "\n\nBest option: Option 1\n\nFinal response: I hear you. What is step 1?"
+        prompt_tokens = count_message_tokens(messages)
+        completion_tokens = count_tokens(content)
+        return _response(model, content, prompt_tokens, completion_tokens, prompt_tokens + completion_tokens)
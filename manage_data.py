@@ -0,0 +1,259 @@
+# manage_data.py
+# Command-line maintenance over the Sheets data, for teachers and operators.
+#
+# Every command reads what it needs from each shard in one values_batch_get (Students,
+# GoalHistory and Chats together). Shards are processed in parallel, and all changes are
+# written back with one batched request per shard. --dry-run reports what would change and
+# writes nothing.
+#
+#   python manage_data.py export --students 300,301 --out exports/300-301.jsonl
+#   python manage_data.py export --all --out exports/everyone.jsonl
+#   python manage_data.py reassign --section "P3" --all --goal "Goal 2: ..." --measures "1 idea per group talk" --dry-run
+#   python manage_data.py dedupe --dry-run
+#   python manage_data.py backfill --fields GoalRange,BackgroundInfo --workers 8
+
+import argparse
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+
+from archive_sheets import fetch_all_archived
+from background_summary import MIN_REFLECTION_LENGTH, roll_summary_forward
+from goal_bank_loader import get_config_value, get_goal_text_list, load_goal_bank
+from goal_range_job import compute_goal_ranges, goal_bank_frame
+from google_sheets import (
+    batch_update_shard_students,
+    delete_rows_batch,
+    get_sheet,
+    load_shard_config,
+    query_all_shards,
+    read_shard,
+    shard_for_section,
+    shard_for_student,
+)
+from records import normalize_id
+
+
+def _by_student(rows):
+    grouped = {}
+    for _, record in rows:
+        grouped.setdefault(normalize_id(record.get("StudentID", "")), []).append(record)
+    return grouped
+
+
+# --- export ---
+def export_histories(student_ids, out_path, include_archived=True):
+    wanted = {normalize_id(sid) for sid in student_ids} if student_ids else None
+    shards = query_all_shards(read_shard)
+    archived = fetch_all_archived(wanted) if include_archived else {}  # every archive file read once
+
+    exported = 0
+    done = set()  # a StudentID repeated in Students is exported once
+    os.makedirs(os.path.dirname(out_path) or ".", exist_ok=True)
+    with open(out_path, "w") as out:
+        for shard, sheets in shards.items():
+            history = _by_student(sheets["GoalHistory"])
+            chats = _by_student(sheets["Chats"])
+            for _, student in sheets["Students"]:
+                student_id = normalize_id(student.get("StudentID", ""))
+                if not student_id or student_id in done or (wanted is not None and student_id not in wanted):
+                    continue
+                done.add(student_id)
+                out.write(json.dumps({
+                    "shard": shard,
+                    "student": student,
+                    "goal_history": history.get(student_id, []),
+                    "chats": chats.get(student_id, []),
+                    "archived": archived.get(student_id, []),
+                }, ensure_ascii=False) + "\n")
+                exported += 1
+    print(f"[MANAGE] Exported {exported} students to {out_path}")
+    return exported
+
+
+# --- reassign ---
+# The section has to be in the routing table and the Students sheet needs a Section column;
+# without either, the filter would match a whole shard. student_ids or all_students says who.
+def reassign_goal(section, goal, measures, set_date, student_ids=None, all_students=False, dry_run=False):
+    if not student_ids and not all_students:
+        raise ValueError("name the students to reassign, or pass all_students (--all) for the whole section")
+    if section not in (load_shard_config().get("sections") or {}):
+        raise ValueError(f"section {section!r} is not in the sections routing table (sheet_shards.yaml)")
+    shard = shard_for_section(section)
+    students = read_shard(shard, ("Students",))["Students"]
+    if students and "Section" not in students[0][1]:
+        raise ValueError(f"the Students sheet in {shard} has no Section column")
+    wanted = {normalize_id(sid) for sid in student_ids} if student_ids else None
+
+    updates = {}
+    for _, student in students:
+        student_id = normalize_id(student.get("StudentID", ""))
+        if not student_id:
+            continue
+        if str(student["Section"]).strip() != section:
+            continue
+        if wanted is not None and student_id not in wanted:
+            continue
+        updates[student_id] = {
+            "CurrentGoal": goal,
+            "CurrentSuccessMeasures": measures,
+            "CurrentGoalSetDate": set_date,
+        }
+
+    if dry_run or not updates:
+        print(f"[MANAGE] Would reassign {len(updates)} students in {section} ({shard})")
+        return len(updates)
+    # Written to the shard they were read from; routing by id prefix could pick another shard
+    applied = batch_update_shard_students(shard, updates)
+    print(f"[MANAGE] Reassigned {applied} of {len(updates)} students in {section} ({shard})")
+    return applied
+
+
+# --- dedupe ---
+# Within a shard, the copy of a StudentID with the most filled-in fields is kept (the
+# earliest wins ties). IDs that appear in more than one shard are only reported.
+def _filled(record):
+    return sum(1 for v in record.values() if str(v).strip())
+
+
+def plan_dedupe(students):
+    by_id = {}
+    for row_num, record in students:
+        student_id = normalize_id(record.get("StudentID", ""))
+        if student_id:
+            by_id.setdefault(student_id, []).append((row_num, record))
+
+    delete = []
+    for copies in by_id.values():
+        if len(copies) > 1:
+            keep = max(copies, key=lambda c: (_filled(c[1]), -c[0]))
+            delete.extend(row_num for row_num, _ in copies if row_num != keep[0])
+    return sorted(delete), set(by_id)
+
+
+def dedupe_students(dry_run=False):
+    shards = query_all_shards(lambda shard: read_shard(shard, ("Students",))["Students"])
+
+    seen = {}
+    removed = 0
+    for shard, students in shards.items():
+        delete, ids = plan_dedupe(students)
+        for student_id in ids:
+            seen.setdefault(student_id, []).append(shard)
+        print(f"[MANAGE] {shard}: {len(delete)} duplicate Students rows{'' if dry_run else ' removed'}")
+        if delete and not dry_run:
+            delete_rows_batch(get_sheet("Students", shard), delete)
+        removed += len(delete)
+
+    for student_id, found_in in sorted(seen.items()):
+        if len(found_in) > 1:
+            print(f"[MANAGE] {student_id} is in {', '.join(found_in)}; routes to {shard_for_student(student_id)}")
+    return removed
+
+
+# --- backfill ---
+# GoalRange is worked out the same way as the nightly goal_range_job.py, only blanks are filled
+def _reflections(history):
+    return [text for r in history for field in ("OutcomeReflection", "BackgroundInfo")
+            if len(text := str(r.get(field, "")).strip()) > MIN_REFLECTION_LENGTH and not text.startswith("[")]
+
+
+def backfill_students(fields, workers=8, dry_run=False):
+    bank = goal_bank_frame(load_goal_bank())
+    shards = query_all_shards(lambda shard: read_shard(shard, ("Students", "GoalHistory")))
+
+    # Keyed by (shard, student_id): each row is written back to the shard it was read from
+    updates = {}
+    summaries_needed = {}
+    for shard, sheets in shards.items():
+        history = _by_student(sheets["GoalHistory"])
+        ranges = compute_goal_ranges([record for _, record in sheets["GoalHistory"]], bank) \
+            if "GoalRange" in fields else {}
+        for _, student in sheets["Students"]:
+            student_id = normalize_id(student.get("StudentID", ""))
+            rows = history.get(student_id, [])
+            if not student_id or not rows:
+                continue
+            if "GoalRange" in fields and not str(student.get("GoalRange", "")).strip():
+                goal_range = ranges.get(student_id)
+                if goal_range:
+                    updates.setdefault((shard, student_id), {})["GoalRange"] = goal_range
+            if "BackgroundInfo" in fields and not str(student.get("BackgroundInfo", "")).strip():
+                reflections = _reflections(rows)
+                if reflections:
+                    summaries_needed[(shard, student_id)] = reflections
+
+    print(f"[MANAGE] GoalRange for {sum('GoalRange' in u for u in updates.values())} students, "
+          f"BackgroundInfo for {len(summaries_needed)} students{' (dry run)' if dry_run else ''}")
+    if dry_run:
+        return len(updates) + len(summaries_needed)
+
+    # One summary per student; the completions run side by side
+    def summarize(item):
+        key, reflections = item
+        try:
+            return key, roll_summary_forward("", reflections)
+        except Exception as e:
+            print(f"[MANAGE] BackgroundInfo for {key[1]} skipped: {e}")
+            return key, None
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for key, summary in pool.map(summarize, summaries_needed.items()):
+            if summary:
+                updates.setdefault(key, {})["BackgroundInfo"] = summary
+
+    by_shard = {}
+    for (shard, student_id), student_fields in updates.items():
+        by_shard.setdefault(shard, {})[student_id] = student_fields
+    return sum(batch_update_shard_students(shard, shard_updates) for shard, shard_updates in by_shard.items())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bulk maintenance for the student Sheets.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    export = commands.add_parser("export", help="full history for students, as JSON lines")
+    who = export.add_mutually_exclusive_group(required=True)
+    who.add_argument("--students", help="comma-separated StudentIDs")
+    who.add_argument("--all", action="store_true")
+    export.add_argument("--out", default=f"exports/students-{date.today().isoformat()}.jsonl")
+    export.add_argument("--no-archive", action="store_true", help="skip records moved out by archive_sheets.py")
+
+    reassign = commands.add_parser("reassign", help="set the same current goal for a section")
+    reassign.add_argument("--section", required=True)
+    reassign.add_argument("--goal", required=True)
+    reassign.add_argument("--measures", default="")
+    reassign.add_argument("--date", default=date.today().isoformat())
+    reassign_who = reassign.add_mutually_exclusive_group(required=True)
+    reassign_who.add_argument("--students", help="only these comma-separated StudentIDs")
+    reassign_who.add_argument("--all", action="store_true", help="every student in the section")
+    reassign.add_argument("--dry-run", action="store_true")
+
+    dedupe = commands.add_parser("dedupe", help="remove repeated StudentIDs from Students")
+    dedupe.add_argument("--dry-run", action="store_true")
+
+    backfill = commands.add_parser("backfill", help="fill blank GoalRange / BackgroundInfo from GoalHistory")
+    backfill.add_argument("--fields", default="GoalRange,BackgroundInfo")
+    backfill.add_argument("--workers", type=int, default=8, help="parallel summary completions")
+    backfill.add_argument("--dry-run", action="store_true")
+
+    args = parser.parse_args()
+
+    def split(value):
+        return [v.strip() for v in value.split(",") if v.strip()] if value else None
+
+    if args.command == "export":
+        export_histories(None if args.all else split(args.students), args.out, include_archived=not args.no_archive)
+    elif args.command == "reassign":
+        cfg = load_goal_bank()
+        if args.goal not in get_goal_text_list(cfg) and not get_config_value(cfg, "allow_custom_goals", False):
+            parser.error("goal is not in the goal bank and allow_custom_goals is off")
+        try:
+            reassign_goal(args.section, args.goal, args.measures, args.date, split(args.students), args.all, args.dry_run)
+        except ValueError as e:
+            parser.error(str(e))
+    elif args.command == "dedupe":
+        dedupe_students(args.dry_run)
+    elif args.command == "backfill":
+        backfill_students(split(args.fields), args.workers, args.dry_run)
@@ -0,0 +1,453 @@
+# offline.py
+# Keeps the app usable when Google Sheets or OpenAI can't be reached from the classroom.
+#
+# - Health: each service has a status that live calls keep current. When it goes stale, a
+#   cheap probe refreshes it. After a failure the service stays "down" for a backoff that
+#   doubles up to five minutes, so a dead network costs one timeout and not one per rerun.
+# - Reads: the Sheets reads the app uses go live when Sheets is up, and save a local snapshot
+#   (.offline/<Sheet>.json) when they do. While Sheets is down they are served from that snapshot.
+#   Only transport errors, timeouts and 5xx/429 responses mark a service down, for reads and
+#   chat completions alike; anything else (a 400, a renamed header, a bug) is raised as is.
+# - Writes: when Sheets is down, a write is appended to .offline/write_queue.jsonl and
+#   fsynced. Writes are also queued while older ones are still waiting, to keep them in order.
+#   The queue is replayed as soon as a write or probe succeeds. A write that timed out may
+#   have landed anyway, so replay is at-least-once. Only network trouble and Sheets-side
+#   errors (5xx, rate limits) count as "offline". A queued write Sheets rejects (a bad
+#   column, a deleted student) is retried on the next few replays, then moved to
+#   .offline/dead_letters.jsonl so it can't hold up the writes behind it.
+# - LLM: while OpenAI is down, chat requests fail fast and the app shows a templated reply.
+#   It is built from `encouragements` and `offline_followups` in goal_bank.yaml, in the same
+#   Option / Final response format as a real reply.
+
+import json
+import os
+import random
+import threading
+import time
+from concurrent.futures import Future
+from concurrent.futures import TimeoutError as FutureTimeout
+
+import google_sheets
+import history_view
+import sheets_async
+from records import id_forms
+
+OFFLINE_DIR = ".offline"
+QUEUE_PATH = os.path.join(OFFLINE_DIR, "write_queue.jsonl")
+DEAD_LETTER_PATH = os.path.join(OFFLINE_DIR, "dead_letters.jsonl")
+MAX_REPLAY_ATTEMPTS = 3  # replays a rejected write gets before it is set aside
+SNAPSHOT_SHEETS = ["Students", "GoalHistory"]
+READ_TIMEOUT = 8      # seconds before a live read gives up and the snapshot answers
+PROBE_TIMEOUT = 5
+
+
+
+class ServiceUnavailable(Exception):
+    pass
+
+
+# Each timed call gets its own daemon thread rather than a slot in a small shared pool, so a
+# few hung Sheets calls can't hold up every other session's reads past their own timeout.
+# A call that times out is abandoned; its thread ends when the library call finally does.
+def _start(fn, name="offline"):
+    future = Future()
+
+    def run():
+        try:
+            future.set_result(fn())
+        except BaseException as e:
+            future.set_exception(e)
+
+    threading.Thread(target=run, name=name, daemon=True).start()
+    return future
+
+
+def _call(fn, timeout, name="offline"):
+    return _start(fn, name).result(timeout=timeout)
+
+
+# --- Health ---
+class ServiceHealth:
+    def __init__(self, name, probe, fresh_for=30, min_backoff=15, max_backoff=300):
+        self.name = name
+        self.probe = probe
+        self.fresh_for = fresh_for
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+        self.up = True
+        self.checked_at = 0.0
+        self.retry_at = 0.0
+        self.backoff = min_backoff
+        self._lock = threading.Lock()
+
+    def record_success(self):
+        with self._lock:
+            was_down = not self.up
+            self.up, self.checked_at, self.backoff = True, time.time(), self.min_backoff
+        if was_down:
+            print(f"[OFFLINE] {self.name} is reachable again")
+        return was_down
+
+    def record_failure(self, error=None):
+        with self._lock:
+            if self.up:
+                print(f"[OFFLINE] {self.name} unreachable, switching to offline mode: {error}")
+            else:
+                self.backoff = min(self.backoff * 2, self.max_backoff)
+            self.up, self.checked_at = False, time.time()
+            self.retry_at = self.checked_at + self.backoff
+
+    def is_up(self):
+        now = time.time()
+        if self.up and now - self.checked_at < self.fresh_for:
+            return True
+        if not self.up and now < self.retry_at:
+            return False
+        try:
+            _call(self.probe, PROBE_TIMEOUT, name="offline-probe")
+        except Exception as e:
+            self.record_failure(e if not isinstance(e, FutureTimeout) else "probe timed out")
+            return False
+        if self.record_success() and self is sheets_health:
+            _start(flush_write_queue, name="offline-flush")
+        return True
+
+
+def _probe_sheets():
+    google_sheets.get_sheet("Students").spreadsheet.fetch_sheet_metadata()
+
+
+def _probe_openai():
+    from llm import get_openai_client
+    get_openai_client().with_options(timeout=PROBE_TIMEOUT).models.list()
+
+
+sheets_health = ServiceHealth("Google Sheets", _probe_sheets)
+openai_health = ServiceHealth("OpenAI", _probe_openai)
+
+
+def status():
+    return {"sheets": sheets_health.up, "openai": openai_health.up, "queued_writes": _queue_size()}
+
+
+# --- Local snapshots ---
+_snapshots = {}
+_snapshot_lock = threading.Lock()
+
+
+def _snapshot_path(sheet_name):
+    return os.path.join(OFFLINE_DIR, f"{sheet_name}.json")
+
+
+def save_snapshot(sheet_name, records):
+    os.makedirs(OFFLINE_DIR, exist_ok=True)
+    tmp_path = _snapshot_path(sheet_name) + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(records, f)
+    os.replace(tmp_path, _snapshot_path(sheet_name))
+    with _snapshot_lock:
+        _snapshots[sheet_name] = records
+
+
+def load_snapshot(sheet_name):
+    with _snapshot_lock:
+        if sheet_name not in _snapshots:
+            try:
+                with open(_snapshot_path(sheet_name), "r") as f:
+                    _snapshots[sheet_name] = json.load(f)
+            except (OSError, ValueError):
+                return []
+        return _snapshots[sheet_name]
+
+
+def refresh_snapshots():
+    for sheet_name in SNAPSHOT_SHEETS:
+        save_snapshot(sheet_name, sheets_async.get_all_records_all_shards(sheet_name))
+
+
+def _snapshot_loop(interval):
+    while True:
+        if sheets_health.is_up():
+            try:
+                refresh_snapshots()
+                sheets_health.record_success()
+            except Exception as e:
+                if _is_transient(e):
+                    sheets_health.record_failure(e)
+                else:
+                    print(f"[OFFLINE] Snapshot refresh failed: {e}")
+        time.sleep(interval)
+
+
+_snapshot_thread = None
+
+
+def start_snapshot_refresh(interval=600):
+    global _snapshot_thread
+    with _snapshot_lock:
+        if _snapshot_thread is None:
+            _snapshot_thread = threading.Thread(target=_snapshot_loop, args=(interval,), name="offline-snapshots", daemon=True)
+            _snapshot_thread.start()
+
+
+def _matches(row, student_id):
+    return str(row.get("StudentID", "")).strip() in id_forms(student_id)
+
+
+# --- Reads: live first, snapshot when Sheets is down ---
+def _read(live, fallback, timeout=READ_TIMEOUT):
+    if sheets_health.is_up():
+        try:
+            result = _call(live, timeout, name="offline-read")
+        except Exception as e:
+            if not _is_transient(e):
+                raise  # a bad request or a bug, not an outage: surface it
+            sheets_health.record_failure(e if not isinstance(e, FutureTimeout) else "read timed out")
+        else:
+            sheets_health.record_success()
+            return result
+    return fallback()
+
+
+def get_student_info(student_id):
+    return _read(
+        lambda: google_sheets.get_student_info(student_id),
+        lambda: next((dict(row) for row in load_snapshot("Students") if _matches(row, student_id)), None)
+    )
+
+
+def get_goal_history_for_student(student_id):
+    return _read(
+        lambda: google_sheets.get_goal_history_for_student(student_id),
+        lambda: [dict(row) for row in load_snapshot("GoalHistory") if _matches(row, student_id)]
+    )
+
+
+# Student row, their history and the header rows, read concurrently (sheets_async.py)
+def get_student_context(student_id):
+    def fallback():
+        student = next((dict(row) for row in load_snapshot("Students") if _matches(row, student_id)), None)
+        history = [dict(row) for row in load_snapshot("GoalHistory") if _matches(row, student_id)]
+        headers = {name: list(rows[0].keys()) if rows else [] for name, rows in
+                   (("Students", load_snapshot("Students")), ("GoalHistory", load_snapshot("GoalHistory")))}
+        return {"student": student, "goal_history": history, "headers": headers}
+    return _read(lambda: sheets_async.get_student_context(student_id), fallback)
+
+
+# History timeline (history_view.py); offline, both come from the GoalHistory snapshot
+def get_history_summary(student_id):
+    return _read(
+        lambda: history_view.history_summary(student_id),
+        lambda: history_view.summary_from_records([row for row in load_snapshot("GoalHistory") if _matches(row, student_id)])
+    )
+
+
+def get_history_page(student_id, page):
+    return _read(
+        lambda: history_view.history_page(student_id, page),
+        lambda: history_view.page_from_records([row for row in load_snapshot("GoalHistory") if _matches(row, student_id)], page)
+    )
+
+
+def get_all_records_all_shards(sheet_name):
+    def live():
+        records = sheets_async.get_all_records_all_shards(sheet_name)
+        if sheet_name in SNAPSHOT_SHEETS:
+            save_snapshot(sheet_name, records)
+        return records
+    return _read(live, lambda: [dict(row) for row in load_snapshot(sheet_name)], timeout=READ_TIMEOUT * 2)
+
+
+# --- Writes: live when possible, otherwise a durable on-disk queue ---
+# Queued items name the google_sheets function to replay and its keyword arguments
+_queue_lock = threading.Lock()
+_queued = None  # items in the queue file; read from disk once, then kept here
+
+
+# Network failures, timeouts, rate limits and 5xx mean Sheets can't take the write right now.
+# Anything else (a 400 for a bad range, a KeyError for a missing column) fails again on retry.
+def _is_transient(error):
+    if isinstance(error, (OSError, FutureTimeout)):  # requests' ConnectionError/Timeout are OSErrors
+        return True
+    if isinstance(error, _transport_errors()):
+        return True
+    code = getattr(error, "code", None)  # gspread APIError; -1 when the body wasn't Google's JSON
+    if not isinstance(code, int):
+        code = getattr(error, "status_code", None)  # openai APIStatusError
+    return isinstance(code, int) and (code < 0 or code == 429 or code >= 500)
+
+
+# httpx (under the OpenAI client) and openai's connection errors aren't OSErrors
+def _transport_errors():
+    errors = []
+    try:
+        import httpx
+        errors += [httpx.TransportError]  # connect/read errors and timeouts
+    except ImportError:
+        pass
+    try:
+        import openai
+        errors += [openai.APIConnectionError]  # includes APITimeoutError
+    except ImportError:
+        pass
+    return tuple(errors)
+
+
+def _read_queue():
+    try:
+        with open(QUEUE_PATH, "r") as f:
+            return [json.loads(line) for line in f if line.strip()]
+    except OSError:
+        return []
+
+
+def _queue_size():
+    global _queued
+    if _queued is None:
+        with _queue_lock:
+            if _queued is None:
+                _queued = len(_read_queue())
+    return _queued
+
+
+def _append_lines(path, items):
+    os.makedirs(OFFLINE_DIR, exist_ok=True)
+    with open(path, "a") as f:
+        f.writelines(json.dumps(item) + "\n" for item in items)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def _enqueue(op, kwargs):
+    global _queued
+    _queue_size()
+    with _queue_lock:
+        _append_lines(QUEUE_PATH, [{"op": op, "kwargs": kwargs, "queued_at": time.time()}])
+        _queued += 1
+    print(f"[OFFLINE] Queued {op} for later")
+
+
+def flush_write_queue():
+    global _queued
+    with _queue_lock:
+        pending = _read_queue()
+        done, dead, changed = 0, [], False
+        while pending:
+            item = pending[0]
+            try:
+                getattr(google_sheets, item["op"])(**item["kwargs"])
+            except Exception as e:
+                if _is_transient(e):
+                    sheets_health.record_failure(e)
+                    break
+                changed = True
+                item["attempts"] = item.get("attempts", 0) + 1
+                item["error"] = repr(e)
+                if item["attempts"] < MAX_REPLAY_ATTEMPTS:
+                    print(f"[OFFLINE] Queued {item['op']} rejected by Sheets "
+                          f"(attempt {item['attempts']} of {MAX_REPLAY_ATTEMPTS}): {e}")
+                    break  # keep the order; later writes may depend on this one
+                dead.append(pending.pop(0))
+                print(f"[OFFLINE] Queued {item['op']} rejected {item['attempts']} times, moved to {DEAD_LETTER_PATH}: {e}")
+                continue
+            pending.pop(0)
+            done += 1
+
+        if dead:
+            _append_lines(DEAD_LETTER_PATH, dead)
+        if done or changed:
+            tmp_path = QUEUE_PATH + ".tmp"
+            with open(tmp_path, "w") as f:
+                f.writelines(json.dumps(item) + "\n" for item in pending)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, QUEUE_PATH)
+        if done:
+            print(f"[OFFLINE] Replayed {done} queued writes, {len(pending)} left")
+        _queued = len(pending)
+    return done
+
+
+# True when Sheets is up and nothing older is still waiting, so a new write can go live
+def _queue_drained():
+    if not sheets_health.is_up():
+        return False
+    if _queue_size():
+        flush_write_queue()
+    return not _queue_size()
+
+
+# replay_kwargs: extra arguments for when the queued write replays
+def _write(op, queued_result=None, on_queued=None, replay_kwargs=None, **kwargs):
+    if _queue_drained():
+        try:
+            result = getattr(google_sheets, op)(**kwargs)
+            sheets_health.record_success()
+            return result
+        except Exception as e:
+            if not _is_transient(e):
+                raise  # Sheets answered and rejected it; queueing would only replay the same failure
+            sheets_health.record_failure(e)
+    _enqueue(op, {**kwargs, **(replay_kwargs or {})})
+    if on_queued:
+        on_queued()
+    return queued_result
+
+
+def add_chat_log_entry(entry):
+    return _write("add_chat_log_entry", entry=entry)
+
+
+def add_goal_history_entry(entry_dict):
+    return _write("add_goal_history_entry", entry_dict=entry_dict)
+
+
+def update_student_current_goal(student_id, new_goal, new_success_measures, set_date, goal_range=None, background_info=None):
+    return _write("update_student_current_goal", queued_result=True, student_id=student_id, new_goal=new_goal,
+                  new_success_measures=new_success_measures, set_date=set_date,
+                  goal_range=goal_range, background_info=background_info)
+
+
+# "committed", "already_committed", or "queued". A queued commit may have reached Sheets before
+# the failure, so its replay checks the CommitKey column first.
+def commit_reflection(student_id, history_entry=None, student_fields=None):
+    return _write("commit_reflection", queued_result="queued", replay_kwargs={"retry": True},
+                  student_id=student_id, history_entry=history_entry, student_fields=student_fields)
+
+
+def create_student_if_missing(student_id, nickname="", pronoun_code="", tone="Reflective"):
+    # A student created offline has to be readable from the snapshot until the queue replays
+    def remember():
+        students = [row for row in load_snapshot("Students") if not _matches(row, student_id)]
+        students.append({"StudentID": student_id, "Nickname": nickname, "PronounCode": pronoun_code,
+                         "ChosenTone": tone, "CurrentGoal": "", "CurrentSuccessMeasures": "",
+                         "CurrentGoalSetDate": "", "GoalRange": "", "BackgroundInfo": ""})
+        save_snapshot("Students", students)
+    return _write("create_student_if_missing", queued_result=True, on_queued=remember, student_id=student_id,
+                  nickname=nickname, pronoun_code=pronoun_code, tone=tone)
+
+
+# --- LLM: fail fast while OpenAI is down, templated reply instead ---
+def guarded_completion(create, *args, **kwargs):
+    if not openai_health.is_up():
+        raise ServiceUnavailable("OpenAI is unreachable")
+    try:
+        response = create(*args, **kwargs)
+    except Exception as e:
+        if _is_transient(e):
+            openai_health.record_failure(e)
+        raise
+    openai_health.record_success()
+    return response
+
+
+def templated_reply(cfg, score_value, rng=random):
+    kind = "success" if score_value >= 3 else "struggle"
+    statement = rng.choice(cfg.get("encouragements", {}).get(kind) or ["Thanks for sharing that."])
+    question = rng.choice(cfg.get("offline_followups", {}).get(kind) or ["What is one small thing you could try next class?"])
+    return (
+        f"Option 1: Statement: {statement} Question: {question}\n\n"
+        f"Best option: Option 1\n\n"
+        f"Final response: {statement} {question}"
+    )
+
@@ -0,0 +1,103 @@
+# prefetch.py
+# Speculative precomputation of the first chatbot turn.
+# Everything the first turn needs is known once the reflection is submitted, so both tone
+# completions are started in the background right away. When the student picks a tone, that
+# completion is served from its future and the other one is cancelled (if it hasn't started)
+# or counted as token overhead (if it already ran).
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="prefetch")
+
+_stats_lock = threading.Lock()
+_stats = {
+    "started": 0,        # prefetches launched (one per reflection submission)
+    "hits": 0,           # first turns served from a prefetched completion
+    "misses": 0,         # first turns that had to call the API inline
+    "cancelled": 0,      # speculative completions cancelled before they ran
+    "used_tokens": 0,    # tokens of prefetched completions that were served
+    "wasted_tokens": 0,  # tokens of prefetched completions nobody asked for
+}
+
+
+def _bump(key, amount=1):
+    with _stats_lock:
+        _stats[key] += amount
+
+
+def _total_tokens(response):
+    usage = getattr(response, "usage", None)
+    return getattr(usage, "total_tokens", 0) or 0
+
+
+# --- Start one completion per tone ---
+# inputs_key identifies the prompt inputs (goal, score, reflection, background) so a stale
+# prefetch is never served after the inputs change.
+def start_prefetch(inputs_key, threads_by_tone, create_completion):
+    futures = {
+        tone: _executor.submit(create_completion, messages)
+        for tone, messages in threads_by_tone.items()
+    }
+    _bump("started")
+    return {"key": inputs_key, "futures": futures}
+
+
+# --- Serve the chosen tone, discard the rest ---
+# Returns the completion response, or None if the caller should make the request itself.
+def take_prefetched(prefetch, tone, inputs_key, timeout=60):
+    if not prefetch:
+        _bump("misses")
+        return None
+
+    futures = prefetch["futures"]
+    if prefetch["key"] != inputs_key or tone not in futures:
+        discard_prefetch(prefetch)
+        _bump("misses")
+        return None
+
+    for other_tone, future in futures.items():
+        if other_tone != tone:
+            _discard(future)
+
+    try:
+        response = futures[tone].result(timeout=timeout)
+    except Exception as e:
+        print(f"[PREFETCH] {tone} completion failed, falling back to inline request: {e}")
+        _bump("misses")
+        return None
+
+    _bump("hits")
+    _bump("used_tokens", _total_tokens(response))
+    return response
+
+
+def discard_prefetch(prefetch):
+    if prefetch:
+        for future in prefetch["futures"].values():
+            _discard(future)
+
+
+def _discard(future):
+    if future.cancel():
+        _bump("cancelled")
+    else:
+        future.add_done_callback(_count_wasted)
+
+
+def _count_wasted(future):
+    if future.cancelled() or future.exception() is not None:
+        return
+    _bump("wasted_tokens", _total_tokens(future.result()))
+
+
+# --- Hit rate and token overhead (process-wide) ---
+def get_prefetch_stats():
+    with _stats_lock:
+        stats = dict(_stats)
+    served = stats["hits"] + stats["misses"]
+    stats["hit_rate"] = stats["hits"] / served if served else 0.0
+    stats["token_overhead"] = (
+        stats["wasted_tokens"] / stats["used_tokens"] if stats["used_tokens"] else 0.0
+    )
+    return stats
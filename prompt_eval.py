@@ -0,0 +1,217 @@
+# prompt_eval.py
+# Offline batch runner for comparing the Nicer (real_one) and Tougher (drill_sergeant) prompts.
+#
+# Renders the first-turn prompt for every tone × score × persona, runs the completions
+# concurrently through a pluggable client, and checkpoints each result to a JSONL file as it
+# lands so an interrupted sweep resumes where it stopped. Finishes with a comparison table of
+# latency, token usage and how often the reply followed the Option/Final response format.
+#
+#   python prompt_eval.py --personas students                  # personas from the Students sheet
+#   python prompt_eval.py --personas personas.csv --client stub
+#   python prompt_eval.py --personas personas.yaml --workers 32 --scores 0,2,4
+
+import argparse
+import csv
+import hashlib
+import json
+import os
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import yaml
+
+from chat_prompts import SCORE_INTERPRETATIONS, TONES, build_system_message, build_first_turn_input
+from llm import StubClient, chat_completion, get_openai_client
+from records import normalize_id
+from response_parser import parse_response
+
+# Used when a persona doesn't bring its own reflection for a score
+DEFAULT_REFLECTIONS = {
+    4: "I spoke up every time and even got my partner talking.",
+    3: "I did it, mostly because the topic was interesting.",
+    2: "I almost did it but ran out of time in the last discussion.",
+    1: "I wanted to but someone else always jumped in first.",
+    0: "I forgot about it and didn't really try.",
+}
+
+
+# --- Personas ---
+def load_personas(source):
+    if source == "students":
+        from google_sheets import get_all_records_all_shards  # needs Streamlit secrets; only for live personas
+        return get_all_records_all_shards("Students")
+
+    with open(source, "r", newline="") as f:
+        if source.endswith(".csv"):
+            return list(csv.DictReader(f))
+        if source.endswith(".json"):
+            return json.load(f)
+        return yaml.safe_load(f)
+
+
+# A persona's part of each case_id (the checkpoint key): its StudentID, or for personas without
+# one (hand-written CSV/JSON/YAML files) a hash of the persona, which stays put if rows move
+def persona_key(persona):
+    student_id = normalize_id(persona.get("StudentID", ""))
+    if student_id:
+        return student_id
+    return "persona-" + hashlib.sha256(json.dumps(persona, sort_keys=True, default=str).encode()).hexdigest()[:12]
+
+
+def build_cases(personas, tones, scores):
+    keys = [persona_key(persona) for persona in personas]
+    repeated = sorted({key for key in keys if keys.count(key) > 1})
+    if repeated:
+        raise ValueError(f"personas must be unique; repeated: {', '.join(repeated)}")
+
+    cases = []
+    for persona, key in zip(personas, keys):
+        student_id = str(persona.get("StudentID", "")).strip()
+        goal = persona.get("CurrentGoal") or "[No goal]"
+        background = persona.get("BackgroundInfo") or "[none]"
+        for tone in tones:
+            for score in scores:
+                reflection = persona.get(f"Reflection{score}") or DEFAULT_REFLECTIONS[score]
+                interpretation = SCORE_INTERPRETATIONS[score]
+                cases.append({
+                    "case_id": f"{key}|{tone}|{score}",
+                    "student_id": student_id,
+                    "tone": tone,
+                    "score": score,
+                    "messages": [
+                        {"role": "system", "content": build_system_message(tone, goal, score, interpretation, reflection, background)},
+                        {"role": "user", "content": build_first_turn_input(goal, score, interpretation, reflection)}
+                    ]
+                })
+    return cases
+
+
+# --- Checkpoint: one JSON line per finished case ---
+def load_checkpoint(path):
+    done = {}
+    if os.path.exists(path):
+        with open(path, "r") as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    result = json.loads(line)
+                    done[result["case_id"]] = result
+    return done
+
+
+def run_case(case, client, retries=3):
+    for attempt in range(retries):
+        start = time.perf_counter()
+        try:
+            response = chat_completion(case["messages"], client=client)
+            latency = time.perf_counter() - start
+            reply = response.choices[0].message.content.strip()
+            parsed = parse_response(reply)
+            return {
+                "case_id": case["case_id"],
+                "student_id": case["student_id"],
+                "tone": case["tone"],
+                "score": case["score"],
+                "latency_s": round(latency, 3),
+                "prompt_tokens": response.usage.prompt_tokens,
+                "completion_tokens": response.usage.completion_tokens,
+                "followed_format": parsed.has_final and len(parsed.options) == 3,
+                "final_response": parsed.final_response,
+                "reply": reply,
+            }
+        except Exception as e:
+            if attempt == retries - 1:
+                return {"case_id": case["case_id"], "tone": case["tone"], "score": case["score"], "error": str(e)}
+            time.sleep(2 ** attempt)
+
+
+def run_sweep(cases, client, checkpoint_path, workers=16):
+    done = load_checkpoint(checkpoint_path)
+    todo = [c for c in cases if c["case_id"] not in done or "error" in done[c["case_id"]]]
+    print(f"[EVAL] {len(cases)} cases, {len(cases) - len(todo)} already checkpointed, running {len(todo)}.")
+
+    write_lock = threading.Lock()
+    started = time.perf_counter()
+    with open(checkpoint_path, "a") as out, ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(run_case, case, client) for case in todo]
+        for i, future in enumerate(as_completed(futures), start=1):
+            result = future.result()
+            with write_lock:
+                out.write(json.dumps(result) + "\n")
+                out.flush()
+            done[result["case_id"]] = result
+            if i % 50 == 0 or i == len(todo):
+                print(f"[EVAL] {i}/{len(todo)} done in {time.perf_counter() - started:.1f}s")
+
+    case_ids = {c["case_id"] for c in cases}
+    return [r for case_id, r in done.items() if case_id in case_ids]
+
+
+# --- Comparison table: one row per tone × score ---
+def _percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def summarize(results):
+    groups = {}
+    for r in results:
+        groups.setdefault((r["tone"], r["score"]), []).append(r)
+
+    rows = []
+    for (tone, score), group in sorted(groups.items()):
+        ok = [r for r in group if "error" not in r]
+        latencies = [r["latency_s"] for r in ok] or [0.0]
+        rows.append({
+            "tone": tone,
+            "score": score,
+            "cases": len(group),
+            "errors": len(group) - len(ok),
+            "latency_p50_s": round(statistics.median(latencies), 2),
+            "latency_p95_s": round(_percentile(latencies, 95), 2),
+            "prompt_tokens_avg": round(statistics.mean([r["prompt_tokens"] for r in ok]), 1) if ok else 0,
+            "completion_tokens_avg": round(statistics.mean([r["completion_tokens"] for r in ok]), 1) if ok else 0,
+            "format_rate": round(sum(r["followed_format"] for r in ok) / len(ok), 2) if ok else 0,
+        })
+    return rows
+
+
+def write_table(rows, path):
+    columns = list(rows[0].keys()) if rows else []
+    with open(path, "w") as f:
+        f.write("| " + " | ".join(columns) + " |\n")
+        f.write("|" + "---|" * len(columns) + "\n")
+        for row in rows:
+            f.write("| " + " | ".join(str(row[c]) for c in columns) + " |\n")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Batch-compare the Nicer and Tougher chat prompts.")
+    parser.add_argument("--personas", required=True, help="'students' for the live sheet, or a .csv/.json/.yaml file")
+    parser.add_argument("--tones", default=",".join(TONES))
+    parser.add_argument("--scores", default="0,1,2,3,4")
+    parser.add_argument("--client", choices=["openai", "stub"], default="openai")
+    parser.add_argument("--stub-latency", type=float, default=0.0, help="seconds per stub completion")
+    parser.add_argument("--workers", type=int, default=16)
+    parser.add_argument("--out", default="eval_runs/results.jsonl", help="checkpoint file; rerun to resume")
+    parser.add_argument("--table", default="eval_runs/comparison.md")
+    args = parser.parse_args()
+
+    for path in [args.out, args.table]:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+    client = StubClient(latency=args.stub_latency) if args.client == "stub" else get_openai_client()
+    try:
+        cases = build_cases(
+            load_personas(args.personas),
+            tones=args.tones.split(","),
+            scores=[int(s) for s in args.scores.split(",")]
+        )
+    except ValueError as e:
+        parser.error(str(e))
+    results = run_sweep(cases, client, args.out, workers=args.workers)
+    rows = summarize(results)
+    write_table(rows, args.table)
+    print(open(args.table).read())
@@ -0,0 +1,233 @@
+# records.py
+# Typed rows for the Students, GoalHistory and Chats sheets.
+#
+# get_all_records() hands back dicts with whatever the sheet held: ids as int or str with
+# stray spaces, dates as text, scores as "3", 3 or "[first goal]". These classes parse each
+# field once on the way in (normalized ID string, datetime.date, int score or None) and keep
+# only fixed slots, so cached rows are smaller than the dicts and compare without str()/strip().
+# to_row() gives back a sheet-ready dict for the write paths that still take dicts.
+#
+# GoalHistoryColumns holds a whole GoalHistory sheet as parallel NumPy arrays for bulk
+# questions (per-student streaks, score distributions) without a Python loop over rows.
+
+from dataclasses import dataclass, fields
+from datetime import date, datetime
+from typing import Optional
+
+import numpy as np
+
+MISSING_SCORE = -1  # column-store stand-in for an unscored row
+
+# Chats has no header lookup on write; columns are positional in this order
+CHAT_LOG_COLUMNS = [
+    "StudentID",
+    "Timestamp",
+    "CurrentGoal",
+    "SuccessMeasures",
+    "OutcomeReflection",
+    "GoalAchievement",
+    "Reflection",
+    "Tone",
+    "ChatHistory.json",
+    "UserType",
+    "Try",
+    "Engage",
+    "ToneQ",              # student's response about tone
+    "ChangeQ"             # student's suggestion for improvement
+]
+
+
+def normalize_id(value):
+    text = str(value).strip()
+    if text.endswith(".0") and text[:-2].isdigit():
+        text = text[:-2]  # numeric ids that went through a float
+    return text
+
+
+# Every cell text (after strip) that normalize_id() maps to this id. Row scans test
+# str(cell).strip() against this set, which matches the same rows as calling normalize_id
+# on each cell at the cost of a plain string comparison.
+def id_forms(student_id):
+    clean_id = normalize_id(student_id)
+    return {clean_id, clean_id + ".0"} if clean_id.isdigit() else {clean_id}
+
+
+def parse_date(value):
+    if isinstance(value, date):
+        return value
+    raw = str(value or "").strip()
+    if not raw:
+        return None
+    try:
+        return datetime.fromisoformat(raw[:19]).date() if "T" in raw else date.fromisoformat(raw[:10])
+    except ValueError:
+        return None
+
+
+def parse_score(value):
+    raw = str(value).strip()
+    return int(raw) if raw.isdigit() else None
+
+
+def _text(row, key):
+    value = row.get(key, "")
+    return "" if value is None else str(value)
+
+
+@dataclass(slots=True)
+class Student:
+    student_id: str
+    nickname: str = ""
+    pronoun_code: str = ""
+    chosen_tone: str = ""
+    current_goal: str = ""
+    current_success_measures: str = ""
+    current_goal_set_date: Optional[date] = None
+    goal_range: str = ""
+    background_info: str = ""
+
+    @classmethod
+    def from_row(cls, row):
+        return cls(
+            student_id=normalize_id(row.get("StudentID", "")),
+            nickname=_text(row, "Nickname"),
+            pronoun_code=_text(row, "PronounCode"),
+            chosen_tone=_text(row, "ChosenTone"),
+            current_goal=_text(row, "CurrentGoal"),
+            current_success_measures=_text(row, "CurrentSuccessMeasures"),
+            current_goal_set_date=parse_date(row.get("CurrentGoalSetDate")),
+            goal_range=_text(row, "GoalRange"),
+            background_info=_text(row, "BackgroundInfo"),
+        )
+
+    def to_row(self):
+        return {
+            "StudentID": self.student_id,
+            "Nickname": self.nickname,
+            "PronounCode": self.pronoun_code,
+            "ChosenTone": self.chosen_tone,
+            "CurrentGoal": self.current_goal,
+            "CurrentSuccessMeasures": self.current_success_measures,
+            "CurrentGoalSetDate": self.current_goal_set_date.isoformat() if self.current_goal_set_date else "",
+            "GoalRange": self.goal_range,
+            "BackgroundInfo": self.background_info,
+        }
+
+
+@dataclass(slots=True)
+class GoalHistoryEntry:
+    student_id: str
+    goal_set_date: Optional[date]
+    goal: str = ""
+    success_measures: str = ""
+    outcome_reflection: str = ""
+    score: Optional[int] = None  # GoalAchievement 0-4; None for "[first goal]" and blanks
+    background_info: str = ""
+
+    @classmethod
+    def from_row(cls, row):
+        return cls(
+            student_id=normalize_id(row.get("StudentID", "")),
+            goal_set_date=parse_date(row.get("GoalSetDate")),
+            goal=_text(row, "Goal"),
+            success_measures=_text(row, "SuccessMeasures"),
+            outcome_reflection=_text(row, "OutcomeReflection"),
+            score=parse_score(row.get("GoalAchievement", "")),
+            background_info=_text(row, "BackgroundInfo"),
+        )
+
+    def to_row(self):
+        return {
+            "StudentID": self.student_id,
+            "GoalSetDate": self.goal_set_date.isoformat() if self.goal_set_date else "",
+            "Goal": self.goal,
+            "SuccessMeasures": self.success_measures,
+            "OutcomeReflection": self.outcome_reflection,
+            "GoalAchievement": "" if self.score is None else str(self.score),
+            "BackgroundInfo": self.background_info,
+        }
+
+
+# Field order follows CHAT_LOG_COLUMNS so to_row() lines up with the positional Chats sheet
+@dataclass(slots=True)
+class ChatLog:
+    student_id: str
+    timestamp: Optional[datetime]
+    current_goal: str = ""
+    success_measures: str = ""
+    outcome_reflection: str = ""
+    score: Optional[int] = None
+    reflection: str = ""
+    tone: str = ""
+    chat_history_json: str = ""
+    user_type: str = ""
+    try_rating: str = ""
+    engage_rating: str = ""
+    tone_q: str = ""
+    change_q: str = ""
+
+    @classmethod
+    def from_row(cls, row):
+        raw_ts = str(row.get("Timestamp", "") or "").strip()
+        try:
+            timestamp = datetime.fromisoformat(raw_ts) if raw_ts else None
+        except ValueError:
+            timestamp = None
+        values = [_text(row, column) for column in CHAT_LOG_COLUMNS]
+        return cls(normalize_id(values[0]), timestamp, *values[2:5],
+                   parse_score(values[5]), *values[6:])
+
+    def to_row(self):
+        values = [getattr(self, f.name) for f in fields(self)]
+        values[1] = self.timestamp.isoformat() if self.timestamp else ""
+        values[5] = "" if self.score is None else str(self.score)
+        return dict(zip(CHAT_LOG_COLUMNS, values))
+
+
+# --- Column store for bulk GoalHistory analysis ---
+# Ids and goals are dictionary-encoded (int codes into a list of distinct values), dates are
+# datetime64[D] (NaT when missing) and scores int8 with MISSING_SCORE for unscored rows.
+class GoalHistoryColumns:
+    def __init__(self, entries):
+        entries = [e if isinstance(e, GoalHistoryEntry) else GoalHistoryEntry.from_row(e) for e in entries]
+        self.student_ids, self.student_codes = self._encode([e.student_id for e in entries])
+        self.goals, self.goal_codes = self._encode([e.goal for e in entries])
+        self.dates = np.array([e.goal_set_date or "NaT" for e in entries], dtype="datetime64[D]")
+        self.scores = np.array([MISSING_SCORE if e.score is None else e.score for e in entries], dtype=np.int8)
+        self._row_of_id = {sid: i for i, sid in enumerate(self.student_ids)}
+
+    @staticmethod
+    def _encode(values):
+        distinct = {}
+        codes = np.fromiter((distinct.setdefault(v, len(distinct)) for v in values), dtype=np.int32, count=len(values))
+        return list(distinct), codes
+
+    def __len__(self):
+        return len(self.scores)
+
+    def rows_for_student(self, student_id):
+        code = self._row_of_id.get(normalize_id(student_id))
+        if code is None:
+            return np.zeros(0, dtype=np.int64)
+        rows = np.flatnonzero(self.student_codes == code)
+        return rows[np.argsort(self.dates[rows], kind="stable")]
+
+    def entry(self, i):
+        return GoalHistoryEntry(
+            student_id=self.student_ids[self.student_codes[i]],
+            goal_set_date=None if np.isnat(self.dates[i]) else self.dates[i].item(),
+            goal=self.goals[self.goal_codes[i]],
+            score=None if self.scores[i] == MISSING_SCORE else int(self.scores[i]),
+        )
+
+    # Count of scored rows per student with a score in [low, high]
+    def count_scores_by_student(self, low, high):
+        hit = (self.scores >= low) & (self.scores <= high)
+        return np.bincount(self.student_codes[hit], minlength=len(self.student_ids))
+
+    def score_histogram(self):
+        scored = self.scores[self.scores != MISSING_SCORE]
+        return np.bincount(scored, minlength=5)
+
+    def nbytes(self):
+        return sum(a.nbytes for a in (self.student_codes, self.goal_codes, self.dates, self.scores))
@@ -0,0 +1,208 @@
+# reflection_commit.py
+# One goal reflection, written to Students and GoalHistory in one request, at most once.
+#
+# A reflection appends a GoalHistory row and updates a few cells of the student's Students
+# row. Both sheets live in the student's shard spreadsheet, so a ReflectionCommit stages the
+# appendCells and updateCells requests and sends them in a single spreadsheets.batchUpdate.
+# Sheets applies a batchUpdate atomically: either every change lands or none does.
+#
+# Each commit has an idempotency key, by default a hash of the student, goal, score and
+# reflection. The key is written into the GoalHistory row's CommitKey column, which is the
+# record of what landed. Each process reads a shard's CommitKey column once and keeps the keys
+# it has seen or written since, so a rerun of the same reflection returns without sending and a
+# normal save is the one batchUpdate. The column is read again wherever a send may already
+# have landed: before each retry, and when a queued commit replays (retry=True). The shared
+# cache also remembers committed keys across processes; a cache outage only loses that shortcut.
+#
+# The app commits through offline.commit_reflection, which queues the commit while Sheets is
+# unreachable:
+#
+#   commit = ReflectionCommit(student_id)
+#   commit.append_history({"GoalSetDate": ..., "Goal": ..., "OutcomeReflection": ..., "GoalAchievement": 3})
+#   commit.update_student(CurrentGoal=..., CurrentSuccessMeasures=..., CurrentGoalSetDate=...)
+#   commit.commit()     # "committed" or "already_committed"
+
+import hashlib
+import json
+import threading
+
+from google_sheets import get_headers, get_sheet, shard_for_student
+from records import normalize_id
+from shared_cache import _safe, bump_sheet, bump_student, cached, get_shared_cache, versioned_key
+from sheet_sync import note_write
+
+COMMIT_KEY_COLUMN = "CommitKey"
+COMMITTED_TTL = 30 * 86400
+
+
+def reflection_key(student_id, goal_set_date, goal, score, reflection):
+    raw = json.dumps([normalize_id(student_id), str(goal_set_date), goal, str(score), reflection.strip()])
+    return hashlib.sha256(raw.encode()).hexdigest()[:32]
+
+
+def _cell(value):
+    if isinstance(value, bool) or value is None:
+        return {"userEnteredValue": {"stringValue": "" if value is None else str(value)}}
+    if isinstance(value, (int, float)):
+        return {"userEnteredValue": {"numberValue": value}}
+    return {"userEnteredValue": {"stringValue": str(value)}}
+
+
+# Adds the CommitKey header to GoalHistory the first time a shard needs it
+def ensure_commit_key_column(shard):
+    headers = get_headers("GoalHistory", shard)
+    if COMMIT_KEY_COLUMN in headers:
+        return headers
+    sheet = get_sheet("GoalHistory", shard)
+    if sheet.col_count < len(headers) + 1:
+        sheet.add_cols(len(headers) + 1 - sheet.col_count)
+    sheet.update_cell(1, len(headers) + 1, COMMIT_KEY_COLUMN)
+    note_write(shard, "GoalHistory")
+    bump_sheet(shard, "GoalHistory")
+    return get_headers("GoalHistory", shard)
+
+
+# --- CommitKeys already in each shard's GoalHistory, as this process knows them ---
+_committed_keys = {}  # shard -> set of keys
+_committed_lock = threading.Lock()
+
+
+# fresh: read the column again instead of trusting this process's copy
+def _committed(shard, fresh=False):
+    with _committed_lock:
+        if not fresh and shard in _committed_keys:
+            return _committed_keys[shard]
+    headers = get_headers("GoalHistory", shard)
+    keys = set()
+    if COMMIT_KEY_COLUMN in headers:
+        keys = set(get_sheet("GoalHistory", shard).col_values(headers.index(COMMIT_KEY_COLUMN) + 1)[1:])
+    with _committed_lock:
+        keys |= _committed_keys.get(shard, set())
+        _committed_keys[shard] = keys
+    return keys
+
+
+def _note_committed(shard, key):
+    with _committed_lock:
+        _committed_keys.setdefault(shard, set()).add(key)
+
+
+# --- Where the student's Students row is ---
+# Cached under the Students sheet version: appending students never moves existing rows, and
+# deleting rows bumps the version.
+def _student_row_number(shard, student_id):
+    def load():
+        sheet = get_sheet("Students", shard)
+        ids = sheet.col_values(get_headers("Students", shard).index("StudentID") + 1)
+        return {normalize_id(v): i + 1 for i, v in enumerate(ids) if i > 0}
+
+    clean_id = normalize_id(student_id)
+    rows = cached(versioned_key("rowindex", shard, "Students"), load)
+    if clean_id not in rows:
+        rows = load()  # student added since the index was cached
+        cache = get_shared_cache()
+        _safe(cache, lambda: cache.set(versioned_key("rowindex", shard, "Students"), rows), None)
+    return rows.get(clean_id)
+
+
+class ReflectionCommit:
+    def __init__(self, student_id, idempotency_key=None):
+        self.student_id = normalize_id(student_id)
+        self.shard = shard_for_student(self.student_id)
+        self.idempotency_key = idempotency_key
+        self.history_entry = None
+        self.student_fields = {}
+
+    def append_history(self, entry):
+        self.history_entry = {"StudentID": self.student_id, **entry}
+        if self.idempotency_key is None:
+            self.idempotency_key = reflection_key(
+                self.student_id, entry.get("GoalSetDate", ""), entry.get("Goal", ""),
+                entry.get("GoalAchievement", ""), str(entry.get("OutcomeReflection", ""))
+            )
+        return self
+
+    def update_student(self, **fields):
+        self.student_fields.update({k: v for k, v in fields.items() if v is not None})
+        return self
+
+    def _marker(self):
+        return f"commit:{self.shard}:{self.idempotency_key}"
+
+    def _already_in_sheet(self, fresh=False):
+        return self.idempotency_key in _committed(self.shard, fresh)
+
+    def _remember(self):
+        _note_committed(self.shard, self.idempotency_key)
+        cache = get_shared_cache()
+        _safe(cache, lambda: cache.set(self._marker(), True, ttl=COMMITTED_TTL), None)
+
+    # Only reads; history_headers already include CommitKey (ensure_commit_key_column)
+    def _requests(self, history_headers):
+        requests = []
+        if self.history_entry is not None:
+            history = get_sheet("GoalHistory", self.shard)
+            headers = history_headers
+            row = {**self.history_entry, COMMIT_KEY_COLUMN: self.idempotency_key}
+            requests.append({"appendCells": {
+                "sheetId": history.id,
+                "rows": [{"values": [_cell(row.get(h, "")) for h in headers]}],
+                "fields": "userEnteredValue",
+            }})
+
+        if self.student_fields:
+            students = get_sheet("Students", self.shard)
+            headers = get_headers("Students", self.shard)
+            row_num = _student_row_number(self.shard, self.student_id)
+            if row_num is None:
+                raise KeyError(f"Student {self.student_id} not found in {self.shard}")
+            for column, value in self.student_fields.items():
+                col = headers.index(column)
+                requests.append({"updateCells": {
+                    "range": {"sheetId": students.id, "startRowIndex": row_num - 1, "endRowIndex": row_num,
+                              "startColumnIndex": col, "endColumnIndex": col + 1},
+                    "rows": [{"values": [_cell(value)]}],
+                    "fields": "userEnteredValue",
+                }})
+        return requests
+
+    # retry: an earlier send of this commit may have landed (a queued replay), so check the sheet
+    def commit(self, retries=2, retry=False):
+        cache = get_shared_cache()
+        if self.idempotency_key and _safe(cache, lambda: cache.get(self._marker()), None):
+            return "already_committed"
+
+        history_headers = None
+        if self.history_entry is not None:
+            # Headers are cached; only the first commit in a shard writes the CommitKey header
+            history_headers = ensure_commit_key_column(self.shard)
+            if self._already_in_sheet(fresh=retry):
+                self._remember()
+                return "already_committed"
+
+        # Built before the batchUpdate, so an unknown Students column fails before the reflection is sent
+        requests = self._requests(history_headers)
+        spreadsheet = get_sheet("Students", self.shard).spreadsheet
+        status = "committed"
+        for attempt in range(retries + 1):
+            # Cell updates are idempotent on their own; only the append needs checking
+            if attempt and self.history_entry is not None and self._already_in_sheet(fresh=True):
+                status = "already_committed"  # the earlier attempt landed before its response was lost
+                break
+            try:
+                spreadsheet.batch_update({"requests": requests})
+                break
+            except Exception as e:
+                if attempt == retries:
+                    raise
+                print(f"[REFLECTION COMMIT] Attempt {attempt + 1} failed, checking before retry: {e}")
+
+        if self.idempotency_key:
+            self._remember()
+        if self.history_entry is not None:
+            note_write(self.shard, "GoalHistory", append=True)
+            bump_student(self.shard, "GoalHistory", self.student_id)
+        if self.student_fields:
+            note_write(self.shard, "Students")
+            bump_student(self.shard, "Students", self.student_id)
+        return status
@@ -0,0 +1,175 @@
+# reflection_quality.py
+# Local reflection-quality score: how specific, on-topic and effortful a reflection reads.
+#
+# This replaces the raw character-length vagueness check, with no API call. Text is tokenised
+# into unigrams and bigrams. Each one found in the lexicon adds to a feature column:
+#
+#   effort    - things the student did ("tried", "asked", "spoke up", "practiced")
+#   specific  - concrete detail: when, where, who, why ("yesterday", "in my group", "because")
+#   vague     - filler that says nothing ("idk", "stuff", "i guess", "fine")
+#   on_topic  - content words taken from the goal text itself
+#   numbers   - counts, times and dates ("twice", "3 times", "9am")
+#
+# A batch of texts becomes one (texts x features) count matrix. Counts are square-root damped,
+# weighted, nudged by word count and squashed to 0..1; one reflection scores in tens of
+# microseconds on CPU.
+# The same scorer ranks the chatbot's candidate options against the goal and the student's
+# reflection.
+#
+#   scorer = ReflectionScorer()
+#   scorer.score("I asked my group two questions because I was stuck", goal_text)   # ~0.95
+#   scorer.score("idk it was fine", goal_text)                                      # ~0.03
+
+import re
+
+import numpy as np
+
+FEATURES = ("effort", "specific", "vague", "on_topic", "numbers")
+FEATURE_WEIGHTS = np.array([1.1, 0.8, -1.4, 0.9, 0.6], dtype=np.float32)
+LENGTH_WEIGHT = 0.35  # per log(word count); long answers help a little, never on their own
+BIAS = -1.6
+UNCLEAR_SCORE = 0.35  # default for motivation_triggers.unclear_reflection_score
+
+LEXICON = {
+    "effort": [
+        "tried", "try", "trying", "asked", "ask", "practiced", "practice", "prepared", "planned",
+        "spoke", "speak", "shared", "share", "listened", "wrote", "studied", "reviewed", "helped",
+        "explained", "focused", "worked", "finished", "started", "volunteered", "answered",
+        "raised my hand", "spoke up", "took notes", "kept going", "made myself", "pushed myself",
+        "checked in", "followed up", "worked on",
+    ],
+    "specific": [
+        "because", "when", "during", "after", "before", "since", "so that", "instead",
+        "today", "yesterday", "monday", "tuesday", "wednesday", "thursday", "friday", "weekend",
+        "class", "group", "partner", "teacher", "homework", "quiz", "test", "project", "discussion",
+        "lab", "presentation", "notes", "question", "questions", "in class", "my group",
+        "at home", "last week", "this week", "next time", "for example",
+    ],
+    "vague": [
+        "idk", "dunno", "stuff", "things", "thing", "fine", "ok", "okay", "whatever", "nothing",
+        "good", "bad", "meh", "sure", "maybe", "i guess", "i think", "kind of", "sort of",
+        "not sure", "don't know", "dont know", "nothing really", "it was", "just did",
+    ],
+    "numbers": [
+        "once", "twice", "first", "second", "third", "every", "each", "times", "minutes",
+        "hours", "days",
+    ],
+}
+
+STOPWORDS = frozenset(
+    "a an and are as at be by for from goal i in into is it its my of on or so that the this "
+    "to was were will with you your me we our be been do did not no can could would should "
+    "more less one two three least most each per".split()
+)
+
+_TOKEN = re.compile(r"[a-z0-9']+")
+_NUMBER = re.compile(r"\d")
+
+
+def _ngrams(text):
+    words = _TOKEN.findall(str(text).lower())
+    return words, words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+
+
+class ReflectionScorer:
+    def __init__(self, lexicon=None, weights=FEATURE_WEIGHTS, bias=BIAS):
+        self.columns = {}  # n-gram -> feature column
+        for name, terms in (lexicon or LEXICON).items():
+            for term in terms:
+                self.columns.setdefault(term, FEATURES.index(name))
+        self.weights = np.asarray(weights, dtype=np.float32)
+        self.bias = bias
+        self._topic_cache = {}
+
+    # Content words of the goal text ("Goal 2: Share one idea in group talk" -> share, idea, group, talk)
+    def topic_terms(self, goal_text):
+        key = str(goal_text or "")
+        terms = self._topic_cache.get(key)
+        if terms is None:
+            words = _TOKEN.findall(key.lower())
+            terms = frozenset(w for w in words if w not in STOPWORDS and not w.isdigit() and len(w) > 2)
+            if len(self._topic_cache) < 1024:
+                self._topic_cache[key] = terms
+        return terms
+
+    # (len(texts) x len(FEATURES)) counts, plus the word count of each text
+    def features(self, texts, topic=frozenset()):
+        rows, cols, lengths = [], [], []
+        on_topic, numbers = FEATURES.index("on_topic"), FEATURES.index("numbers")
+        for row, text in enumerate(texts):
+            words, grams = _ngrams(text)
+            lengths.append(len(words))
+            for gram in grams:
+                col = self.columns.get(gram)
+                if col is not None:
+                    rows.append(row)
+                    cols.append(col)
+            for word in words:
+                if word in topic:
+                    rows.append(row)
+                    cols.append(on_topic)
+                if _NUMBER.search(word):
+                    rows.append(row)
+                    cols.append(numbers)
+        flat = np.asarray(rows, dtype=np.intp) * len(FEATURES) + np.asarray(cols, dtype=np.intp)
+        counts = np.bincount(flat, minlength=len(texts) * len(FEATURES)).astype(np.float32)
+        return counts.reshape(len(texts), len(FEATURES)), np.asarray(lengths, dtype=np.float32)
+
+    def score_many(self, texts, goal_text="", extra_topic=()):
+        texts = list(texts)
+        if not texts:
+            return np.zeros(0, dtype=np.float32)
+        topic = self.topic_terms(goal_text) | frozenset(extra_topic)
+        counts, lengths = self.features(texts, topic)
+        # Square-root damping: the tenth effort word counts for less than the first
+        damped = np.sqrt(counts)
+        logits = damped @ self.weights + LENGTH_WEIGHT * np.log1p(lengths) + self.bias
+        scores = 1.0 / (1.0 + np.exp(-logits))
+        scores[lengths == 0] = 0.0
+        return scores
+
+    def score(self, text, goal_text=""):
+        return float(self.score_many([text], goal_text)[0])
+
+    # Parsed chatbot options, best first, by how well the statement and question fit the goal
+    # and pick up the student's own words
+    def rank_options(self, options, goal_text="", reflection=""):
+        if not options:
+            return []
+        reflection_words = self.topic_terms(reflection)
+        texts = [f"{o.get('statement') or ''} {o.get('question') or ''}" for o in options]
+        scores = self.score_many(texts, goal_text, reflection_words)
+        order = np.argsort(-scores, kind="stable")
+        return [{**options[i], "quality": round(float(scores[i]), 3)} for i in order]
+
+
+_scorer = None
+
+
+def get_scorer():
+    global _scorer
+    if _scorer is None:
+        _scorer = ReflectionScorer()
+    return _scorer
+
+
+def reflection_is_unclear(reflection, goal_text, cfg):
+    threshold = cfg.get("motivation_triggers", {}).get("unclear_reflection_score", UNCLEAR_SCORE)
+    return get_scorer().score(reflection, goal_text) < threshold
+
+
+if __name__ == "__main__":
+    import sys
+    import time
+
+    goal = sys.argv[2] if len(sys.argv) > 2 else "Goal 2: Share one idea during group discussion"
+    text = sys.argv[1] if len(sys.argv) > 1 else "I shared my idea in group discussion because my partner asked me"
+    scorer = get_scorer()
+    start = time.perf_counter()
+    runs = 10000
+    for _ in range(runs):
+        value = scorer.score(text, goal)
+    per_call_us = (time.perf_counter() - start) / runs * 1e6
+    print(f"score={value:.3f}  {per_call_us:.1f} µs/reflection")
+    counts, _ = scorer.features([text], scorer.topic_terms(goal))
+    print(dict(zip(FEATURES, counts[0].tolist())))
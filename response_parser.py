@@ -0,0 +1,148 @@
+# response_parser.py
+# Single-pass parser for the chatbot's "Option N / evaluation / Final response" output.
+#
+# Every marker ends in a colon. Each fed chunk is reversed, together with the few characters
+# before it that a marker could still reach back into, and one precompiled pattern that starts
+# with the colon is scanned over that, so the regex engine jumps from colon to colon and a
+# streamed response costs about the same as one parsed whole. The spans
+# between markers are assigned to the option statement/question, the evaluation, or the final
+# response. The same parser can be fed a token stream chunk by chunk: a marker is complete the
+# moment its colon arrives, so the final response is known as soon as it starts arriving.
+
+import re
+from dataclasses import dataclass, field
+
+# Matched backwards from a colon, so the pattern is spelled reversed: ":esnopser lanif" is
+# "final response:". The trailing \b is the word boundary before the marker, so
+# "misstatement:" is text, not a Statement marker. Markdown emphasis around markers
+# ("**Statement:**") is trimmed from the spans instead.
+_REVERSED_MARKER = re.compile(
+    r":[ \t]*(?:"
+    r"(?P<num>\d+)[ \t]+(?P<option>noitpo)"
+    r"|(?P<statement>tnemetats)"
+    r"|(?P<question>noitseuq)"
+    r"|(?P<evaluation>noitaulave)"
+    r"|(?P<best>noitpo tseb)"
+    r"|(?P<final>esnopser lanif)"
+    r")\b",
+    re.IGNORECASE,
+)
+_MARKER_REACH = 64  # characters before a colon the pattern may cover ("Option 12   :" and the like)
+_DECORATION = " \t\r\n*_#"
+_PARAGRAPH_BREAK = re.compile(r"\n[ \t]*\n")
+
+
+@dataclass
+class ParsedResponse:
+    options: list = field(default_factory=list)
+    evaluation: str = ""
+    final_response: str = ""
+    has_final: bool = False
+
+
+class ResponseParser:
+    def __init__(self):
+        self._chunks = []  # joined only when a result is asked for
+        self._tail = ""    # the last _MARKER_REACH characters, for markers split across chunks
+        self._size = 0
+        self._markers = []  # (kind, option_number, start, end)
+        self._closed = False
+
+    # --- Incremental input ---
+    def feed(self, chunk):
+        self._chunks.append(chunk)
+        self._scan(chunk)
+        return self
+
+    def close(self):
+        self._closed = True
+        return self.result()
+
+    def _text(self):
+        if len(self._chunks) > 1:
+            self._chunks = ["".join(self._chunks)]
+        return self._chunks[0] if self._chunks else ""
+
+    def _scan(self, chunk):
+        scanned, self._size = self._size, self._size + len(chunk)
+        recent = self._tail + chunk
+        self._tail = recent[-_MARKER_REACH:]
+        if self._markers and self._markers[-1][0] == "final":
+            return  # everything after "Final response:" is the final response
+        # Only the new chunk (and the reach before it) is reversed and scanned; matches come
+        # newest first, so stop at colons that were already scanned
+        window = recent[::-1]
+        found = []
+        for match in _REVERSED_MARKER.finditer(window):
+            colon = self._size - 1 - match.start()
+            if colon < scanned:
+                break  # a marker's text always arrives before its colon
+            # A match running into the window's edge may be cut short ("misstatement:")
+            if match.end() == len(window) and self._size > len(window):
+                continue
+            kind = match.lastgroup
+            number = int(match.group("num")[::-1]) if kind == "option" else None
+            found.append((kind, number, self._size - match.end(), colon + 1))
+        for marker in reversed(found):
+            self._markers.append(marker)
+            if marker[0] == "final":
+                return
+
+    # Final response streamed so far (empty until its marker has arrived)
+    def partial_final_response(self):
+        if self._markers and self._markers[-1][0] == "final":
+            return self._text()[self._markers[-1][3]:].strip(_DECORATION)
+        return ""
+
+    # --- Assemble the result from the marker spans ---
+    def result(self):
+        parsed = ParsedResponse()
+        text = self._text()
+        markers = self._markers
+        evaluation_parts = []
+        current = None  # option being filled
+
+        for i, (kind, number, start, end) in enumerate(markers):
+            span_end = markers[i + 1][2] if i + 1 < len(markers) else len(text)
+            span = text[end:span_end]
+
+            if kind == "option":
+                # Only an option whose Statement marker comes straight after it counts
+                current = None if span.strip(_DECORATION) else {"option": number, "statement": None, "question": None}
+            elif kind == "statement" and current is not None and current["statement"] is None:
+                current["statement"] = span.strip(_DECORATION)
+            elif kind == "question" and current is not None and current["statement"] is not None \
+                    and current["question"] is None:
+                # The question is one paragraph; prose after it belongs to the evaluation
+                split = _PARAGRAPH_BREAK.search(span)
+                current["question"] = (span[:split.start()] if split else span).strip(_DECORATION)
+                parsed.options.append(current)
+                current = None
+                if split:
+                    evaluation_parts.append(span[split.end():].strip(_DECORATION))
+            elif kind in ("evaluation", "best"):
+                current = None
+                evaluation_parts.append(text[start:span_end].strip(_DECORATION))
+            elif kind == "final":
+                parsed.has_final = True
+                parsed.final_response = span.strip(_DECORATION)
+                break
+
+        parsed.evaluation = "\n\n".join(part for part in evaluation_parts if part)
+        if not parsed.has_final:
+            parsed.final_response = text.strip() if self._closed else ""
+        return parsed
+
+
+def parse_response(raw_text):
+    return ResponseParser().feed(raw_text).close()
+
+
+# --- Drop-in replacements for the old regex helpers ---
+def extract_response_options(raw_text):
+    return parse_response(raw_text).options
+
+
+def extract_final_response(raw_text):
+    parsed = parse_response(raw_text)
+    return parsed.final_response if parsed.has_final else raw_text
@@ -0,0 +1,225 @@
+# session_context.py
+# Declared session-state keys, per-flow resets, idle-session eviction and a memory report.
+#
+# Every key the app keeps in st.session_state is declared once in SESSION_KEYS. Each
+# declaration gives the key's flow, its expected type, and optionally a default and a cleanup
+# hook. reset("persona") clears everything belonging to one persona run (persona, chat and
+# feedback flows), so nothing carries over into the next run the way gpt_options,
+# full_gpt_output, background_info and selected_words used to.
+#
+# Each session records when it was last active. A session that comes back after more than
+# IDLE_EVICT_SECONDS gets its persona flow reset on that run. That drops its chat history,
+# student row and planned warmup options, and it starts again from the ID screen. The app's own
+# table of sessions drops the idle ones at the same age. memory_report() gives approximate bytes
+# per key for one session; sessions_report() covers every tracked session, from the sizes each
+# session last sampled.
+
+import sys
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Optional
+
+from prefetch import discard_prefetch
+
+IDLE_EVICT_SECONDS = 30 * 60
+
+
+@dataclass(frozen=True, slots=True)
+class SessionKey:
+    name: str
+    flow: str                          # "session" keys survive every reset
+    kind: Any = object                 # expected type(s), checked by memory_report()
+    default: Optional[Callable] = None
+    on_discard: Optional[Callable] = None
+
+
+SESSION_KEYS = [
+    # Whole browser session
+    SessionKey("rerun_timings", "session", dict),
+    SessionKey("rerun_count", "session", int),
+    SessionKey("last_active", "session", float),
+    SessionKey("evicted_idle", "session", bool),
+    SessionKey("session_recorder", "session", object),
+
+    # One persona run, from picking a student ID to submitting feedback
+    SessionKey("step", "persona", str, default=lambda: "enter_id"),
+    SessionKey("student_id", "persona", str),
+    SessionKey("student", "persona", dict),
+    SessionKey("new_student_id", "persona", str),
+    SessionKey("goal_to_reflect", "persona", dict),
+    SessionKey("background_info", "persona", str),
+    SessionKey("background_collected", "persona", bool),
+    SessionKey("latest_reflection", "persona", str),
+    SessionKey("latest_score_value", "persona", int),
+    SessionKey("reflection_quality", "persona", float),
+    SessionKey("motivation_case", "persona", (str, type(None))),
+    SessionKey("warmup_plan", "persona", dict),
+    SessionKey("selected_words", "persona", set),
+    SessionKey("history_view", "persona", dict),
+
+    # The AI chat
+    SessionKey("chat_history", "chat", list, default=list),
+    SessionKey("chat_turn_count", "chat", int, default=lambda: 0),
+    SessionKey("chat_summary", "chat", dict, default=lambda: {"text": "", "upto": 0}),
+    SessionKey("chat_prompt_tokens", "chat", list, default=list),
+    SessionKey("chat_log_saved", "chat", bool),
+    SessionKey("tone_pref", "chat", str),
+    SessionKey("first_turn_prefetch", "chat", object, on_discard=discard_prefetch),
+    SessionKey("gpt_options", "chat", list),
+    SessionKey("full_gpt_output", "chat", str),
+    SessionKey("gpt_final_response", "chat", str),
+    SessionKey("log_timestamp", "chat", str),
+
+    # Feedback form
+    SessionKey("UserType", "feedback", str),
+    SessionKey("Try", "feedback", str),
+    SessionKey("Engage", "feedback", str),
+    SessionKey("Tone", "feedback", str),
+    SessionKey("Change", "feedback", str),
+]
+KEYS = {key.name: key for key in SESSION_KEYS}
+
+# Resetting a flow also resets the flows nested inside it
+FLOW_RESETS = {
+    "persona": ("persona", "chat", "feedback"),
+    "chat": ("chat", "feedback"),
+    "feedback": ("feedback",),
+}
+
+# Widget keys Streamlit stores alongside ours, by the flow they belong to
+WIDGET_PREFIXES = {
+    "persona": ("word_", "submit_reflection", "history_"),
+    "chat": ("chat_input_", "short_"),
+}
+
+
+def _deep_size(value, seen=None):
+    seen = seen if seen is not None else set()
+    if id(value) in seen:
+        return 0
+    seen.add(id(value))
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(_deep_size(k, seen) + _deep_size(v, seen) for k, v in value.items())
+    elif isinstance(value, (list, tuple, set, frozenset)):
+        size += sum(_deep_size(v, seen) for v in value)
+    elif hasattr(value, "__dict__") and not isinstance(value, type):
+        size += _deep_size(vars(value), seen)
+    return size
+
+
+class SessionContext:
+    def __init__(self, state):
+        self.state = state  # st.session_state, or the per-session state behind it
+
+    def _keys(self):
+        keys = getattr(self.state, "filtered_state", None)
+        return list(keys.keys() if keys is not None else self.state.keys())
+
+    def ensure_defaults(self):
+        for key in SESSION_KEYS:
+            if key.default is not None and key.name not in self.state:
+                self.state[key.name] = key.default()
+
+    def reset(self, flow):
+        flows = FLOW_RESETS[flow]
+        prefixes = tuple(p for f in flows for p in WIDGET_PREFIXES.get(f, ()))
+        for key in SESSION_KEYS:
+            if key.flow not in flows or key.name not in self.state:
+                continue
+            if key.on_discard:
+                key.on_discard(self.state[key.name])
+            del self.state[key.name]
+        for name in self._keys():
+            if prefixes and name.startswith(prefixes):
+                del self.state[name]
+        self.ensure_defaults()
+
+    def touch(self):
+        self.state["last_active"] = time.time()
+
+    def undeclared(self):
+        widget_prefixes = tuple(p for ps in WIDGET_PREFIXES.values() for p in ps)
+        return [name for name in self._keys() if name not in KEYS and not name.startswith(widget_prefixes)]
+
+    # {key: approximate bytes}, largest first; wrong-typed declared keys are flagged
+    def memory_report(self):
+        report = {}
+        for name in self._keys():
+            size = _deep_size(self.state[name])
+            declared = KEYS.get(name)
+            if declared and not isinstance(self.state[name], declared.kind):
+                name = f"{name} (unexpected {type(self.state[name]).__name__})"
+            report[name] = size
+        return dict(sorted(report.items(), key=lambda item: -item[1]))
+
+    def total_bytes(self):
+        return sum(self.memory_report().values())
+
+
+# --- Every live session, for idle eviction and the cross-session report ---
+# The app keeps its own record of the sessions it has served: session_id -> last-seen time and
+# the size last sampled by that session's own run. Other sessions' SessionState is never read or
+# written from here; a session only ever resets its own state, on its own script thread.
+# Eviction drops idle sessions from the record, and a session that comes back after more than
+# max_idle resets its persona flow on that first run.
+_sessions = {}
+_sessions_lock = threading.Lock()
+_warned_no_context = False
+
+
+def _current_session_id():
+    global _warned_no_context
+    from streamlit.runtime.scriptrunner import get_script_run_ctx
+    ctx = get_script_run_ctx(suppress_warning=True)
+    if ctx is None:
+        if not _warned_no_context:
+            _warned_no_context = True
+            print("[SESSION] No Streamlit script context (bare script); sessions aren't tracked")
+        return None
+    return ctx.session_id
+
+
+def track_session(context, max_idle=IDLE_EVICT_SECONDS):
+    now = time.time()
+    last_active = context.state["last_active"] if "last_active" in context.state else now
+    if now - last_active > max_idle:
+        context.reset("persona")
+        context.state["evicted_idle"] = True
+        print(f"[SESSION] Idle for {round(now - last_active)}s; persona run reset")
+    context.touch()
+
+    session_id = _current_session_id()
+    if session_id is not None:
+        with _sessions_lock:
+            _sessions.setdefault(session_id, {"bytes": None})["last_seen"] = now
+    return evict_idle_sessions(max_idle)
+
+
+# This session's size, when the app samples it (record_rerun_time in streamlit_app.py)
+def note_session_bytes(total):
+    session_id = _current_session_id()
+    if session_id is not None:
+        with _sessions_lock:
+            if session_id in _sessions:
+                _sessions[session_id]["bytes"] = total
+
+
+def evict_idle_sessions(max_idle=IDLE_EVICT_SECONDS):
+    cutoff = time.time() - max_idle
+    with _sessions_lock:
+        idle = [session_id for session_id, seen in _sessions.items() if seen["last_seen"] < cutoff]
+        for session_id in idle:
+            del _sessions[session_id]
+    if idle:
+        print(f"[SESSION] Evicted {len(idle)} idle sessions")
+    return len(idle)
+
+
+def sessions_report():
+    now = time.time()
+    with _sessions_lock:
+        report = [{"session_id": session_id, "idle_s": round(now - seen["last_seen"]), "bytes": seen["bytes"]}
+                  for session_id, seen in _sessions.items()]
+    return sorted(report, key=lambda r: -(r["bytes"] or 0))
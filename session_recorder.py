@@ -0,0 +1,404 @@
+# session_recorder.py
+# Records a Streamlit session, and replays recorded sessions at full speed against fake backends.
+#
+# Recording is off unless RECORD_SESSIONS names a directory. When it is on, each browser
+# session appends to recordings/<date>/<session id>.jsonl.gz:
+#
+#   run     a full script run starts, on step <step>
+#   input   a widget returned a new value (buttons: only when clicked), by widget type + label + key
+#   call    a Sheets read/write (through offline.py) or an OpenAI request: arguments, result, ms
+#   end     the run finished: step before and after, wall time
+#
+# Inputs that arrive between an "end" and the next "run" came from a fragment rerun (the chat
+# reply box, the feedback form). Events are buffered per run and flushed as one gzip member.
+#
+# Replay drives streamlit_app.py through Streamlit's AppTest. Before each recorded run it sets
+# the widgets to the recorded values, then times the run. Sheets and OpenAI are replaced by a
+# fake that answers each call with its recorded result, with no latency, so the time measured
+# is the app's own. A missing OpenAI reply falls back to llm.StubClient.
+#
+#   RECORD_SESSIONS=recordings streamlit run streamlit_app.py
+#   python session_recorder.py recordings/2026-10-19/*.jsonl.gz
+#   python session_recorder.py recordings/ --baseline benchmarks/replay_baseline.json          # check
+#   python session_recorder.py recordings/ --baseline benchmarks/replay_baseline.json --update # record
+
+import argparse
+import functools
+import glob
+import gzip
+import json
+import os
+import statistics
+import sys
+import threading
+import time
+import uuid
+from collections import defaultdict, deque
+from datetime import date
+
+RECORD_DIR_ENV = "RECORD_SESSIONS"
+SHEETS_CALLS = [
+    "get_student_info", "get_student_context", "get_goal_history_for_student", "get_all_records_all_shards",
+    "get_history_summary", "get_history_page", "create_student_if_missing", "add_goal_history_entry",
+    "add_chat_log_entry", "update_student_current_goal", "commit_reflection",
+]
+WIDGETS = ["button", "text_input", "text_area", "selectbox", "radio"]
+REGRESSION_TOLERANCE = 0.25
+
+_local = threading.local()
+_installed = False
+_UNSET = object()
+
+
+def recording_dir():
+    return os.environ.get(RECORD_DIR_ENV)
+
+
+# Set by begin_run on the script thread. Widget callbacks and fragment reruns run before or
+# without begin_run, so those find the recorder in their session's state instead.
+def current():
+    recorder = getattr(_local, "recorder", None)
+    if recorder is not None or not recording_dir():
+        return recorder
+    try:
+        from streamlit.runtime.scriptrunner import get_script_run_ctx
+        ctx = get_script_run_ctx(suppress_warning=True)
+        if ctx is not None and "session_recorder" in ctx.session_state:
+            return ctx.session_state["session_recorder"]
+    except Exception:
+        pass
+    return None
+
+
+# --- OpenAI responses <-> JSON ---
+def _encode_completion(response):
+    usage = getattr(response, "usage", None)
+    return {
+        "content": response.choices[0].message.content,
+        "usage": [usage.prompt_tokens, usage.completion_tokens, usage.total_tokens] if usage else [0, 0, 0],
+    }
+
+
+def _decode_completion(model, result):
+    from llm import _response
+    return _response(model, result["content"], *result["usage"])
+
+
+class SessionRecorder:
+    def __init__(self, directory, session_id=None):
+        self.session_id = session_id or uuid.uuid4().hex[:12]
+        self.path = os.path.join(directory, date.today().isoformat(), f"{self.session_id}.jsonl.gz")
+        self.started_at = time.time()
+        self._events = []
+        self._last_values = {}
+        self._lock = threading.Lock()
+
+    def _event(self, kind, **fields):
+        with self._lock:
+            self._events.append({"t": round(time.time() - self.started_at, 3), "k": kind, **fields})
+
+    def begin_run(self, step):
+        self.flush()  # events since the last "end" belong to a fragment run
+        _local.recorder = self
+        self._event("run", step=step)
+
+    def end_run(self, step, next_step, ms):
+        self._event("end", step=step, next=next_step, ms=round(ms, 1))
+        self.flush()
+
+    def input(self, widget, label, key, value):
+        if widget == "button":
+            if not value:
+                return
+        else:
+            ident = (widget, label, key)
+            if self._last_values.get(ident, _UNSET) == value:
+                return
+            self._last_values[ident] = value
+        self._event("input", w=widget, label=label, key=key, v=value)
+
+    def call(self, service, fn, args, result, ms, error=None):
+        fields = {"svc": service, "fn": fn, "args": args, "ms": round(ms, 1)}
+        if error is not None:
+            fields["error"] = error
+        else:
+            fields["result"] = result
+        self._event("call", **fields)
+
+    def flush(self):
+        with self._lock:
+            events, self._events = self._events, []
+        if not events:
+            return
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        data = "".join(json.dumps(e, ensure_ascii=False, separators=(",", ":"), default=str) + "\n" for e in events)
+        with gzip.open(self.path, "at", encoding="utf-8") as f:  # one gzip member per flush
+            f.write(data)
+
+    # For work handed to another thread (the first-turn prefetch): its calls land in this session
+    def bind(self, fn):
+        @functools.wraps(fn)
+        def bound(*args, **kwargs):
+            _local.recorder = self
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                _local.recorder = None
+        return bound
+
+
+def bind(fn):
+    recorder = current()
+    return recorder.bind(fn) if recorder else fn
+
+
+# The recorder for this browser session, kept in its session state (None when recording is off)
+def for_session(state):
+    directory = recording_dir()
+    if not directory:
+        return None
+    if "session_recorder" not in state:
+        state["session_recorder"] = SessionRecorder(directory)
+    return state["session_recorder"]
+
+
+# --- Wrappers, installed before streamlit_app.py imports the wrapped names ---
+def _recorded_call(service, name, fn, encode=lambda r: r, args_of=None):
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        recorder = current()
+        if recorder is None:
+            return fn(*args, **kwargs)
+        call_args = args_of(args, kwargs) if args_of else {"args": list(args), "kwargs": kwargs}
+        start = time.perf_counter()
+        try:
+            result = fn(*args, **kwargs)
+        except Exception as e:
+            recorder.call(service, name, call_args, None, (time.perf_counter() - start) * 1000, error=repr(e))
+            raise
+        recorder.call(service, name, call_args, encode(result), (time.perf_counter() - start) * 1000)
+        return result
+    return wrapper
+
+
+# A button with on_click is recorded when its callback fires: the click may hide the button,
+# as "Show older goals" does on the last page, so it never returns True in a later run
+def _recorded_widget(widget, fn):
+    @functools.wraps(fn)
+    def wrapper(label, *args, **kwargs):
+        callback = kwargs.get("on_click") if widget == "button" else None
+        if callback is not None:
+            @functools.wraps(callback)
+            def clicked(*cb_args, **cb_kwargs):
+                recorder = current()
+                if recorder is not None:
+                    recorder.input(widget, label, kwargs.get("key"), True)
+                return callback(*cb_args, **cb_kwargs)
+            kwargs["on_click"] = clicked
+        value = fn(label, *args, **kwargs)
+        recorder = current()
+        if recorder is not None and callback is None:
+            recorder.input(widget, label, kwargs.get("key"), value)
+        return value
+    return wrapper
+
+
+def install():
+    global _installed
+    if _installed or not recording_dir():
+        return
+    _installed = True
+
+    import streamlit as st
+    import llm
+    import offline
+
+    for name in SHEETS_CALLS:
+        setattr(offline, name, _recorded_call("sheets", name, getattr(offline, name)))
+    offline.guarded_completion = _recorded_call(
+        "openai", "guarded_completion", offline.guarded_completion, _encode_completion,
+        args_of=lambda args, kwargs: {"kwargs": kwargs},  # args[0] is the client's create method
+    )
+    llm.chat_completion = _recorded_call(
+        "openai", "chat_completion", llm.chat_completion, _encode_completion,
+        args_of=lambda args, kwargs: {"args": list(args), "kwargs": {k: v for k, v in kwargs.items() if k != "client"}},
+    )
+    for widget in WIDGETS:
+        setattr(st, widget, _recorded_widget(widget, getattr(st, widget)))
+    print(f"[RECORDER] Recording sessions to {recording_dir()}")
+
+
+# --- Replay ---
+def load_events(path):
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+# One group per script run: the inputs to apply first, the recorded time if it was a full run
+def run_groups(events):
+    groups = []
+    group = None
+    for event in events:
+        if event["k"] == "run":
+            group = {"step": event["step"], "inputs": [], "recorded_ms": None, "backend_ms": 0.0}
+            groups.append(group)
+        elif event["k"] == "end" and group is not None:
+            group["recorded_ms"] = event["ms"]
+            group = None
+        elif event["k"] in ("input", "call"):
+            if group is None:
+                group = {"step": "fragment", "inputs": [], "recorded_ms": None, "backend_ms": 0.0}
+                groups.append(group)
+            if event["k"] == "input":
+                group["inputs"].append(event)
+            else:
+                group["backend_ms"] += event["ms"]
+    return groups
+
+
+class ReplayBackend:
+    def __init__(self, events):
+        self.calls = defaultdict(deque)  # fn -> recorded calls, in order
+        for event in events:
+            if event["k"] == "call":
+                self.calls[event["fn"]].append(event)
+        self.served = 0
+        self.missed = defaultdict(int)
+
+    def _take(self, fn, call_args):
+        queue = self.calls[fn]
+        key = json.dumps(call_args, sort_keys=True, default=str)
+        for i, event in enumerate(queue):
+            if json.dumps(event["args"], sort_keys=True, default=str) == key:
+                del queue[i]
+                return event
+        return queue.popleft() if queue else None  # arguments drifted (timestamps); take the next one
+
+    def _fake(self, fn, default):
+        def fake(*args, **kwargs):
+            event = self._take(fn, {"args": list(args), "kwargs": kwargs})
+            if event is None:
+                self.missed[fn] += 1
+                return default() if callable(default) else default
+            self.served += 1
+            if "error" in event:
+                raise RuntimeError(event["error"])  # the recorded session saw this call fail
+            return event["result"]
+        return fake
+
+    def _fake_completion(self, fn):
+        from llm import StubClient
+
+        def fake(*args, **kwargs):
+            if fn == "guarded_completion":
+                args, call_args = args[1:], {"kwargs": kwargs}
+            else:
+                kwargs.pop("client", None)
+                call_args = {"args": list(args), "kwargs": kwargs}
+            event = self._take(fn, call_args)
+            if event is None:
+                self.missed[fn] += 1
+                messages = kwargs.get("messages") or (args[0] if args else [])
+                return StubClient().chat.completions.create(model=kwargs.get("model", "gpt-4"), messages=messages)
+            self.served += 1
+            if "error" in event:
+                raise RuntimeError(event["error"])
+            return _decode_completion(kwargs.get("model", "gpt-4"), event["result"])
+        return fake
+
+    def install(self):
+        import background_summary
+        import llm
+        import offline
+        import warmup
+        from llm import StubClient
+
+        defaults = {"get_goal_history_for_student": list, "get_all_records_all_shards": list, "get_history_page": list,
+                    "get_student_context": lambda: {"student": None, "goal_history": [], "headers": {}},
+                    "get_history_summary": lambda: {"count": 0, "streak": 0, "recent": [], "pages": 0}}
+        for name in SHEETS_CALLS:
+            setattr(offline, name, self._fake(name, defaults.get(name)))
+        offline.guarded_completion = self._fake_completion("guarded_completion")
+        llm.chat_completion = self._fake_completion("chat_completion")
+        llm.get_openai_client = lambda: StubClient()
+        offline.start_snapshot_refresh = lambda interval=600: None
+        warmup.RecentPromptIndex.record = lambda index, student_id, prompt: None  # no writes to the real index
+        background_summary.enqueue_background_refresh = lambda student_id: None  # its worker reads Sheets directly
+
+
+def replay(path, app_path="streamlit_app.py", timeout=60):
+    from streamlit.testing.v1 import AppTest
+
+    events = load_events(path)
+    backend = ReplayBackend(events)
+    backend.install()
+    app = AppTest.from_file(app_path, default_timeout=timeout)
+
+    runs = []
+    for group in run_groups(events):
+        applied = 0
+        for event in group["inputs"]:
+            widgets = [w for w in getattr(app, event["w"], []) if w.label == event["label"]
+                       and (event["key"] is None or getattr(w, "key", None) == event["key"])]
+            if not widgets:
+                continue  # first shown in this run, so it still had its default value
+            if event["w"] == "button":
+                widgets[0].click()
+            else:
+                widgets[0].set_value(event["v"])
+            applied += 1
+        start = time.perf_counter()
+        app.run()
+        runs.append({
+            "step": group["step"], "inputs": applied, "replay_ms": (time.perf_counter() - start) * 1000,
+            "recorded_ms": group["recorded_ms"], "backend_ms": group["backend_ms"],
+            "errors": [str(e.value) for e in app.exception],
+        })
+    return {"path": path, "runs": runs, "served": backend.served, "missed": dict(backend.missed),
+            "unused": {fn: len(queue) for fn, queue in backend.calls.items() if queue}}
+
+
+def _report(result):
+    print(f"\n{result['path']}  ({len(result['runs'])} runs, {result['served']} backend calls replayed"
+          f"{', missed ' + str(result['missed']) if result['missed'] else ''})")
+    print(f"  {'step':<24} {'recorded':>10} {'backends':>10} {'replay':>10}")
+    for run in result["runs"]:
+        recorded = f"{run['recorded_ms']:.0f} ms" if run["recorded_ms"] is not None else "-"
+        print(f"  {run['step']:<24} {recorded:>10} {run['backend_ms']:>7.0f} ms {run['replay_ms']:>7.1f} ms"
+              + (f"  ERROR {run['errors'][0]}" if run["errors"] else ""))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay recorded sessions against fake backends.")
+    parser.add_argument("paths", nargs="+", help="recordings (.jsonl.gz) or directories of them")
+    parser.add_argument("--app", default="streamlit_app.py")
+    parser.add_argument("--repeat", type=int, default=3, help="replays per recording; the median counts")
+    parser.add_argument("--baseline", help="JSON file of replay ms per recording")
+    parser.add_argument("--update", action="store_true", help="write the baseline instead of checking it")
+    parser.add_argument("--tolerance", type=float, default=REGRESSION_TOLERANCE)
+    args = parser.parse_args()
+
+    os.environ.pop(RECORD_DIR_ENV, None)       # never record a replay
+    os.environ.setdefault("SHARED_CACHE_URL", "off")
+    paths = sorted(p for path in args.paths for p in
+                   (glob.glob(os.path.join(path, "**", "*.jsonl.gz"), recursive=True) if os.path.isdir(path) else [path]))
+
+    totals = {}
+    for path in paths:
+        results = [replay(path, args.app) for _ in range(args.repeat)]
+        _report(results[-1])
+        totals[path] = statistics.median(sum(r["replay_ms"] for r in result["runs"]) for result in results)
+
+    if args.baseline and args.update:
+        with open(args.baseline, "w") as f:
+            json.dump({path: round(ms, 1) for path, ms in totals.items()}, f, indent=2, sort_keys=True)
+        print(f"\n[REPLAY] Baseline written to {args.baseline}")
+    elif args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = [(path, baseline[path], ms) for path, ms in totals.items()
+                       if path in baseline and ms > baseline[path] * (1 + args.tolerance)]
+        for path, before, after in regressions:
+            print(f"[REPLAY] Slower: {path} {before:.0f} ms -> {after:.0f} ms")
+        print(f"\n[REPLAY] {len(regressions)} of {len(totals)} recordings regressed by more than {args.tolerance:.0%}")
+        sys.exit(1 if regressions else 0)
@@ -0,0 +1,215 @@
+# shared_cache.py
+# Cache shared by every app replica and worker on a host (SQLite) or a fleet (Redis).
+#
+# Streamlit's caches live inside one process, so each replica used to re-read Students and
+# GoalHistory on its own. This tier sits under google_sheets.py and llm.py instead. It holds
+# student rows, per-student history slices, sheet headers and LLM completions, all as JSON.
+#
+# Invalidation is by version numbers, not by deleting keys. A cached value's key embeds the
+# current version of its sheet and of its student:
+#
+#   student:demo:Students:s4:300:u7    <- Students sheet version 4, student 300 version 7
+#
+# A write for one student bumps that student's version. Deleting rows (dedupe, archiving)
+# bumps the whole sheet's version. Either way every replica's next
+# read misses and refetches; stale entries are never read again and age out by TTL.
+#
+#   SHARED_CACHE_URL=sqlite:///path/to/cache.sqlite3   (default: .shared_cache.sqlite3 in this directory)
+#   SHARED_CACHE_URL=redis://localhost:6379/0
+#   SHARED_CACHE_URL=off
+
+import abc
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from records import normalize_id
+
+# Next to this file, so the app and a cron job started from another directory share one cache
+DEFAULT_URL = "sqlite:///" + os.path.join(os.path.dirname(os.path.abspath(__file__)), ".shared_cache.sqlite3")
+DEFAULT_TTL = 300  # seconds; bounds staleness from edits made directly in the spreadsheet
+
+
+class SharedCache(abc.ABC):
+    @abc.abstractmethod
+    def get_many(self, keys):
+        ...
+
+    @abc.abstractmethod
+    def set(self, key, value, ttl=DEFAULT_TTL):
+        ...
+
+    @abc.abstractmethod
+    def incr(self, key):
+        ...
+
+    def get(self, key):
+        return self.get_many([key])[0]
+
+
+class NullCache(SharedCache):
+    def get_many(self, keys):
+        return [None] * len(keys)
+
+    def set(self, key, value, ttl=DEFAULT_TTL):
+        pass
+
+    def incr(self, key):
+        return 0
+
+
+# --- One SQLite file shared by every process on the host ---
+class SQLiteCache(SharedCache):
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._connect().execute(
+            "CREATE TABLE IF NOT EXISTS kv (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires REAL)"
+        )
+        self.purge_expired()
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")     # readers never wait on the writer
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get_many(self, keys):
+        if not keys:
+            return []
+        rows = self._connect().execute(
+            f"SELECT key, value FROM kv WHERE key IN ({','.join('?' * len(keys))}) "
+            "AND (expires IS NULL OR expires > ?)",
+            (*keys, time.time())
+        ).fetchall()
+        found = {key: json.loads(value) for key, value in rows}
+        return [found.get(key) for key in keys]
+
+    def set(self, key, value, ttl=DEFAULT_TTL):
+        expires = time.time() + ttl if ttl else None
+        self._connect().execute(
+            "INSERT OR REPLACE INTO kv (key, value, expires) VALUES (?, ?, ?)",
+            (key, json.dumps(value), expires)
+        )
+
+    def incr(self, key):
+        # Plain INSERT OR IGNORE / UPDATE / SELECT, which any SQLite 3 runs. BEGIN IMMEDIATE takes
+        # the write lock up front, so concurrent bumps from other processes queue instead of
+        # reading the same old value.
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("INSERT OR IGNORE INTO kv (key, value, expires) VALUES (?, '0', NULL)", (key,))
+            conn.execute("UPDATE kv SET value = CAST(value AS INTEGER) + 1, expires = NULL WHERE key = ?", (key,))
+            value = conn.execute("SELECT value FROM kv WHERE key = ?", (key,)).fetchone()[0]
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+        return int(value)
+
+    def purge_expired(self):
+        return self._connect().execute("DELETE FROM kv WHERE expires <= ?", (time.time(),)).rowcount
+
+
+# --- Redis (or anything speaking its protocol) for replicas on several hosts ---
+class RedisCache(SharedCache):
+    def __init__(self, url):
+        import redis  # only needed when SHARED_CACHE_URL points at Redis
+        self._redis = redis.Redis.from_url(url)
+
+    def get_many(self, keys):
+        if not keys:
+            return []
+        return [json.loads(v) if v is not None else None for v in self._redis.mget(keys)]
+
+    def set(self, key, value, ttl=DEFAULT_TTL):
+        self._redis.set(key, json.dumps(value), ex=ttl or None)
+
+    def incr(self, key):
+        return self._redis.incr(key)
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_shared_cache():
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            url = os.environ.get("SHARED_CACHE_URL", DEFAULT_URL)
+            try:
+                if url == "off":
+                    _cache = NullCache()
+                elif url.startswith("redis://") or url.startswith("rediss://"):
+                    _cache = RedisCache(url)
+                else:
+                    _cache = SQLiteCache(url.removeprefix("sqlite:///"))
+            except Exception as e:
+                print(f"[SHARED CACHE] {url} unavailable, caching disabled: {e}")
+                _cache = NullCache()
+        return _cache
+
+
+# --- Versioned keys ---
+def _safe(cache, fn, default):
+    try:
+        return fn()
+    except Exception as e:
+        print(f"[SHARED CACHE] {e}")  # a broken cache never breaks a request
+        return default
+
+
+def versioned_key(kind, shard, sheet_name, student_id=None):
+    cache = get_shared_cache()
+    version_keys = [f"v:{shard}:{sheet_name}"]
+    if student_id is not None:
+        version_keys.append(f"v:{shard}:{sheet_name}:{normalize_id(student_id)}")
+    versions = _safe(cache, lambda: cache.get_many(version_keys), [None] * len(version_keys))
+    key = f"{kind}:{shard}:{sheet_name}:s{versions[0] or 0}"
+    if student_id is not None:
+        key += f":{normalize_id(student_id)}:u{versions[1] or 0}"
+    return key
+
+
+def cached(key, load, ttl=DEFAULT_TTL):
+    cache = get_shared_cache()
+    value = _safe(cache, lambda: cache.get(key), None)
+    if value is None:
+        value = load()
+        if value is not None:
+            _safe(cache, lambda: cache.set(key, value, ttl), None)
+    return value
+
+
+# A failed bump isn't a cache miss: every replica keeps serving the old rows until the TTL
+# runs out. The write itself already landed, so it still doesn't fail the request, but it's
+# logged as such and the bump functions return False.
+def _bump(key):
+    cache = get_shared_cache()
+    try:
+        cache.incr(key)
+        return True
+    except Exception as e:
+        print(f"[SHARED CACHE] Version bump failed for {key}; cached copies stay stale for up to {DEFAULT_TTL}s: {e}")
+        return False
+
+
+def bump_student(shard, sheet_name, student_id):
+    return _bump(f"v:{shard}:{sheet_name}:{normalize_id(student_id)}")
+
+
+def bump_sheet(shard, sheet_name):
+    return _bump(f"v:{shard}:{sheet_name}")
+
+
+# --- LLM completions ---
+def completion_key(**request):
+    return "llm:" + hashlib.sha256(json.dumps(request, sort_keys=True).encode()).hexdigest()
@@ -0,0 +1,258 @@
+# sheet_sync.py
+# Keeps in-memory replicas of the Students / GoalHistory / Chats sheets fresh for O(new rows)
+# per poll instead of a full get_all_records. With SHEET_SYNC_INTERVAL set, google_sheets.py
+# reads whole sheets from these replicas (replica_records) instead of from the API.
+#
+# Each poll first checks the spreadsheet's Drive modifiedTime (one small request per shard).
+# Only if that moved does it read the _SyncMeta sheet, where one formula per watched sheet
+# reports its data-row count:
+#
+#   Students | =COUNTA('Students'!A2:A)
+#
+# Each replica then reads its own last row plus any rows past it, in one range read, and
+# compares that row with the copy it holds. Both copies come from get_values, so formatted
+# numbers and dates compare the same way on both sides. Same last row and more rows is a pure
+# append: only the new rows are kept. A different last row or fewer rows is an edit, and the
+# sheet is re-read once. An in-place edit above the last row changes neither signal, so after
+# any change a replica keeps checking on each poll and is re-read once its copy is older than
+# RELOAD_SECONDS (the same bound the shared cache TTL puts on hand edits). Writes made through
+# google_sheets.py are reported here (note_write), so the next read sees them without waiting.
+#
+# Without a _SyncMeta sheet every detected change falls back to a full re-read. Rows with an
+# empty first cell make COUNTA undercount, which also shows up as an edit.
+#
+#   SHEET_SYNC_INTERVAL=30 streamlit run streamlit_app.py   # replicas on, polled every 30 s
+#   python sheet_sync.py --install     # create/refresh the _SyncMeta formulas in every shard
+
+import argparse
+import os
+import threading
+import time
+
+from gspread.utils import numericise_all
+
+from google_sheets import get_sheet, shard_names
+
+META_SHEET = "_SyncMeta"
+WATCHED_SHEETS = ["Students", "GoalHistory", "Chats"]
+LAST_COLUMN = "Z"
+RELOAD_SECONDS = 300
+INTERVAL_ENV = "SHEET_SYNC_INTERVAL"
+
+
+def sync_interval():
+    try:
+        return float(os.environ.get(INTERVAL_ENV, "0"))
+    except ValueError:
+        return 0.0
+
+
+# get_values pads every row to the widest row in its response; compare rows without that padding
+def _trim(row):
+    row = list(row)
+    while row and row[-1] == "":
+        row.pop()
+    return row
+
+
+def _last_update_time(spreadsheet):
+    try:
+        if hasattr(spreadsheet, "get_lastUpdateTime"):
+            return spreadsheet.get_lastUpdateTime()
+        return spreadsheet.lastUpdateTime
+    except Exception:
+        return None  # no Drive access; every poll goes on to the row-count read
+
+
+class SheetReplica:
+    def __init__(self, sheet_name, shard):
+        self.sheet_name = sheet_name
+        self.shard = shard
+        self.headers = []
+        self.rows = []          # raw formatted values, sheet row n is rows[n - 2]
+        self.loaded_at = None   # last full read; None until the first one
+        self.written = False    # this process wrote to the sheet since the last sync
+        self.unverified = False # changed since the last full read; may hide an edit above the last row
+        self.rows_fetched = 0
+        self.full_reloads = 0
+        self._lock = threading.Lock()       # headers/rows, for readers
+        self._sync_lock = threading.Lock()  # one sync at a time (poller vs a reader)
+
+    # The same dicts get_all_records() returns: formatted cells, numbers numericised
+    def records(self):
+        with self._lock:
+            headers, rows = self.headers, list(self.rows)
+        width = len(headers)
+        return [dict(zip(headers, numericise_all(row[:width] + [""] * (width - len(row)))))
+                for row in rows]
+
+    def _reload(self):
+        values = get_sheet(self.sheet_name, self.shard).get_values(f"A1:{LAST_COLUMN}")
+        headers, rows = (values[0], values[1:]) if values else ([], [])
+        with self._lock:
+            self.headers, self.rows = headers, rows
+        self.loaded_at = time.time()
+        self.unverified = False
+        self.rows_fetched += len(rows)
+        self.full_reloads += 1
+        return "reloaded"
+
+    # remote_rows is the sheet's data-row count from _SyncMeta, or None if unavailable
+    def sync(self, remote_rows):
+        with self._sync_lock:
+            self.written = False
+            local_rows = len(self.rows)
+            if (self.loaded_at is None or remote_rows is None or local_rows == 0 or remote_rows < local_rows
+                    or time.time() - self.loaded_at > RELOAD_SECONDS):
+                return self._reload()
+
+            # The replica's last row and everything after it, in one read
+            fetched = get_sheet(self.sheet_name, self.shard).get_values(
+                f"A{local_rows + 1}:{LAST_COLUMN}{remote_rows + 1}")
+            self.rows_fetched += len(fetched)
+            if len(fetched) != remote_rows - local_rows + 1 or _trim(fetched[0]) != _trim(self.rows[-1]):
+                return self._reload()
+            self.unverified = True
+            if len(fetched) == 1:
+                return "unchanged"
+            with self._lock:
+                self.rows = self.rows + fetched[1:]
+            return "appended"
+
+
+class ShardSync:
+    def __init__(self, shard, sheet_names=WATCHED_SHEETS):
+        self.shard = shard
+        self.replicas = {name: SheetReplica(name, shard) for name in sheet_names}
+        self.modified = None
+        self.polls = 0
+
+    def row_counts(self):
+        try:
+            values = get_sheet(META_SHEET, self.shard).get_values("A2:B")
+        except Exception:
+            return None
+        return {row[0]: int(float(row[1])) for row in values if len(row) >= 2 and row[1] != ""}
+
+    def poll(self):
+        self.polls += 1
+        any_sheet = next(iter(self.replicas.values()))
+        modified = _last_update_time(get_sheet(any_sheet.sheet_name, self.shard).spreadsheet)
+        if modified is not None and modified == self.modified and not any(r.unverified for r in self.replicas.values()):
+            return {name: "unchanged" for name in self.replicas}
+
+        counts = self.row_counts()
+        results = {
+            name: replica.sync(counts.get(name) if counts is not None else None)
+            for name, replica in self.replicas.items()
+        }
+        self.modified = modified
+        return results
+
+
+# --- Process-wide replicas, polled on a background thread ---
+_syncs = {}
+_poller = None
+_syncs_lock = threading.Lock()
+
+
+def _sync_for(shard):
+    with _syncs_lock:
+        if shard not in _syncs:
+            _syncs[shard] = ShardSync(shard)
+        return _syncs[shard]
+
+
+# Records for a whole sheet from its replica, or None when replicas are off (google_sheets.py
+# then reads the sheet itself). A replica this process just wrote to syncs before answering.
+def replica_records(sheet_name, shard):
+    interval = sync_interval()
+    if interval <= 0 or sheet_name not in WATCHED_SHEETS:
+        return None
+    start_polling(interval)
+    sync = _sync_for(shard)
+    replica = sync.replicas[sheet_name]
+    if replica.loaded_at is None or replica.written:
+        counts = sync.row_counts()
+        replica.sync(counts.get(sheet_name) if counts is not None else None)
+    return replica.records()
+
+
+# append: the write only added rows at the bottom, which the next sync picks up as an append.
+# Anything else (cells updated, rows deleted) re-reads the sheet on its next sync.
+def note_write(shard, sheet_name, append=False):
+    with _syncs_lock:
+        sync = _syncs.get(shard)
+    if sync is None or sheet_name not in sync.replicas:
+        return
+    replica = sync.replicas[sheet_name]
+    if not append:
+        replica.loaded_at = None
+    replica.written = True
+
+
+def poll_all():
+    for shard in shard_names():
+        _sync_for(shard)
+    with _syncs_lock:
+        syncs = list(_syncs.values())
+    return {sync.shard: sync.poll() for sync in syncs}
+
+
+def _poll_loop(interval):
+    while True:
+        try:
+            poll_all()
+        except Exception as e:
+            print(f"[SHEET SYNC] Poll failed: {e}")
+        time.sleep(interval)
+
+
+def start_polling(interval=30):
+    global _poller
+    with _syncs_lock:
+        if _poller is None:
+            _poller = threading.Thread(target=_poll_loop, args=(interval,), name="sheet-sync", daemon=True)
+            _poller.start()
+
+
+def sync_stats():
+    return {
+        shard: {
+            "polls": sync.polls,
+            **{name: {"rows": len(r.rows), "rows_fetched": r.rows_fetched, "full_reloads": r.full_reloads}
+               for name, r in sync.replicas.items()}
+        }
+        for shard, sync in _syncs.items()
+    }
+
+
+# --- One-time setup of the row-count formulas ---
+def install_row_count_formulas(shard):
+    sheet = get_sheet("Students", shard)
+    spreadsheet = sheet.spreadsheet
+    try:
+        meta = spreadsheet.worksheet(META_SHEET)
+    except Exception:
+        meta = spreadsheet.add_worksheet(title=META_SHEET, rows=len(WATCHED_SHEETS) + 1, cols=2)
+    rows = [["Sheet", "RowCount"]] + [[name, f"=COUNTA('{name}'!A2:A)"] for name in WATCHED_SHEETS]
+    meta.update(values=rows, range_name="A1", value_input_option="USER_ENTERED")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sheets change detection and delta sync.")
+    parser.add_argument("--install", action="store_true", help="write the _SyncMeta row-count formulas")
+    parser.add_argument("--polls", type=int, default=1, help="poll this many times and print stats")
+    parser.add_argument("--interval", type=float, default=10)
+    args = parser.parse_args()
+
+    if args.install:
+        for shard in shard_names():
+            install_row_count_formulas(shard)
+            print(f"[SHEET SYNC] Installed {META_SHEET} in {shard}")
+    else:
+        for i in range(args.polls):
+            print(poll_all())
+            if i < args.polls - 1:
+                time.sleep(args.interval)
+        print(sync_stats())
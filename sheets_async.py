@@ -0,0 +1,190 @@
+# sheets_async.py
+# asyncio reads over the Sheets REST API, with a sync facade for Streamlit code.
+#
+# gspread issues one blocking request at a time. When a step needed a student's row, their
+# GoalHistory and the header rows, it paid three round trips in a row. Here independent reads
+# are coroutines on one shared httpx.AsyncClient (pooled keep-alive connections). They run
+# concurrently with asyncio.gather, so loading student + history + headers costs one round
+# trip. Each sheet's header row comes back with its values, so headers need no extra request.
+#
+# Results go into the shared cache under the same versioned keys google_sheets.py uses, so a
+# later get_student_info() / get_goal_history_for_student() / get_headers() is a cache hit.
+# Rows are numericised like gspread's get_all_records, so both paths return identical dicts.
+#
+# Streamlit scripts are synchronous. The facade runs coroutines on one event loop in a daemon
+# thread, so the client and its pool outlive each call:
+#
+#   context = get_student_context("300")    # {"student", "goal_history", "headers"}
+#
+# Writes stay on gspread in google_sheets.py. Without httpx installed, the facade falls back
+# to those sequential reads.
+
+import asyncio
+import threading
+import time
+from urllib.parse import quote
+
+from gspread.utils import numericise_all
+
+import google_sheets
+from google_sheets import SHEETS_TIMEOUT, load_shard_config, shard_for_student, shard_names
+from records import id_forms, normalize_id
+from shared_cache import DEFAULT_TTL, get_shared_cache, versioned_key
+from transport import httpx_client
+
+SHEETS_API = "https://sheets.googleapis.com/v4/spreadsheets"
+TOKEN_MARGIN = 120  # refresh the access token this many seconds before it expires
+
+
+class AsyncSheetsClient:
+    def __init__(self, credentials=None):
+        self._credentials = credentials
+        self._token = None
+        self._token_expires = 0.0
+        self._token_lock = asyncio.Lock()
+        self._http = httpx_client("sheets", asynchronous=True, base_url=SHEETS_API, timeout=SHEETS_TIMEOUT)
+
+    async def _auth_header(self):
+        async with self._token_lock:
+            if self._token is None or time.time() > self._token_expires - TOKEN_MARGIN:
+                if self._credentials is None:
+                    self._credentials = google_sheets.service_account_credentials()
+                info = await asyncio.to_thread(self._credentials.get_access_token)  # blocking refresh
+                self._token = info.access_token
+                self._token_expires = time.time() + (info.expires_in or 3600)
+        return {"Authorization": f"Bearer {self._token}"}
+
+    async def _get(self, shard, path, params=None):
+        spreadsheet_id = load_shard_config()["shards"][shard]
+        response = await self._http.get(f"/{spreadsheet_id}{path}", params=params, headers=await self._auth_header())
+        response.raise_for_status()
+        return response.json()
+
+    # Rows of one sheet (header row first), as formatted values like gspread returns
+    async def values(self, shard, sheet_name, cell_range="A1:Z"):
+        data = await self._get(shard, f"/values/{quote(f'{sheet_name}!{cell_range}', safe='')}")
+        return data.get("values", [])
+
+    # Header row plus every record, the shape get_all_records() gives
+    async def records(self, shard, sheet_name):
+        rows = await self.values(shard, sheet_name)
+        if not rows:
+            return [], []
+        headers = rows[0]
+        records = [
+            dict(zip(headers, numericise_all(row + [""] * (len(headers) - len(row)), default_blank="")))
+            for row in rows[1:]
+        ]
+        return headers, records
+
+    async def all_records_all_shards(self, sheet_name):
+        results = await asyncio.gather(*(self.records(shard, sheet_name) for shard in shard_names()))
+        return [
+            {**record, "_shard": shard}
+            for shard, (_, records) in zip(shard_names(), results)
+            for record in records
+        ]
+
+    # --- Student row, their GoalHistory and both header rows, in one round trip ---
+    async def student_context(self, student_id):
+        clean_id = normalize_id(student_id)  # cache keys as google_sheets.py builds them
+        shard = shard_for_student(clean_id)
+        # The shared cache is SQLite or Redis, both blocking; it runs on worker threads like the token refresh
+        kinds = {
+            "student": ("student", shard, "Students", clean_id),
+            "goal_history": ("history", shard, "GoalHistory", clean_id),
+            "Students": ("headers", shard, "Students"),
+            "GoalHistory": ("headers", shard, "GoalHistory"),
+        }
+        keys = await asyncio.to_thread(lambda: {name: versioned_key(*args) for name, args in kinds.items()})
+        cache = get_shared_cache()
+        try:
+            hits = dict(zip(keys, await asyncio.to_thread(cache.get_many, list(keys.values()))))
+        except Exception as e:
+            print(f"[SHEETS ASYNC] Shared cache read failed: {e}")
+            hits = dict.fromkeys(keys)
+
+        # A sheet is only fetched if something from it missed the cache
+        wanted = [name for name, parts in (("Students", ("student", "Students")),
+                                           ("GoalHistory", ("goal_history", "GoalHistory")))
+                  if any(hits[p] is None for p in parts)]
+        fetched = dict(zip(wanted, await asyncio.gather(*(self.records(shard, name) for name in wanted))))
+
+        async def store(name, ttl):
+            if hits[name] is not None:
+                try:
+                    await asyncio.to_thread(cache.set, keys[name], hits[name], ttl)
+                except Exception as e:
+                    print(f"[SHEETS ASYNC] Shared cache write failed: {e}")
+
+        forms = id_forms(clean_id)  # the same rows google_sheets.py matches
+        if "Students" in fetched:
+            headers, records = fetched["Students"]
+            hits["Students"] = headers
+            hits["student"] = next((r for r in records if str(r.get("StudentID", "")).strip() in forms), None)
+            await store("student", DEFAULT_TTL)
+            await store("Students", 86400)
+        if "GoalHistory" in fetched:
+            headers, records = fetched["GoalHistory"]
+            hits["GoalHistory"] = headers
+            hits["goal_history"] = [r for r in records if str(r.get("StudentID", "")).strip() in forms]
+            await store("goal_history", DEFAULT_TTL)
+            await store("GoalHistory", 86400)
+
+        return {
+            "student": hits["student"],
+            "goal_history": hits["goal_history"] or [],
+            "headers": {"Students": hits["Students"] or [], "GoalHistory": hits["GoalHistory"] or []},
+        }
+
+    async def aclose(self):
+        await self._http.aclose()
+
+
+# --- Sync facade ---
+_loop = None
+_client = None
+_loop_lock = threading.Lock()
+
+
+def _event_loop():
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="sheets-async", daemon=True).start()
+        return _loop
+
+
+def run(coroutine_fn, timeout=SHEETS_TIMEOUT * 2):
+    async def call():
+        global _client
+        if _client is None:
+            _client = AsyncSheetsClient()  # created on the loop it will be used from
+        return await coroutine_fn(_client)
+    return asyncio.run_coroutine_threadsafe(call(), _event_loop()).result(timeout)
+
+
+def async_available():
+    try:
+        import httpx  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def get_student_context(student_id):
+    if async_available():
+        return run(lambda client: client.student_context(student_id))
+    shard = shard_for_student(student_id)
+    return {
+        "student": google_sheets.get_student_info(student_id),
+        "goal_history": google_sheets.get_goal_history_for_student(student_id),
+        "headers": {name: google_sheets.get_headers(name, shard) for name in ("Students", "GoalHistory")},
+    }
+
+
+def get_all_records_all_shards(sheet_name):
+    if async_available():
+        return run(lambda client: client.all_records_all_shards(sheet_name), timeout=SHEETS_TIMEOUT * 4)
+    return google_sheets.get_all_records_all_shards(sheet_name)
@@ -1,44 +1,86 @@
 import streamlit as st
+
+# Must run before the Sheets/OpenAI names below are imported; a no-op unless RECORD_SESSIONS is set
+import session_recorder
+session_recorder.install()
+
 import pandas as pd
 from datetime import datetime, date
-import random
 import json
-import re
-from PIL import Image
+import time
 
 from goal_bank_loader import (
     load_goal_bank,
     get_goal_text_list,
-    get_random_warmup,
     get_gpt_prompt,
     get_config_value
 )
 
-from google_sheets import (
+# Sheets access goes through offline.py: local snapshot reads and a queued write path
+# take over when Google Sheets can't be reached
+from offline import (
     get_student_info,
+    get_student_context,
     create_student_if_missing,
     add_goal_history_entry,
     add_chat_log_entry,
     update_student_current_goal,
+    commit_reflection,
     get_goal_history_for_student,
-    get_sheet
+    get_history_summary,
+    get_history_page,
+    get_all_records_all_shards,
+    guarded_completion,
+    templated_reply,
+    start_snapshot_refresh,
+    status as offline_status
+)
+
+from prefetch import (
+    start_prefetch,
+    take_prefetched,
+    discard_prefetch,
+    get_prefetch_stats
 )
 
-from openai import OpenAI
-openai_client = OpenAI(api_key=st.secrets["OPENAI_API_KEY"])
+from background_summary import enqueue_background_refresh
+from chat_memory import ConversationMemory
+from warmup import WarmupEngine
+from reflection_quality import get_scorer
+from session_context import SessionContext, note_session_bytes, track_session
+from response_parser import parse_response
+from chat_prompts import (
+    SCORE_INTERPRETATIONS,
+    TONES,
+    build_system_message,
+    build_first_turn_input,
+    render_system_message
+)
+
+from llm import get_openai_client, chat_completion
+from transport import log_stats as log_transport_stats
+openai_client = get_openai_client()
+
+rerun_started = time.perf_counter()
+
+# --- Static config, loaded once per process instead of once per session ---
+@st.cache_resource
+def get_goal_bank():
+    return load_goal_bank()
 
 # --- Session bootstrap ---
-if "goal_bank_config" not in st.session_state:
-    st.session_state.goal_bank_config = load_goal_bank()
-cfg = st.session_state.goal_bank_config
+cfg = get_goal_bank()
 
-if "step" not in st.session_state:
-    st.session_state.step = "enter_id"
+# Every session key is declared in session_context.py; defaults come from there, and
+# sessions left idle past IDLE_EVICT_SECONDS drop their persona run.
+session = SessionContext(st.session_state)
+session.ensure_defaults()
+track_session(session)
 
-if "chat_history" not in st.session_state:
-    st.session_state.chat_history = []
-if "chat_turn_count" not in st.session_state:
-    st.session_state.chat_turn_count = 0
+# Replayable log of this session (session_recorder.py); None unless recording is on
+recorder = session_recorder.for_session(st.session_state)
+if recorder:
+    recorder.begin_run(st.session_state.step)
 
 # --- Load student data if missing ---
 if "student" not in st.session_state and "student_id" in st.session_state:
@@ -53,7 +95,6 @@ if "student" not in st.session_state and "student_id" in st.session_state:
 #    t = cfg.get("motivation_triggers", {})
 #    low_thresh = t.get("low_follow_threshold", 2)
 #    repeat_thresh = t.get("repeat_goal_count", 2)
-#    vague_len = t.get("vague_reflection_length", 10)
 #    strong_thresh = t.get("strong_streak_threshold", 3)
 #
 #    recent_entries = goal_history[-3:]
@@ -64,7 +105,7 @@ if "student" not in st.session_state and "student_id" in st.session_state:
 #    if sum(1 for entry in recent_entries if entry["GoalText"] == current_goal) >= repeat_thresh:
 #        return "motivation_repeat_goal"
 #
-#    if len(current_reflection.strip()) < vague_len:
+#    if reflection_is_unclear(current_reflection, current_goal, cfg):
 #        return "motivation_unclear_reflection"
 #
 #    if sum(1 for entry in recent_entries if str(entry["GoalAchievement"]) in ["3", "4"]) >= strong_thresh:
@@ -72,29 +113,6 @@ if "student" not in st.session_state and "student_id" in st.session_state:
 #
 #    return None
 
-import re
-
-def extract_response_options(raw_text):
-    pattern = r"Option (\d+):\s*Statement:(.*?)\s*Question:(.*?)(?=(Option \d+:|Best option:|Final response:|$))"
-    matches = re.findall(pattern, raw_text, re.DOTALL | re.IGNORECASE)
-
-    options = []
-    for match in matches:
-        option_number = int(match[0])
-        statement = match[1].strip()
-        question = match[2].strip()
-        options.append({
-            "option": option_number,
-            "statement": statement,
-            "question": question
-        })
-    return options
-
-def extract_final_response(raw_text):
-    match = re.search(r"(?i)final response\s*:\s*(.*)", raw_text, re.DOTALL)
-    return match.group(1).strip() if match else raw_text
-
-
 def choose_next_step_from_goal_history(student_id, current_goal, current_reflection, goal_date, cfg, goal_source="app"):
     history = get_goal_history_for_student(student_id)
     print(f"[DEBUG step routing] Student {student_id} has {len(history)} goal history entries.")
@@ -119,115 +137,121 @@ def choose_next_step_from_goal_history(student_id, current_goal, current_reflect
         st.session_state.step = "check_manual_goal"
 
 
-# --- GPT summarizer fallback ---
-def summarize_background_response(response_text):
+# --- Rolling summary of chat turns that fell out of the verbatim window ---
+def summarize_chat_turns(previous_summary, turns_text, max_tokens):
     prompt = (
-        "Summarize this student response in one sentence, keeping it concise and concrete. "
-        "Focus on what the student enjoys, cares about, or finds meaningful:\n\n"
-        f'"{response_text}"\n\nSummary:'
+        "Update this running summary of a coaching conversation with a student. "
+        "Keep the student's goal, what they said got in the way, and any commitments they made.\n\n"
+        f"Summary so far:\n{previous_summary or '[none]'}\n\n"
+        f"New turns:\n{turns_text}\n\nUpdated summary:"
+    )
+    response = chat_completion(
+        [{"role": "user", "content": prompt}],
+        temperature=0.3,
+        max_tokens=max_tokens
+    )
+    return response.choices[0].message.content.strip()
+
+@st.cache_resource
+def get_chat_memory():
+    return ConversationMemory(
+        recent_turns=get_config_value(cfg, "chat_recent_turns", 4),
+        token_budget=get_config_value(cfg, "chat_prompt_token_budget", 3000),
+        summarizer=summarize_chat_turns
     )
-    try:
-        response = openai_client.chat.completions.create(
-            model="gpt-4",
-            messages=[{"role": "user", "content": prompt}],
-            temperature=0.5,
-            max_tokens=500
-        )
-        return response.choices[0].message.content.strip()
-    except Exception:
-        st.warning("\u26a0\ufe0f There was an error with the GPT API. We'll still continue.")
-        return "shared something about themselves"
-
-# These two prompts form the core "Reflection Chat" experience
-# Users choose between a "Nicer" and a "Tougher" bot for their reflection conversation.
-# Removed a length preference function to focus on one statement and one question.
-def build_real_one_prompt(goal, score_value, interpretation, reflection, background, length_pref, score_behavior_instruction):
-    return f"""
-You talk like someone who actually cares but hates fake school conversations. You keep it real.
-You don’t flatter, but you notice effort. You speak plainly, ask real questions, and don’t push too hard.
-You sound like someone worth talking to. Every reply should feel like something you'd hear from a smart, tired 9th grader.
-
-The student reflected on a goal. Here’s what they shared:
-- Goal: {goal}
-- Self-assessment (0–4): {score_value} – {interpretation}
-- Reflection on what helped or got in the way: "{reflection}"
-- Background info: {background}
-
-The student scored themselves a {score_value} out of 4.
-{score_behavior_instruction}
-
-Generate exactly 3 response options. Each should include:
-- A short, plainspoken **statement** that shows you heard the student
-- A grounded, helpful **question** to support reflection or growth
-
-Use this exact format:
-
-Option 1: ...
-
-Option 2: ...
-
-Option 3: ...
-
-Then briefly evaluate the three responses. Decide which one is the most motivating, and specifically helpful to the student.
-
-Finally, repeat **only the best option** using this format:
-
-Final response: ...
-
-""".strip()
-
-
-
-def build_drill_sergeant_prompt(goal, score_value, interpretation, reflection, background, length_pref, score_behavior_instruction):
-    return f"""
-You are here to push the student to improve. You are sharp, exacting, and focused on results.
-If the student gives a vague or weak answer, call it out—briefly and clearly. Then push them to think harder. You are not soft. You are not friendly. You don’t offer fake encouragement. You offer pressure, precision, and questions that leave no place to hide.
-
-The student reflected on a goal. Here’s what they shared:
-- **Goal:** {goal}
-- **Self-assessment (0–4):** {score_value} – {interpretation}
-- **Reflection on what helped or got in the way:** "{reflection}"
-- **Background info (less important):** {background}
-
-The student scored themselves a {score_value} out of 4.
-{score_behavior_instruction}
-
-Generate exactly 3 response options. Each should include:
-- A short, plainspoken **statement** that shows you heard the student
-- A grounded, helpful **question** to support reflection or growth
-
-Use this exact format:
-
-Option 1: ...
 
-Option 2: ...
+chat_memory = get_chat_memory()
 
-Option 3: ...
+@st.cache_resource
+def get_warmup_engine():
+    return WarmupEngine(cfg, refreshes=get_config_value(cfg, "warmup_refreshes", 5))
 
-Then briefly evaluate the three responses. Decide which one is the most motivating, and specifically helpful to the student.
+warmup_engine = get_warmup_engine()
 
-Finally, repeat **only the best option** using this format:
+def request_chat_completion(messages):
+    return guarded_completion(
+        openai_client.chat.completions.create,
+        model="gpt-4",
+        messages=messages,
+        temperature=0.7,
+        max_tokens=500
+    )
 
-Final response: ...
 
-""".strip()
+# --- Speculatively start both first-turn completions ---
+# Called as soon as the reflection is submitted, so whichever tone button the student
+# clicks can be served without waiting on the API.
+def prefetch_first_turn(goal, score_value, interpretation, reflection, background):
+    discard_prefetch(st.session_state.pop("first_turn_prefetch", None))
+    first_input = build_first_turn_input(goal, score_value, interpretation, reflection)
+    threads_by_tone = {
+        tone: [
+            # First turns are always "short" replies, same as handle_chat_reply builds them
+            {"role": "system", "content": build_system_message(tone, goal, score_value, interpretation, reflection, background, "short")},
+            {"role": "user", "content": first_input}
+        ]
+        for tone in TONES
+    }
+    st.session_state.first_turn_prefetch = start_prefetch(
+        (goal, score_value, reflection, background), threads_by_tone, session_recorder.bind(request_chat_completion)
+    )
 
 
 # --- Start Streamlit UI ---
 st.set_page_config(page_title="Classroom Strategist", layout="centered")
 st.title("Classroom Strategist")
 
-# --- Main flow control ---
-if st.session_state.step == "enter_id":
-
-    # Load the sheet for sample display
-    sheet = get_sheet("Students")
-    records = sheet.get_all_records()
+# --- Offline mode ---
+@st.cache_resource
+def start_offline_snapshots():
+    start_snapshot_refresh(interval=600)
+    return True
+
+start_offline_snapshots()
+
+health = offline_status()
+if not health["sheets"] or not health["openai"]:
+    down = " and ".join(name for name, up in [("Google Sheets", health["sheets"]), ("the AI service", health["openai"])] if not up)
+    st.caption(f"⚠️ Working offline: {down} can't be reached right now. "
+               f"Your answers are saved on this device ({health['queued_writes']} waiting) and sent when the connection is back.")
+
+# --- Step handlers ---
+# Each step registers a render function; the dispatcher at the bottom runs only the
+# current step's handler instead of walking an if/elif chain.
+STEP_HANDLERS = {}
+
+def step(name):
+    def register(handler):
+        STEP_HANDLERS[name] = handler
+        return handler
+    return register
+
+
+# --- Cached persona table for the landing page ---
+# Typing in the ID box reruns the page; without the cache every keystroke re-read the sheet.
+@st.cache_data(ttl=300, show_spinner=False)
+def load_persona_table():
+    records = get_all_records_all_shards("Students")
     df = pd.DataFrame(records)
 
     ref_df = df[["StudentID", "Nickname", "PronounCode", "BackgroundInfo"]].rename(
         columns={"StudentID": "ID", "PronounCode": "P"}
-    )
+    ).reset_index(drop=True)
+
+    descriptions = "\n\n---\n\n".join(
+        f"**ID:** {row['ID']}  \n"
+        f"**Nickname:** {row['Nickname']}  \n"
+        f"**Background Info:** {row['BackgroundInfo']}"
+        for _, row in ref_df.iterrows()
+    ) + "\n\n---"
+    return ref_df, descriptions
+
+
+@step("enter_id")
+def render_enter_id():
+
+    # Load the sheet for sample display
+    ref_df, persona_descriptions = load_persona_table()
 
     st.markdown(
         "<span style='color:#DFB743; font-size:30px'>Welcome to the Classroom Strategist Demo</span>"
@@ -238,6 +262,8 @@ if st.session_state.step == "enter_id":
         unsafe_allow_html=True
     )
 
+    if st.session_state.pop("evicted_idle", False):
+        st.info("Your earlier chat was closed after a long idle period. Pick a student to start again.")
 
     student_id_input = st.text_input("Enter a Student ID from the table:")
 
@@ -247,8 +273,10 @@ if st.session_state.step == "enter_id":
     with col1:
         if st.button("Chat as this student"):
             if student_id_input.strip():
-                    student = get_student_info(student_id_input.strip())
+                    # Student row and goal history in one round trip; later steps hit the cache
+                    student = get_student_context(student_id_input.strip())["student"]
                     if student:
+                        session.reset("persona")
                         st.session_state.student_id = student_id_input.strip()
                         st.session_state.student = student
                         st.session_state.goal_to_reflect = {
@@ -275,26 +303,35 @@ if st.session_state.step == "enter_id":
 
     # Show the full table (even if background info is truncated here)
     st.markdown("#### PERSONA REFERENCE TABLE")
-    st.dataframe(ref_df.reset_index(drop=True), use_container_width=True)
+    st.dataframe(ref_df, use_container_width=True)
 
     # --- Bottom: full descriptions for all students ---
     st.markdown("### Full Persona Descriptions:")
-
-    for _, row in ref_df.iterrows():
-        st.markdown(f"""
-    **ID:** {row['ID']}  
-    **Nickname:** {row['Nickname']}  
-    **Background Info:** {row['BackgroundInfo']}
-    """)
-        st.markdown("---")
+    st.markdown(persona_descriptions)
 
 # --- STEP 1: WARMUP ---
-if st.session_state.step == "warmup" and "student_id" in st.session_state:
+@step("warmup")
+def render_warmup():
+    if "student_id" not in st.session_state:
+        return
     student = st.session_state.student
     nickname = student.get("Nickname", "there")
-    
+
+    # Goal history and every warmup option are fetched/planned once per student; reruns
+    # (typing, word buttons, Refresh Options) only read session state
+    plan = st.session_state.get("warmup_plan")
+    if plan is None or plan["student_id"] != st.session_state.student_id:
+        plan = st.session_state.warmup_plan = {
+            "student_id": st.session_state.student_id,
+            "goal_history": get_goal_history_for_student(st.session_state.student_id),
+            "options": warmup_engine.plan(st.session_state.student_id),
+            "index": 0,
+        }
+        st.session_state.selected_words = set()
+    option = plan["options"][plan["index"]]
+
     # First-time users: collect deeper background info
-    goal_history = get_goal_history_for_student(st.session_state.student_id)
+    goal_history = plan["goal_history"]
     if len(goal_history) == 0 and "background_collected" not in st.session_state:
         st.header(f"Hi {nickname}, I’d like to get to know you a bit.")
 
@@ -338,31 +375,21 @@ if st.session_state.step == "warmup" and "student_id" in st.session_state:
                     "This helps provide background so I can better help you strategize.")
     st.subheader("Warm Up / Check-In")
 
-    if "current_warmup_prompt" not in st.session_state:
-        st.session_state.current_warmup_prompt = get_random_warmup(cfg, "humanizing")
-
-    if "selected_words" not in st.session_state:
-        st.session_state.selected_words = []
-
-    if "one_word_options" not in st.session_state:
-        st.session_state.one_word_options = random.sample(cfg["warmup_prompts"]["one_word"], k=5)
-
-    st.markdown(f"**{st.session_state.current_warmup_prompt}**")
+    st.markdown(f"**{option.prompt}**")
     response = st.text_input("Your response:")
 
     st.markdown("AND / OR")
     st.markdown("Choose one or more words that fit how you're feeling today:")
 
-    cols = st.columns(len(st.session_state.one_word_options))
-    for i, word in enumerate(st.session_state.one_word_options):
+    cols = st.columns(len(option.words))
+    for i, word in enumerate(option.words):
         if cols[i].button(word, key=f"word_{word}"):
-            if word not in st.session_state.selected_words:
-                st.session_state.selected_words.append(word)
+            st.session_state.selected_words.add(word)
 
     if st.session_state.selected_words:
         selected_display = ", ".join(
             f"<span style='color:lightblue;font-weight:bold'>{w}</span>"
-            for w in st.session_state.selected_words
+            for w in warmup_engine.ordered(st.session_state.selected_words)
         )
         st.markdown(f"**Selected words:** {selected_display}", unsafe_allow_html=True)
 
@@ -374,13 +401,15 @@ if st.session_state.step == "warmup" and "student_id" in st.session_state:
             if response:
                 summary_input += response.strip()
             if st.session_state.selected_words:
-                words = ", ".join(st.session_state.selected_words)
+                words = ", ".join(warmup_engine.ordered(st.session_state.selected_words))
                 if summary_input:
                     summary_input += f" (Also described themselves as: {words})"
                 else:
                     summary_input = f"Described themselves as: {words}"
 
             st.session_state.latest_reflection = summary_input
+            if response:
+                warmup_engine.record_answered(st.session_state.student_id, option)
 
             existing_info = student.get("BackgroundInfo", "").strip()
 
@@ -394,26 +423,9 @@ if st.session_state.step == "warmup" and "student_id" in st.session_state:
                 #     set_date=student.get("CurrentGoalSetDate", str(date.today())),
                 #     background_info=summary_input
                 # )
-            else:
-                # Pull past reflections from GoalHistory
-                history = get_goal_history_for_student(st.session_state.student_id)
-                past_reflections = [entry.get("BackgroundInfo", "") for entry in history if entry.get("BackgroundInfo", "").strip()]
-
-                # Combine everything into one string
-                combined_input = " | ".join([existing_info] + past_reflections + [summary_input])
-
-                # Summarize with GPT
-                # background_summary = summarize_background_response(combined_input)
-
-                # Save back to Students sheet
-                # st.session_state.background_info = background_summary
-                # update_student_current_goal(
-                #     student_id=st.session_state.student_id,
-                #     new_goal=student.get("CurrentGoal", ""),
-                #     new_success_measures=student.get("CurrentSuccessMeasures", ""),
-                #     set_date=student.get("CurrentGoalSetDate", str(date.today())),
-                #     background_info=background_summary
-                # )
+            # Returning students: BackgroundInfo is rolled forward from new GoalHistory rows
+            # off the request path (enqueue_background_refresh after a saved reflection), so
+            # nothing to summarize here.
 
             # Refresh local student record for use in GPT
             st.session_state.student = get_student_info(st.session_state.student_id)
@@ -470,13 +482,58 @@ if st.session_state.step == "warmup" and "student_id" in st.session_state:
 
     with colB:
         if st.button("Refresh Options"):
-            st.session_state.current_warmup_prompt = get_random_warmup(cfg, "humanizing")
-            st.session_state.one_word_options = random.sample(cfg["warmup_prompts"]["one_word"], k=5)
+            plan["index"] = (plan["index"] + 1) % len(plan["options"])
             st.rerun()
 
 
+# --- Past goals timeline ---
+# The summary (streak, last few goals) comes from the history index; older goals are read a
+# page at a time only when asked for, and loaded pages stay in session state for reruns.
+def history_state():
+    view = st.session_state.get("history_view")
+    if view is None or view["student_id"] != st.session_state.student_id:
+        view = st.session_state.history_view = {
+            "student_id": st.session_state.student_id,
+            "summary": get_history_summary(st.session_state.student_id),
+            "pages": [],
+        }
+    return view
+
+
+def load_older_history():
+    view = st.session_state.history_view
+    view["pages"].append(get_history_page(view["student_id"], len(view["pages"])))
+
+
+def history_markdown(entries):
+    lines = []
+    for entry in entries:
+        score = entry["score"]
+        label = f"{score} – {SCORE_INTERPRETATIONS[score]}" if score in SCORE_INTERPRETATIONS else "no score"
+        lines.append(f"- **{entry['date'] or 'no date'}** · {entry['goal'] or '[no goal]'} · {label}")
+    return "\n".join(lines)
+
+
+# Loading an older page reruns only this fragment
+@st.fragment
+def render_history_timeline():
+    view = history_state()
+    summary = view["summary"]
+    if not summary["count"]:
+        return
+    with st.expander(f"Your past goals ({summary['count']})"):
+        if summary["streak"]:
+            st.markdown(f"🔥 **{summary['streak']}** goal{'s' if summary['streak'] != 1 else ''} met in a row")
+        st.markdown(history_markdown(summary["recent"]))
+        for page in view["pages"]:
+            st.markdown(history_markdown(page))
+        if len(view["pages"]) < summary["pages"]:
+            st.button("Show older goals", key="history_older", on_click=load_older_history)
+
+
 # --- STEP 2: Reflect on goal (if recent) ---
-elif st.session_state.step == "reflect_on_goal":
+@step("reflect_on_goal")
+def render_reflect_on_goal():
     goal_info = st.session_state.goal_to_reflect
 
     # Calculate motivation case early if not already set
@@ -524,6 +581,8 @@ elif st.session_state.step == "reflect_on_goal":
         #st.markdown(f"**Background info from previous reflections includes:** {background}")
         #st.markdown("---")    
     
+    render_history_timeline()
+
     st.markdown("### Step 1: Pretend to strategize about a goal you set earlier in class.")
     st.markdown(f"**This was your goal:** {goal_info['text']}")
     # st.markdown(f"**Set On:** {'Today' if goal_info['source'] == 'manual' else goal_info['set_date']}")
@@ -544,14 +603,7 @@ elif st.session_state.step == "reflect_on_goal":
     score_value = int(goal_achievement[0])
     st.session_state.latest_score_value = score_value
 
-    summary_map = {
-        4: "Met and exceeded",
-        3: "Met goal",
-        2: "Almost met",
-        1: "Tried but didn’t succeed",
-        0: "Didn’t attempt"
-    }
-    interpretation = summary_map[score_value]
+    interpretation = SCORE_INTERPRETATIONS[score_value]
 
     st.markdown(
         "<span style='color:#DFB743'><em>(For 3 or 4, use the question below to imagine what helped. For 1 or 2, imagine what got in the way.)</em></span>",
@@ -563,53 +615,40 @@ elif st.session_state.step == "reflect_on_goal":
 
     if st.button("Submit Response", key="submit_reflection1"):
         st.session_state.latest_reflection = reflection
+        st.session_state.reflection_quality = get_scorer().score(reflection, goal_info.get("text", ""))
+        print(f"[REFLECTION QUALITY] {st.session_state.reflection_quality:.2f}")
+
+        # ⚡ Start both tone completions while the student reads the tone choice
+        prefetch_first_turn(
+            goal=goal_info.get("text", "[No goal]"),
+            score_value=score_value,
+            interpretation=interpretation,
+            reflection=reflection,
+            background=st.session_state.student.get("BackgroundInfo", "[none]")
+        )
 
-        # add_goal_history_entry({
-        #     "StudentID": st.session_state.student_id,
-        #     "GoalSetDate": goal_info["set_date"],
-        #     "GoalText": goal_info["text"],
-        #     "SuccessMeasures": "[manual goal]" if goal_info["source"] == "manual" else st.session_state.student.get("CurrentSuccessMeasures", ""),
-        #     "OutcomeReflection": reflection,
-        #     "GoalAchievement": score_value,
-        #     "InterpretationSummary": interpretation,
-        #     "BackgroundInfo": st.session_state.student.get("BackgroundInfo", "")
-        # })
-
-        # --- Regenerate BackgroundInfo from history ---
-        def regenerate_background_summary_from_history(student_id):
-            history = get_goal_history_for_student(student_id)
-            warmup_texts = [
-                entry["OutcomeReflection"]
-                for entry in history
-                if entry.get("OutcomeReflection") and len(entry["OutcomeReflection"].strip()) > 5
-            ]
-            full_text = "\n".join(warmup_texts[-10:])  # Limit to last 10 entries
-
-            prompt = (
-                "Summarize the student's interests, feelings, and experiences based on these past reflections:\n\n"
-                f"{full_text.strip()}\n\nSummary:"
-            )
-
+        # GoalHistory append (+ any Students cells) in one request; a rerun or retry of the same
+        # reflection is a no-op (see reflection_commit.py), and it queues while Sheets is down.
+        # The demo personas aren't written to unless save_reflections is on in goal_bank.yaml.
+        if get_config_value(cfg, "save_reflections", False):
             try:
-                response = openai_client.chat.completions.create(
-                    model="gpt-4",
-                    messages=[{"role": "user", "content": prompt}],
-                    temperature=0.5,
-                    max_tokens=200
-                )
-                return response.choices[0].message.content.strip()
-            except Exception:
-                return "Summary unavailable"
-
-        # new_summary = regenerate_background_summary_from_history(st.session_state.student_id)
-        # update_student_current_goal(
-        #     student_id=st.session_state.student_id,
-        #     new_goal=st.session_state.student.get("CurrentGoal", ""),
-        #     new_success_measures=st.session_state.student.get("CurrentSuccessMeasures", ""),
-        #     set_date=st.session_state.student.get("CurrentGoalSetDate", str(date.today())),
-        #     background_info=new_summary
-        # )
-        # st.session_state.background_info = new_summary
+                status = commit_reflection(st.session_state.student_id, {
+                    "GoalSetDate": goal_info["set_date"],
+                    "Goal": goal_info["text"],
+                    "SuccessMeasures": "[manual goal]" if goal_info["source"] == "manual" else st.session_state.student.get("CurrentSuccessMeasures", ""),
+                    "OutcomeReflection": reflection,
+                    "GoalAchievement": score_value,
+                    "InterpretationSummary": interpretation,
+                    "BackgroundInfo": st.session_state.student.get("BackgroundInfo", "")
+                })
+                print(f"[REFLECTION COMMIT] {st.session_state.student_id}: {status}")
+
+                # --- Roll BackgroundInfo forward from the new GoalHistory row (background job) ---
+                # Only a queue.put here; a queued commit is picked up by a later pass once it lands.
+                if status != "queued" and get_config_value(cfg, "refresh_background_summary", True):
+                    enqueue_background_refresh(st.session_state.student_id)
+            except Exception as e:
+                print(f"[REFLECTION COMMIT] Reflection for {st.session_state.student_id} not saved: {e}")
 
         # ⬇️ Run motivation analysis
         #goal_history = get_goal_history_for_student(st.session_state.student_id)
@@ -627,7 +666,8 @@ elif st.session_state.step == "reflect_on_goal":
         st.rerun()
 
 # Onboard a new student
-elif st.session_state.step == "onboard_student":
+@step("onboard_student")
+def render_onboard_student():
     st.header("Register a New Student")
 
     student_id = st.session_state.get("new_student_id", "")
@@ -658,7 +698,8 @@ elif st.session_state.step == "onboard_student":
 
 
 # --- STEP 2B: No recent goal — ask if one was set on paper today ---
-elif st.session_state.step == "check_manual_goal":
+@step("check_manual_goal")
+def render_check_manual_goal():
     st.markdown("### Did you set a goal earlier today (e.g., on paper)?")
 
     goal_options = get_goal_text_list(cfg)
@@ -680,8 +721,18 @@ elif st.session_state.step == "check_manual_goal":
             st.session_state.step = "set_contribution_goal"
             st.rerun()
 
+# --- Chat history as one markdown block (one element instead of two per turn) ---
+def chat_history_markdown(chat_history):
+    lines = []
+    for i, turn in enumerate(chat_history):
+        if i > 0 and "user" in turn:
+            lines.append(f"**You:** {turn['user']}")
+        lines.append(f"**AI:** {turn['ai']}")
+    return "\n\n".join(lines)
+
 #  --- Chatbot motivational step---
-elif st.session_state.step == "chatbot_motivation":
+@step("chatbot_motivation")
+def render_chatbot_motivation():
 
     goal_info = st.session_state.get("goal_to_reflect", {})
     student = st.session_state.student
@@ -689,64 +740,46 @@ elif st.session_state.step == "chatbot_motivation":
     goal = goal_info.get("text", "[No goal]")
     reflection = st.session_state.get("latest_reflection", "")
     score_value = st.session_state.get("latest_score_value", 0)
-    interpretation_map = {
-        4: "Met and exceeded",
-        3: "Met goal",
-        2: "Almost met",
-        1: "Tried but didn’t succeed",
-        0: "Didn’t attempt"
-    }
-    interpretation = interpretation_map.get(score_value, "Not rated")
+    interpretation = SCORE_INTERPRETATIONS.get(score_value, "Not rated")
     #case = st.session_state.get("motivation_case", None)
 
     def handle_chat_reply(length_label, user_input=""):
         tone = st.session_state.get("tone_pref", "real_one")
-        length_pref_map = {
-            "short": "Respond briefly, in a few sentences of plain, middle school-level language.",
-            "long": "Respond with moderate detail in middle school-level language..",
-        }
-        length_pref = length_pref_map.get(length_label, "")
-
-        score_behavior_instruction = (
-            "They scored a 0, 1, or 2. Your job is to help them find strategies to meet this goal in the future."
-            if score_value <= 2 else
-                "They scored a 3 or 4. Your job is to acknowledge their success, and find a different goal to help them grow."
-            )
-
 
         # First turn: synthesize user_input
         if st.session_state.chat_turn_count == 0:
-            user_input_clean = (
-                f"I was working on the goal: '{goal}'. "
-                f"I gave myself a score of {score_value} — {interpretation}. "
-                f"What helped or got in the way: {reflection}"
-            )
+            user_input_clean = build_first_turn_input(goal, score_value, interpretation, reflection)
         else:
             user_input_clean = user_input.strip()
 
+        # Precompiled per tone x score band (goal_bank.yaml chat_templates); length_label picks length_prefs
+        system_message, system_tokens = render_system_message(
+            tone, goal, score_value, interpretation, reflection, background, length_label
+        )
 
-
-        if tone == "drill_sergeant":
-            system_message = build_drill_sergeant_prompt(goal, score_value, interpretation, reflection, background, length_pref, score_behavior_instruction)
-        else:
-            system_message = build_real_one_prompt(goal, score_value, interpretation, reflection, background, length_pref, score_behavior_instruction)
-
-        # Assemble GPT thread
-        full_thread = [{"role": "system", "content": system_message}]
-        for turn in st.session_state.chat_history:
-            full_thread.append({"role": "assistant", "content": turn["ai"]})
-            if "user" in turn:
-                full_thread.append({"role": "user", "content": turn["user"]})
-        full_thread.append({"role": "user", "content": user_input_clean})
+        # Assemble GPT thread: recent turns verbatim, older ones as a rolling summary, within budget
+        full_thread, prompt_tokens = chat_memory.build_messages(
+            system_message, st.session_state.chat_history, user_input_clean, st.session_state.chat_summary,
+            system_tokens=system_tokens
+        )
+        st.session_state.chat_prompt_tokens.append(prompt_tokens)
+        print(f"[CHAT MEMORY] Turn {st.session_state.chat_turn_count}: {prompt_tokens} prompt tokens (local count)")
 
         # Get AI response
         try:
-            response = openai_client.chat.completions.create(
-                model="gpt-4",
-                messages=full_thread,
-                temperature=0.7,
-                max_tokens=500
-            )
+            response = None
+            if st.session_state.chat_turn_count == 0:
+                response = take_prefetched(
+                    st.session_state.pop("first_turn_prefetch", None),
+                    tone,
+                    (goal, score_value, reflection, background)
+                )
+                stats = get_prefetch_stats()
+                print(f"[PREFETCH] {'hit' if response is not None else 'miss'} — hit rate: {stats['hit_rate']:.0%}, "
+                      f"token overhead: {stats['token_overhead']:.0%} ({stats['wasted_tokens']} wasted / {stats['used_tokens']} used)")
+                log_transport_stats()
+            if response is None:
+                response = request_chat_completion(full_thread)
 
             # Full reply text
             reply = response.choices[0].message.content.strip()
@@ -755,21 +788,27 @@ elif st.session_state.step == "chatbot_motivation":
             usage = response.usage
             print(f"[GPT TOKEN USAGE] Prompt: {usage.prompt_tokens}, Completion: {usage.completion_tokens}, Total: {usage.total_tokens}")
 
-            # Extract all three options
-            gpt_options = extract_response_options(reply)
-            st.session_state["gpt_options"] = gpt_options
+            # Options, evaluation and final response in one pass
+            parsed = parse_response(reply)
+            st.session_state["gpt_options"] = get_scorer().rank_options(parsed.options, goal, reflection)
             st.session_state["full_gpt_output"] = reply
 
             print("\n[GPT GENERATED OPTIONS]")
             print (reply)
 
-            # Extract only final displayed response
-            final_response = extract_final_response(reply)
+            # Only the final response is displayed. If the model left it out, the locally
+            # best-ranked option stands in; failing that, the whole reply.
+            final_response = parsed.final_response
+            if not parsed.has_final and st.session_state["gpt_options"]:
+                best = st.session_state["gpt_options"][0]
+                final_response = f"{best['statement']} {best['question']}"
             st.session_state["gpt_final_response"] = final_response
 
         except Exception as e:
             print(f"[GPT ERROR] {e}")
-            final_response = "⚠️ There was a problem talking to the goal-setting chatbot. Want to try again?"
+            # OpenAI unreachable: a templated reply keeps the conversation going
+            final_response = parse_response(templated_reply(cfg, score_value)).final_response
+            st.session_state["gpt_final_response"] = final_response
 
 
         # Store conversation using only final response
@@ -814,8 +853,8 @@ elif st.session_state.step == "chatbot_motivation":
         #     st.rerun()
 
 
-    # --- Turns 1 and 2: Regular interaction ---
-    elif st.session_state.chat_turn_count < 3:
+    # --- Turns 1 to max_chat_turns - 1: Regular interaction ---
+    elif st.session_state.chat_turn_count < get_config_value(cfg, "max_chat_turns", 3):
         st.header("Chat with your AI Strategist:")
 
         # Show system prompt label
@@ -829,15 +868,17 @@ elif st.session_state.step == "chatbot_motivation":
 
 
         # Show conversation history
-        for i, turn in enumerate(st.session_state.chat_history):
-            if i > 0 and "user" in turn:
-                st.markdown(f"**You:** {turn['user']}")
-            st.markdown(f"**AI:** {turn['ai']}")
+        st.markdown(chat_history_markdown(st.session_state.chat_history))
+
+        # Typing a reply reruns only this fragment, not the history above it
+        @st.fragment
+        def chat_input():
+            user_input = st.text_area("Your reply:", key=f"chat_input_{st.session_state.chat_turn_count}")
 
-        user_input = st.text_area("Your reply:", key=f"chat_input_{st.session_state.chat_turn_count}")
+            if st.button("Submit Response", key=f"short_{st.session_state.chat_turn_count}"):
+                handle_chat_reply("short", user_input)
 
-        if st.button("Submit Response", key=f"short_{st.session_state.chat_turn_count}"):
-            handle_chat_reply("short", user_input)
+        chat_input()
 
  
         # Allow skipping AI reflection
@@ -851,19 +892,17 @@ elif st.session_state.step == "chatbot_motivation":
     # --- Turn 3: Wrap up ---
     else:
         # Show final conversation
-        for i, turn in enumerate(st.session_state.chat_history):
-            if i > 0 and "user" in turn:
-                st.markdown(f"**You:** {turn['user']}")
-            st.markdown(f"**AI:** {turn['ai']}")
+        st.markdown(chat_history_markdown(st.session_state.chat_history))
 
         st.success("Nice work thinking that through. If the AI just asked you a new question, keep it in mind as you set your next goal.")
 
         # 🔒 Only log once
         if "chat_log_saved" not in st.session_state:
-            st.session_state["log_timestamp"] = datetime.now().isoformat()  # ✅ store for later use
+            # ✅ store for later use: the feedback row reuses it, so archive_sheets.py can merge the two
+            st.session_state["log_timestamp"] = datetime.now().isoformat()
             log_entry = {
                 "StudentID": st.session_state.student_id,
-                "Timestamp": datetime.now().isoformat(),
+                "Timestamp": st.session_state["log_timestamp"],
                 "CurrentGoal": goal,
                 "SuccessMeasures": student.get("CurrentSuccessMeasures", ""),
                 "OutcomeReflection": reflection,
@@ -884,163 +923,206 @@ elif st.session_state.step == "chatbot_motivation":
         )
 
 
-        user_type_options = [
-                "Student",
-                "Teacher",
-                "Developer",
-                "Other"
-            ]
-
-        user_choice = st.selectbox(
-            "Choose a word that best describes you:",
-            user_type_options
-        )
-
-        if user_choice == "Other":
-            user_type = st.text_input("Type one or two words that describe you:")
-        else:
-            user_type = user_choice
-
-
-        # 🔘 Likert 1 – Motivation
-        try_rating = st.selectbox(
-            "If this goal were really mine, the AI conversation would have helped me follow through.",
-            [
-                "5 – Strongly agree",
-                "4 – Agree",
-                "3 – Neutral",
-                "2 – Disagree",
-                "1 – Strongly disagree"
-                
-            ]
-        )
+        # Likert feedback form reruns on its own; changing one answer doesn't re-run the page
+        @st.fragment
+        def feedback_form():
+            user_type_options = [
+                    "Student",
+                    "Teacher",
+                    "Developer",
+                    "Other"
+                ]
 
-        # 🔘 Likert 2 – Engagement
-        engage_rating = st.selectbox(
-            "I felt engaged by the AI conversation.",
-            [
-                "5 – Strongly agree",
-                "4 – Agree",
-                "3 – Neutral",
-                "2 – Disagree",
-                "1 – Strongly disagree"
-            ]
-        )
+            user_choice = st.selectbox(
+                "Choose a word that best describes you:",
+                user_type_options
+            )
 
-        # --- Open-ended tone reflection ---
-        tone_pref_label = {
-            "real_one": "Nicer",
-            "drill_sergeant": "Tougher"
-        }.get(st.session_state.get("tone_pref", ""), "[Unknown Tone]")
+            if user_choice == "Other":
+                user_type = st.text_input("Type one or two words that describe you:")
+            else:
+                user_type = user_choice
 
-        tone_feedback = st.text_area(
-            f"You chose the {tone_pref_label} tone. Did this match what you expected? What worked or didn’t work about how the AI spoke to you?"
-        )
 
-        change_feedback = st.text_area(
-            "If you could change anything about how the AI responds, what would you change first? Why?"
-        )
+            # 🔘 Likert 1 – Motivation
+            try_rating = st.selectbox(
+                "If this goal were really mine, the AI conversation would have helped me follow through.",
+                [
+                    "5 – Strongly agree",
+                    "4 – Agree",
+                    "3 – Neutral",
+                    "2 – Disagree",
+                    "1 – Strongly disagree"
 
-        # Save to session state
-        st.session_state["Tone"] = tone_feedback
-        st.session_state["Change"] = change_feedback
+                ]
+            )
 
+            # 🔘 Likert 2 – Engagement
+            engage_rating = st.selectbox(
+                "I felt engaged by the AI conversation.",
+                [
+                    "5 – Strongly agree",
+                    "4 – Agree",
+                    "3 – Neutral",
+                    "2 – Disagree",
+                    "1 – Strongly disagree"
+                ]
+            )
 
-        # ✅ Store in session state for later use
-        st.session_state["Try"] = try_rating[0]
-        st.session_state["Engage"] = engage_rating[0]
-        st.session_state["UserType"] = user_type
+            # --- Open-ended tone reflection ---
+            tone_pref_label = {
+                "real_one": "Nicer",
+                "drill_sergeant": "Tougher"
+            }.get(st.session_state.get("tone_pref", ""), "[Unknown Tone]")
 
-        # ✅ Update log row with Try and Engage values
-        if st.button("Submit feedback and try again (different style/tone or student persona)"):
-            feedback_log = {
-                "StudentID": st.session_state.student_id,
-                "Timestamp": st.session_state.get("log_timestamp", datetime.now().isoformat()),  # ✅ re-use or fallback
-                "UserType": st.session_state["UserType"],
-                "Try": st.session_state["Try"],
-                "Engage": st.session_state["Engage"],
-                "Tone": st.session_state.get("tone_pref", ""),
-                "ToneQ": st.session_state.get("Tone", ""),
-                "ChangeQ": st.session_state.get("Change", "")
-            }
+            tone_feedback = st.text_area(
+                f"You chose the {tone_pref_label} tone. Did this match what you expected? What worked or didn’t work about how the AI spoke to you?"
+            )
 
-            add_chat_log_entry(feedback_log)
+            change_feedback = st.text_area(
+                "If you could change anything about how the AI responds, what would you change first? Why?"
+            )
 
-            # Send back to home screen
-            for k in [
-                "step", "student_id", "student", "goal_to_reflect",
-                "chat_history", "chat_turn_count", "chat_log_saved",
-                "Try", "Engage", "UserType", "Tone", "Change", "tone_pref", "log_timestamp"
-            ]:
-                st.session_state.pop(k, None)
-            st.rerun()
+            # Save to session state
+            st.session_state["Tone"] = tone_feedback
+            st.session_state["Change"] = change_feedback
+
+
+            # ✅ Store in session state for later use
+            st.session_state["Try"] = try_rating[0]
+            st.session_state["Engage"] = engage_rating[0]
+            st.session_state["UserType"] = user_type
+
+            # ✅ Update log row with Try and Engage values
+            if st.button("Submit feedback and try again (different style/tone or student persona)"):
+                feedback_log = {
+                    "StudentID": st.session_state.student_id,
+                    "Timestamp": st.session_state.get("log_timestamp", datetime.now().isoformat()),  # ✅ re-use or fallback
+                    "UserType": st.session_state["UserType"],
+                    "Try": st.session_state["Try"],
+                    "Engage": st.session_state["Engage"],
+                    "Tone": st.session_state.get("tone_pref", ""),
+                    "ToneQ": st.session_state.get("Tone", ""),
+                    "ChangeQ": st.session_state.get("Change", "")
+                }
 
-        elif st.button("Submit feedback and stop"):
-            feedback_log = {
-                "StudentID": st.session_state.student_id,
-                "Timestamp": st.session_state.get("log_timestamp", datetime.now().isoformat()),
-                "UserType": st.session_state["UserType"],               
-                "Try": st.session_state["Try"],
-                "Engage": st.session_state["Engage"],
-                "Tone": st.session_state.get("tone_pref", ""),
-                "ToneQ": st.session_state.get("Tone", ""),
-                "ChangeQ": st.session_state.get("Change", "")
-            }
+                add_chat_log_entry(feedback_log)
 
-            add_chat_log_entry(feedback_log)
+                # Send back to home screen with nothing left over from this persona run
+                session.reset("persona")
+                st.rerun()
 
-            st.markdown("### ✅ Thank you for your feedback!")
-            st.stop()
+            elif st.button("Submit feedback and stop"):
+                feedback_log = {
+                    "StudentID": st.session_state.student_id,
+                    "Timestamp": st.session_state.get("log_timestamp", datetime.now().isoformat()),
+                    "UserType": st.session_state["UserType"],               
+                    "Try": st.session_state["Try"],
+                    "Engage": st.session_state["Engage"],
+                    "Tone": st.session_state.get("tone_pref", ""),
+                    "ToneQ": st.session_state.get("Tone", ""),
+                    "ChangeQ": st.session_state.get("Change", "")
+                }
 
+                add_chat_log_entry(feedback_log)
 
+                st.markdown("### ✅ Thank you for your feedback!")
+                st.stop()
 
+        feedback_form()
 
 
 # --- STEP 3: Set new goal formally ---
-# elif st.session_state.step == "set_contribution_goal":
+# @st.cache_resource(ttl=3600)
+# def get_goal_recommender():
+#     from goal_recommender import build_recommender
+#     return build_recommender("sheets")
+
+# @step("set_contribution_goal")
+# def render_set_contribution_goal():
 #     st.header("Set a goal for next class")
 
 #     img = Image.open("assets/doyoutalk.jpg")
 #     st.image(img, use_container_width=True)
 #     st.markdown("*Use this flowchart to choose a goal, then select it from the drop down.*")
 
+#     # Goals that similar students moved to and then met go first (goal_recommender.py)
 #     goal_options = get_goal_text_list(cfg)
+#     try:
+#         reflection = st.session_state.get("latest_reflection", "")
+#         current_goal = st.session_state.get("goal_to_reflect", {}).get("text")
+#         recommended = [g for g, _, _ in get_goal_recommender().recommend(reflection, current_goal)] if reflection else []
+#     except Exception as e:
+#         print(f"[RECOMMENDER] Falling back to the static goal list: {e}")
+#         recommended = []
+#     goal_options = recommended + [g for g in goal_options if g not in recommended]
 #     final_goal = st.selectbox("Choose your goal:", goal_options)
 #     measure = st.text_area("What will it look like when you're succeeding?")
 
 #     if st.button("Set Goal"):
-#         # update_student_current_goal(
-#         #     student_id=st.session_state.student_id,
-#         #     new_goal=final_goal,
-#         #     new_success_measures=measure,
-#         #     set_date=str(date.today())
-#         # )
+#         # Students update and (for a first goal) the GoalHistory row go out as one request
+#         today = date.today().isoformat()  # Returns '2025-05-07' format
+#         student_fields = {
+#             "CurrentGoal": final_goal,
+#             "CurrentSuccessMeasures": measure,
+#             "CurrentGoalSetDate": today
+#         }
 
 #         # Check if this is the first goal ever
 #         history = get_goal_history_for_student(st.session_state.student_id)
+#         first_goal = None
 #         if len(history) == 0:
 #             # Log initial goal into GoalHistory
-#             from datetime import date
-#             today = date.today().isoformat()  # Returns '2025-05-07' format
-#             # add_goal_history_entry({
-#             #     "StudentID": st.session_state.student_id,
-#             #     "GoalSetDate": today,
-#             #     "Goal": final_goal,
-#             #     "SuccessMeasures": measure,
-#             #     "OutcomeReflection": "[first goal]",
-#             #     "GoalAchievement": "[first goal]",
-#             #     "BackgroundInfo": st.session_state.student.get("BackgroundInfo", "")
-#             # })
+#             first_goal = {
+#                 "GoalSetDate": today,
+#                 "Goal": final_goal,
+#                 "SuccessMeasures": measure,
+#                 "OutcomeReflection": "[first goal]",
+#                 "GoalAchievement": "[first goal]",
+#                 "BackgroundInfo": st.session_state.student.get("BackgroundInfo", "")
+#             }
+#         # commit_reflection(st.session_state.student_id, first_goal, student_fields)
 
 #         st.success("New goal saved.")
 #         st.session_state.step = "done"
 #         st.rerun()
 
 # # --- STEP 4: Wrap up ---
-# elif st.session_state.step == "done":
+# @step("done")
+# def render_done():
 #     st.success("You're all set for today. See you next time!")
 #     if st.button("Start Over"):
-#         for key in ["step", "student_id", "student", "background_info",
-#                     "current_warmup_prompt", "one_word_options", "selected_words"]:
-#             st.session_state.pop(key, None)
+#         session.reset("persona")
 #         st.rerun()
+
+
+# --- Run the current step ---
+# Full-script rerun wall time is logged per step, so before/after comparisons can be read off
+# real sessions. Fragment reruns (chat input, feedback form) skip this entirely; what they save
+# per edit is measured offline by benchmarks/rerun_bench.py. The session's size walks all of
+# its state, so it is only logged on the first rerun and every SIZE_SAMPLE_EVERY after that.
+SIZE_SAMPLE_EVERY = 20
+
+def record_rerun_time(step_name):
+    elapsed_ms = (time.perf_counter() - rerun_started) * 1000
+    timings = st.session_state.setdefault("rerun_timings", {}).setdefault(step_name, [])
+    timings.append(elapsed_ms)
+    del timings[:-50]
+    median_ms = sorted(timings)[len(timings) // 2]
+    reruns = st.session_state["rerun_count"] = st.session_state.get("rerun_count", 0) + 1
+    size = ""
+    if reruns % SIZE_SAMPLE_EVERY == 1:
+        total = session.total_bytes()
+        note_session_bytes(total)
+        size = f", session {total / 1024:.0f} KiB"
+    print(f"[RERUN] {step_name}: {elapsed_ms:.1f} ms (median of last {len(timings)}: {median_ms:.1f} ms{size})")
+    if recorder:
+        recorder.end_run(step_name, st.session_state.get("step"), elapsed_ms)
+
+current_step = st.session_state.step
+try:
+    handler = STEP_HANDLERS.get(current_step)
+    if handler:
+        handler()
+finally:
+    record_rerun_time(current_step)
@@ -0,0 +1,172 @@
+# transport.py
+# Shared HTTP connection pools for Google Sheets and OpenAI, and counters showing whether they
+# actually reuse connections.
+#
+# Both clients are created once per process (google_sheets.connect_to_sheets, llm.get_openai_client)
+# and go through pools sized for the expected number of concurrent sessions:
+#
+#   - gspread talks through a requests session. A TunedAdapter is mounted on it: a bigger
+#     urllib3 pool, so concurrent sessions don't each open (and then drop) their own
+#     connection, and idle connections are kept alive.
+#   - OpenAI and the async Sheets reader (sheets_async.py) use httpx clients with matching
+#     limits, a keep-alive expiry, and HTTP/2 when the h2 package is installed.
+#
+# Every request, new TCP connection and TLS handshake is counted per service. stats() reports
+# these with the reuse ratio (the share of requests that rode an existing connection).
+# benchmarks/transport_bench.py checks the numbers against a local HTTPS stand-in server.
+#
+#   EXPECTED_SESSIONS=60   # pool sizing; default 30 concurrent app sessions
+
+import os
+import threading
+
+EXPECTED_SESSIONS = int(os.environ.get("EXPECTED_SESSIONS", 30))
+KEEPALIVE_SECONDS = 60
+
+# Connections each service may hold open. Each session has at most one Sheets call in flight;
+# a first turn can have two OpenAI completions running at once (one per tone).
+POOL_SIZES = {
+    "sheets": max(10, EXPECTED_SESSIONS),
+    "openai": max(10, EXPECTED_SESSIONS * 2),
+}
+
+
+# --- Counters ---
+_stats = {}
+_stats_lock = threading.Lock()
+
+
+def _bump(service, key):
+    with _stats_lock:
+        counts = _stats.setdefault(service, {"requests": 0, "connections": 0, "tls_handshakes": 0})
+        counts[key] += 1
+
+
+def stats():
+    with _stats_lock:
+        report = {}
+        for service, counts in _stats.items():
+            requests = counts["requests"]
+            reuse = 1 - counts["connections"] / requests if requests else 0.0
+            report[service] = {**counts, "reuse_ratio": round(max(reuse, 0.0), 3)}
+        return report
+
+
+def reset_stats():
+    with _stats_lock:
+        _stats.clear()
+
+
+def log_stats():
+    for service, counts in stats().items():
+        print(f"[TRANSPORT] {service}: {counts['requests']} requests, {counts['connections']} connections, "
+              f"{counts['tls_handshakes']} TLS handshakes, reuse {counts['reuse_ratio']:.0%}")
+
+
+def pool_size(service):
+    return POOL_SIZES.get(service, max(10, EXPECTED_SESSIONS))
+
+
+# --- requests / urllib3 (gspread) ---
+def _counting_pool_classes(service):
+    from urllib3.connection import HTTPConnection, HTTPSConnection
+    from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+    class CountingHTTPConnection(HTTPConnection):
+        def connect(self):
+            super().connect()
+            _bump(service, "connections")
+
+    class CountingHTTPSConnection(HTTPSConnection):
+        def connect(self):
+            super().connect()  # TCP connect plus TLS handshake
+            _bump(service, "connections")
+            _bump(service, "tls_handshakes")
+
+    return {
+        "http": type("CountingHTTPConnectionPool", (HTTPConnectionPool,), {"ConnectionCls": CountingHTTPConnection}),
+        "https": type("CountingHTTPSConnectionPool", (HTTPSConnectionPool,), {"ConnectionCls": CountingHTTPSConnection}),
+    }
+
+
+def tuned_adapter(service):
+    from requests.adapters import HTTPAdapter
+
+    class TunedAdapter(HTTPAdapter):
+        def init_poolmanager(self, *args, **kwargs):
+            super().init_poolmanager(*args, **kwargs)
+            self.poolmanager.pool_classes_by_scheme = _counting_pool_classes(service)
+
+        def send(self, request, **kwargs):
+            _bump(service, "requests")
+            return super().send(request, **kwargs)
+
+    # pool_connections is the number of hosts kept; Sheets and OAuth are only a few
+    return TunedAdapter(pool_connections=4, pool_maxsize=pool_size(service))
+
+
+def mount_tuned_adapter(session, service):
+    adapter = tuned_adapter(service)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+# gspread 5 keeps its requests session on the client, gspread 6 on client.http_client
+def tune_gspread_client(client, service="sheets"):
+    session = getattr(getattr(client, "http_client", client), "session", None)
+    if session is None:
+        print("[TRANSPORT] gspread client has no requests session; default pool kept")
+        return client
+    mount_tuned_adapter(session, service)
+    return client
+
+
+# --- httpx (OpenAI, sheets_async) ---
+def http2_available():
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def _trace(service, name):
+    if name == "connection.connect_tcp.complete":
+        _bump(service, "connections")
+    elif name == "connection.start_tls.complete":
+        _bump(service, "tls_handshakes")
+
+
+# Keyword arguments for httpx.Client / httpx.AsyncClient (or openai.DefaultHttpxClient)
+def httpx_options(service, asynchronous=False):
+    import httpx
+
+    size = pool_size(service)
+    if asynchronous:
+        async def trace(name, info):
+            _trace(service, name)
+
+        async def on_request(request):
+            _bump(service, "requests")
+            request.extensions["trace"] = trace
+    else:
+        def trace(name, info):
+            _trace(service, name)
+
+        def on_request(request):
+            _bump(service, "requests")
+            request.extensions["trace"] = trace
+
+    return {
+        "limits": httpx.Limits(max_connections=size, max_keepalive_connections=size,
+                               keepalive_expiry=KEEPALIVE_SECONDS),
+        "http2": http2_available(),
+        "event_hooks": {"request": [on_request]},
+    }
+
+
+def httpx_client(service, asynchronous=False, **kwargs):
+    import httpx
+    client_cls = httpx.AsyncClient if asynchronous else httpx.Client
+    return client_cls(**httpx_options(service, asynchronous), **kwargs)
@@ -0,0 +1,86 @@
+# warmup.py
+# Warmup / check-in prompt selection.
+#
+# Each student gets a seeded rotation through the humanizing prompts. The seed is StudentID
+# plus the date, so a given day's order is reproducible. Prompts the student answered in their
+# last few sessions go to the back of the rotation; that's the only history kept, in a small
+# JSON index. The prompt and one-word options for the first screen and the next N refreshes
+# are all planned when the warmup step starts, so "Refresh Options" only advances an index.
+
+import json
+import os
+import random
+import threading
+from dataclasses import dataclass
+from datetime import date
+
+from records import normalize_id
+
+INDEX_PATH = ".warmup_recent.json"
+
+
+@dataclass(frozen=True, slots=True)
+class WarmupOption:
+    prompt: str
+    words: tuple
+
+
+# --- Recently answered prompts, per student ---
+class RecentPromptIndex:
+    def __init__(self, path=INDEX_PATH, window=3):
+        self.path = path
+        self.window = window
+        self._lock = threading.Lock()
+        try:
+            with open(path, "r") as f:
+                self._recent = json.load(f)
+        except (OSError, ValueError):
+            self._recent = {}
+
+    def recent(self, student_id):
+        with self._lock:
+            return list(self._recent.get(normalize_id(student_id), []))
+
+    def record(self, student_id, prompt):
+        key = normalize_id(student_id)
+        with self._lock:
+            prompts = [p for p in self._recent.get(key, []) if p != prompt] + [prompt]
+            self._recent[key] = prompts[-self.window:]
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(self._recent, f)
+            os.replace(tmp_path, self.path)
+
+
+class WarmupEngine:
+    def __init__(self, cfg, refreshes=5, words_per_option=5, index=None):
+        warmups = cfg["warmup_prompts"]
+        self.prompts = list(warmups.get("humanizing", []))
+        self.words = list(warmups.get("one_word", []))
+        self.word_rank = {word: i for i, word in enumerate(self.words)}
+        self.refreshes = refreshes
+        self.words_per_option = min(words_per_option, len(self.words))
+        self.index = index or RecentPromptIndex()
+
+    # Options for the first screen plus every planned refresh
+    def plan(self, student_id, day=None):
+        rng = random.Random(f"{normalize_id(student_id)}|{(day or date.today()).isoformat()}")
+        order = rng.sample(self.prompts, len(self.prompts))
+        recent = set(self.index.recent(student_id))
+        rotation = [p for p in order if p not in recent] + [p for p in order if p in recent]
+
+        return [
+            WarmupOption(
+                prompt=rotation[n % len(rotation)] if rotation else "",
+                words=tuple(rng.sample(self.words, self.words_per_option)),
+            )
+            for n in range(self.refreshes + 1)
+        ]
+
+    def record_answered(self, student_id, option):
+        if option.prompt:
+            self.index.record(student_id, option.prompt)
+
+    # Selected words shown in goal-bank order, whichever refresh they were picked on
+    def ordered(self, selected_words):
+        return sorted(selected_words, key=lambda w: self.word_rank.get(w, len(self.word_rank)))